@@ -0,0 +1,69 @@
+"""
+bench_frame_store.py
+--------------------
+Benchmark rendering the map frames of a synthetic forecast post of every lake.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Local imports
+from surfcast import MAP_FILES
+from surfcast.data.noaa_map_file import NOAAMapFile
+from surfcast.data.frame_store import FrameStore, get_palette
+
+
+class SyntheticLakePost(object):
+
+    """Lake post with random wave heights at every grid point and hour of a map file."""
+
+    def __init__(self, map_name, map_data, hours):
+        self.lake = map_name.split('.')[0].rstrip('0123456789km')
+        self.datetime = '2020-02-17 00:00:00'
+        self.map_name = map_name
+        grid_numbers = map_data['sequence_number'].values
+        self.grid_data = pd.DataFrame({
+            'datetime': np.repeat(pd.date_range(self.datetime, periods=hours, freq='60min').values, len(grid_numbers)),
+            'grid_number': np.tile(grid_numbers, hours),
+            'wave_height': np.random.RandomState(0).uniform(0, 4, hours * len(grid_numbers)).astype(np.float32)})
+
+
+def main(hours):
+    # Map tables
+    connection = sqlite3.connect(':memory:')
+    posts = list()
+    for map_name in MAP_FILES:
+        map_data = NOAAMapFile(filename=map_name).map_data
+        map_data.to_sql(name=map_name.split('.')[0], con=connection, index=False)
+        posts.append(SyntheticLakePost(map_name=map_name, map_data=map_data, hours=hours))
+
+    # Load colour maps before timing
+    get_palette(cmap='jet')
+
+    directory = tempfile.mkdtemp(prefix='surfcast_frames_')
+    try:
+        frame_store = FrameStore(connection=connection, directory=directory)
+        start_time = time.time()
+        for post in posts:
+            frame_store.render(post=post, db_type='fcast')
+        render_time = time.time() - start_time
+
+        print('{} lakes, {} hours: {} frames'.format(len(posts), hours, len(posts) * hours))
+        print('render: {:.2f} s, {:.1f} ms/frame'.format(render_time, render_time / (len(posts) * hours) * 1e3))
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hours', type=int, default=120)
+    args = parser.parse_args()
+    main(hours=args.hours)
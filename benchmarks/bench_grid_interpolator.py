@@ -0,0 +1,55 @@
+"""
+bench_grid_interpolator.py
+--------------------------
+Benchmark bilinear interpolation of a synthetic forecast at random coordinates on each lake.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import time
+import argparse
+import numpy as np
+
+# Local imports
+from surfcast import MAP_FILES
+from surfcast.data.noaa_map_file import NOAAMapFile
+from surfcast.data.grid_interpolator import GridInterpolator
+
+
+def main(points, hours):
+    random_state = np.random.RandomState(0)
+    for map_name in MAP_FILES:
+        map_data = NOAAMapFile(filename=map_name).map_data
+
+        # Build lattice
+        start_time = time.time()
+        grid_interpolator = GridInterpolator.from_map_data(map_name=map_name, map_data=map_data)
+        build_time = time.time() - start_time
+
+        # Random coordinates around grid points
+        index = random_state.randint(0, map_data.shape[0], points)
+        lat = map_data['lat'].values[index] + random_state.normal(0, 0.02, points)
+        lon = map_data['lon'].values[index] + random_state.normal(0, 0.02, points)
+
+        # Precompute weights
+        start_time = time.time()
+        weights = grid_interpolator.weights(lat=lat, lon=lon)
+        weights_time = time.time() - start_time
+
+        # Interpolate every hour
+        values = random_state.uniform(0, 4, (hours, map_data.shape[0]))
+        start_time = time.time()
+        weights.interpolate(values=values)
+        interpolate_time = time.time() - start_time
+
+        print('{}: {} grid points, {} points, {} hours'.format(map_name, map_data.shape[0], points, hours))
+        print('  lattice: {:.1f} ms, weights: {:.1f} ms, interpolate: {:.1f} ms'.format(
+            build_time * 1e3, weights_time * 1e3, interpolate_time * 1e3))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--hours', type=int, default=120)
+    args = parser.parse_args()
+    main(points=args.points, hours=args.hours)
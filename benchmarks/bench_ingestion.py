@@ -0,0 +1,227 @@
+"""
+bench_ingestion.py
+------------------
+Benchmark the ingestion hot path (NOAADB, NOAAForecastFile, NOAALakePost merge and SurfcastDB writes) on synthetic
+NOAA files served from a local server, reporting throughput and peak memory against saved regression baselines.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import tracemalloc
+
+# Local imports
+from surfcast.data import noaa_db
+from surfcast.data.noaa_db import NOAADB
+from surfcast.data.cube_store import CubeStore
+from surfcast.data.surfcast_db import SurfcastDB
+from surfcast.data.noaa_fetcher import NOAAFetcher, set_fetcher
+from surfcast.data.noaa_forecast_file import NOAAForecastFile
+from surfcast.data.noaa_forecast_post import NOAALakePost
+from local_noaa_server import LocalNOAAServer
+from synthetic_noaa import write_archive
+
+# Set regression baseline file
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baseline.json')
+
+
+class Fixture(object):
+
+    """Synthetic NCAST and FCAST archive served from a local server, plus the files of the first NCAST post."""
+
+    def __init__(self, directory, server, posts, hours, grid_points):
+
+        # Set parameters
+        self.directory = directory
+        self.server = server
+
+        # Set attributes
+        self.files = write_archive(directory=directory, posts=posts, hours=hours, grid_points=grid_points,
+                                   url=server.url)
+        self.post_df = self.files['NCAST'][self.files['NCAST']['file_datetime'] ==
+                                           self.files['NCAST']['file_datetime'].iloc[0]]
+        self.date_time = self.post_df['file_datetime'].iloc[0]
+        self.texts = {filename: read_text(os.path.join(directory, 'NCAST', filename))
+                      for filename in self.post_df['filename']}
+        self._noaa_files = None
+
+    @property
+    def noaa_files(self):
+        """Parsed files of the post by lake."""
+        if self._noaa_files is None:
+            self._noaa_files = {lake: [parse_file(file=file, text=self.texts[file['filename']])
+                                       for _, file in lake_df.iterrows()]
+                                for lake, lake_df in self.post_df.groupby('lake')}
+
+        return self._noaa_files
+
+    def lake_posts(self):
+        """Merge the post into lake posts."""
+        return [NOAALakePost(df=self.post_df[self.post_df['lake'] == lake], datetime=self.date_time, db_type='ncast',
+                             lake=lake, noaa_files=noaa_files) for lake, noaa_files in self.noaa_files.items()]
+
+
+def read_text(path):
+    """Read a text file."""
+    with open(path) as file:
+        return file.read()
+
+
+def parse_file(file, text):
+    """Parse a file of a files DataFrame from text."""
+    return NOAAForecastFile(url=file['url'], filename=file['filename'], filetype=file['filetype'], lake=file['lake'],
+                            text=text, db_type='ncast')
+
+
+def bench_noaadb(fixture):
+    """List and decode both directory listings (high-water marks are empty so the CSV files are not written)."""
+    noaa = NOAADB(process=True, high_water_marks=dict())
+
+    return noaa.ncast_db.shape[0] + noaa.fcast_db.shape[0], 'files'
+
+
+def bench_forecast_file(fixture):
+    """Parse every file of a post from text."""
+    return sum(parse_file(file=file, text=fixture.texts[file['filename']]).grid_data.shape[0]
+               for _, file in fixture.post_df.iterrows()), 'rows'
+
+
+def bench_lake_post_merge(fixture):
+    """Merge the parsed files of each lake of a post."""
+    return sum(post.grid_data.shape[0] for post in fixture.lake_posts()), 'rows'
+
+
+def bench_surfcast_db_write(fixture, storage):
+    """Push every lake post of a post into a new database."""
+    posts = fixture.lake_posts()
+    with tempfile.TemporaryDirectory() as directory:
+
+        # An existing (empty) database file skips downloading map files
+        path = os.path.join(directory, 'surfcast_db.sqlite3')
+        sqlite3.connect(path).close()
+        surfcast_db = SurfcastDB(storage=storage, path=path)
+        surfcast_db.cube_store = CubeStore(connection=surfcast_db.connection, directory=directory)
+
+        for post in posts:
+            surfcast_db._push_lake_post(post=post, db_type='ncast')
+        surfcast_db.connection.close()
+
+    return sum(post.grid_data.shape[0] for post in posts), 'rows'
+
+
+CASES = {'noaadb': bench_noaadb,
+         'forecast_file': bench_forecast_file,
+         'lake_post_merge': bench_lake_post_merge,
+         'surfcast_db_write_rows': lambda fixture: bench_surfcast_db_write(fixture=fixture, storage='rows'),
+         'surfcast_db_write_cube': lambda fixture: bench_surfcast_db_write(fixture=fixture, storage='cube')}
+
+
+def measure(case, fixture, repeat):
+    """Time the best of repeat runs, then measure peak traced memory in a separate run."""
+    times = list()
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        count, unit = case(fixture)
+        times.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    case(fixture)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'seconds': min(times), 'count': count, 'unit': unit, 'throughput': count / min(times),
+            'peak_memory': peak_memory}
+
+
+def compare(results, baseline, tolerance):
+    """Get the cases whose throughput dropped or peak memory grew by more than tolerance against the baseline."""
+    regressions = list()
+    for name, result in results.items():
+        if not has_baseline(name=name, result=result, baseline=baseline):
+            continue
+        if result['throughput'] < baseline[name]['throughput'] * (1. - tolerance):
+            regressions.append('{}: throughput {:,.0f} < baseline {:,.0f} {}/s'.format(
+                name, result['throughput'], baseline[name]['throughput'], result['unit']))
+        if result['peak_memory'] > baseline[name]['peak_memory'] * (1. + tolerance):
+            regressions.append('{}: peak memory {:.1f} > baseline {:.1f} MB'.format(
+                name, result['peak_memory'] / 1024 ** 2, baseline[name]['peak_memory'] / 1024 ** 2))
+
+    return regressions
+
+
+def has_baseline(name, result, baseline):
+    """Check if the baseline holds a case run with the same posts, hours and grid points."""
+    return name in baseline and baseline[name].get('config') == result['config']
+
+
+def main(cases, posts, hours, grid_points, repeat, tolerance, save_baseline, baseline_path):
+    # Baseline
+    baseline = dict()
+    if os.path.isfile(baseline_path):
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+    elif not save_baseline:
+        print('No baseline at {}, run with --save-baseline to create one.'.format(baseline_path))
+        return 2
+
+    # Run cases without the raw file cache against the local server
+    config = {'posts': posts, 'hours': hours, 'grid_points': grid_points}
+    results = dict()
+    set_fetcher(NOAAFetcher())
+    with tempfile.TemporaryDirectory() as directory:
+        with LocalNOAAServer(directory=directory) as server:
+            noaa_db.NOAA_URL = server.url
+            fixture = Fixture(directory=directory, server=server, posts=posts, hours=hours, grid_points=grid_points)
+            for name in cases:
+                results[name] = measure(case=CASES[name], fixture=fixture, repeat=repeat)
+                results[name]['config'] = config
+
+    # Report
+    print('\n{} posts, {} hours, {} grid points'.format(posts, hours, grid_points or 'all'))
+    print('{:<24} {:>10} {:>18} {:>14} {:>10}'.format('case', 'seconds', 'throughput', 'peak memory', 'baseline'))
+    for name, result in results.items():
+        change = '-'
+        if has_baseline(name=name, result=result, baseline=baseline):
+            change = '{:+.0%}'.format(result['throughput'] / baseline[name]['throughput'] - 1.)
+        print('{:<24} {:>10.3f} {:>12,.0f} {:>5} {:>11.1f} MB {:>10}'.format(
+            name, result['seconds'], result['throughput'], result['unit'] + '/s', result['peak_memory'] / 1024 ** 2,
+            change))
+
+    # Save or check baseline
+    if save_baseline:
+        baseline.update(results)
+        with open(baseline_path, 'w') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+        print('Baseline saved to {}'.format(baseline_path))
+        return 0
+    missing = [name for name, result in results.items() if not has_baseline(name=name, result=result,
+                                                                            baseline=baseline)]
+    for name in missing:
+        print('MISSING BASELINE {}: no baseline run with {}'.format(name, config))
+    regressions = compare(results=results, baseline=baseline, tolerance=tolerance)
+    for regression in regressions:
+        print('REGRESSION {}'.format(regression))
+
+    return 1 if len(regressions) > 0 or len(missing) > 0 else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--posts', type=int, default=4)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--grid-points', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    args = parser.parse_args()
+    sys.exit(main(cases=args.cases, posts=args.posts, hours=args.hours, grid_points=args.grid_points,
+                  repeat=args.repeat, tolerance=args.tolerance, save_baseline=args.save_baseline,
+                  baseline_path=args.baseline))
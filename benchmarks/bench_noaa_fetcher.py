@@ -0,0 +1,66 @@
+"""
+bench_noaa_fetcher.py
+---------------------
+Benchmark sequential downloads against NOAAFetcher concurrent downloads of a forecast post from a local server.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import time
+import argparse
+import tempfile
+import requests
+
+# Local imports
+from surfcast import LAKES, EXTENSIONS
+from surfcast.data.noaa_fetcher import NOAAFetcher
+from local_noaa_server import LocalNOAAServer
+from bench_noaa_forecast_file import generate_text_file
+
+
+def write_post(directory, hours):
+    """Write one fixture file per lake and extension."""
+    text = '\n'.join(generate_text_file(map_name='ontario5km.map', hours=hours))
+    filenames = list()
+    for lake in LAKES:
+        for extension in EXTENSIONS:
+            filename = '{}202004800.0.{}'.format(lake, extension)
+            with open(os.path.join(directory, filename), 'w') as file:
+                file.write(text)
+            filenames.append(filename)
+
+    return filenames
+
+
+def main(hours, latency, max_per_host):
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = write_post(directory=directory, hours=hours)
+        with LocalNOAAServer(directory=directory, latency=latency) as server:
+            urls = [server.url + filename for filename in filenames]
+
+            # Sequential, one connection per request
+            start_time = time.time()
+            sequential = {url: requests.get(url).text for url in urls}
+            sequential_time = time.time() - start_time
+
+            # Concurrent, pooled connections
+            fetcher = NOAAFetcher(max_per_host=max_per_host)
+            start_time = time.time()
+            concurrent = fetcher.fetch_all(urls=urls)
+            concurrent_time = time.time() - start_time
+            fetcher.close()
+
+    assert sequential == concurrent
+    print('{} files, {} s latency per request'.format(len(urls), latency))
+    print('sequential: {:.2f} s'.format(sequential_time))
+    print('concurrent: {:.2f} s ({} per host)'.format(concurrent_time, max_per_host))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--max-per-host', type=int, default=8)
+    args = parser.parse_args()
+    main(hours=args.hours, latency=args.latency, max_per_host=args.max_per_host)
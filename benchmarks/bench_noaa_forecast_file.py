@@ -0,0 +1,99 @@
+"""
+bench_noaa_forecast_file.py
+---------------------------
+Benchmark NOAAForecastFile grid data parsing against the original row by row parser.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+# Local imports
+from surfcast import GRID_FILES_DIR, FILE_ATTRIBUTES
+from surfcast.data.noaa_forecast_file import NOAAForecastFile
+
+
+class LocalNOAAForecastFile(NOAAForecastFile):
+
+    """NOAAForecastFile reading from an in memory text file instead of the NOAA server."""
+
+    def __init__(self, text_file, **kwargs):
+        self._local_text_file = text_file
+        super(LocalNOAAForecastFile, self).__init__(url='', **kwargs)
+
+    def _download_file(self):
+        return self._local_text_file
+
+
+def generate_text_file(map_name, hours):
+    """Generate a synthetic WAVES file for every grid point of a map file."""
+    grid_numbers = np.loadtxt(os.path.join(GRID_FILES_DIR, map_name), usecols=0, dtype=np.int32)
+    random_state = np.random.RandomState(0)
+    text_file = list()
+    for hour in range(hours):
+        date_time = datetime(2020, 2, 17) + timedelta(hours=hour)
+        text_file.append('{}     /glcfs/bathy/{}.dat    WAVES    {}'.format(
+            date_time.strftime('%Y %j %H'), map_name.split('.')[0], len(grid_numbers)))
+        heights = random_state.uniform(0, 4, len(grid_numbers))
+        directions = random_state.randint(0, 360, len(grid_numbers))
+        periods = random_state.uniform(0, 9, len(grid_numbers))
+        text_file.extend('{:6d} {:7.3f} {:4d} {:4.1f}'.format(*row)
+                         for row in zip(grid_numbers, heights, directions, periods))
+    text_file.append('')
+
+    return text_file
+
+
+def legacy_grid_data(text_file, filetype):
+    """Original row by row parser."""
+    datetime_current = None
+    grid_data = list()
+    for row in text_file:
+        if 'dat' in row:
+            row = row.split()
+            datetime_current = datetime.strptime(row[0] + row[1] + row[2], "%Y%j%H")
+        elif 'dat' not in row and len(row.split()) != 0:
+            row = row.split()
+            row_dict = {'datetime': datetime_current, 'grid_number': np.int16(row[0])}
+            row_dict.update({key: val for key, val in zip(FILE_ATTRIBUTES[filetype], row[1:])})
+            grid_data.append(row_dict)
+
+    return pd.DataFrame(grid_data)
+
+
+def main(map_name, hours):
+    text_file = generate_text_file(map_name=map_name, hours=hours)
+
+    # Original parser
+    start_time = time.time()
+    legacy = legacy_grid_data(text_file=text_file, filetype='WAVES')
+    legacy_time = time.time() - start_time
+
+    # Block parser
+    start_time = time.time()
+    noaa_file = LocalNOAAForecastFile(text_file=text_file, filename=map_name, filetype='WAVES', lake='huron')
+    block_time = time.time() - start_time
+
+    # Check outputs match
+    for attribute in FILE_ATTRIBUTES['WAVES']:
+        legacy[attribute] = legacy[attribute].astype(np.float32)
+    pd.testing.assert_frame_equal(legacy, noaa_file.grid_data, check_dtype=False)
+
+    rows = noaa_file.grid_data.shape[0]
+    print('{}: {} hours, {} rows'.format(map_name, hours, rows))
+    print('legacy parser: {:.2f} s, {:,.0f} rows/sec'.format(legacy_time, rows / legacy_time))
+    print('block parser:  {:.2f} s, {:,.0f} rows/sec'.format(block_time, rows / block_time))
+    print('speedup: {:.1f}x'.format(legacy_time / block_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--map-name', default='huron2km.map')
+    parser.add_argument('--hours', type=int, default=24)
+    args = parser.parse_args()
+    main(map_name=args.map_name, hours=args.hours)
@@ -0,0 +1,82 @@
+"""
+bench_post_scheduling.py
+------------------------
+Benchmark per-lake against per-file, largest-first scheduling of a synthetic forecast post.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import time
+import argparse
+import numpy as np
+from joblib import Parallel, delayed, cpu_count
+from datetime import datetime, timedelta
+
+# Local imports
+from surfcast import MAP_FILES, EXTENSIONS, FILE_ATTRIBUTES
+from surfcast.data.noaa_forecast_file import NOAAForecastFile
+from bench_noaa_forecast_file import GRID_FILES_DIR
+
+
+def generate_text(map_name, filetype, hours):
+    """Generate a synthetic NOAA file for every grid point of a map file."""
+    grid_numbers = np.loadtxt(os.path.join(GRID_FILES_DIR, map_name), usecols=0, dtype=np.int32)
+    values = np.random.RandomState(0).uniform(0, 5, (len(grid_numbers), len(FILE_ATTRIBUTES[filetype])))
+    block = '\n'.join(' '.join(['{:6d}'.format(grid_number)] + ['{:7.3f}'.format(value) for value in row])
+                      for grid_number, row in zip(grid_numbers, values))
+    dat_name = map_name.split('.')[0].replace('superior', 'sup')
+    headers = ['{}     /glcfs/bathy/{}.dat    {}    {}'.format(
+        (datetime(2020, 2, 17) + timedelta(hours=hour)).strftime('%Y %j %H'), dat_name, filetype, len(grid_numbers))
+        for hour in range(hours)]
+
+    return '\n'.join(header + '\n' + block for header in headers) + '\n'
+
+
+def parse_files(files):
+    """Parse a list of (lake, filetype, text) files, returning the busy time in seconds."""
+    start_time = time.time()
+    for lake, filetype, text in files:
+        NOAAForecastFile(url='', filename='', filetype=filetype, lake=lake, text=text)
+
+    return time.time() - start_time
+
+
+def run(tasks, n_jobs):
+    """Run parse tasks in order, returning wall-clock time and core utilisation."""
+    start_time = time.time()
+    busy_times = Parallel(n_jobs=n_jobs, batch_size=1, pre_dispatch='all')(delayed(parse_files)(files)
+                                                                             for files in tasks)
+    wall_time = time.time() - start_time
+
+    return wall_time, sum(busy_times) / (wall_time * n_jobs)
+
+
+def main(hours, n_jobs):
+    # Synthetic post
+    files = [(map_name.split('.')[0].rstrip('0123456789km'), filetype,
+              generate_text(map_name=map_name, filetype=filetype, hours=hours))
+             for map_name in MAP_FILES for filetype in EXTENSIONS.values()]
+
+    # Start workers before timing
+    Parallel(n_jobs=n_jobs)(delayed(time.sleep)(0) for _ in range(n_jobs))
+
+    # One task per lake
+    lake_tasks = [[file for file in files if file[0] == lake] for lake in sorted(set(file[0] for file in files))]
+    lake_time, lake_utilisation = run(tasks=lake_tasks, n_jobs=n_jobs)
+
+    # One task per file, largest first
+    file_tasks = [[file] for file in sorted(files, key=lambda file: len(file[2]), reverse=True)]
+    file_time, file_utilisation = run(tasks=file_tasks, n_jobs=n_jobs)
+
+    print('{} files, {} hours, {} workers'.format(len(files), hours, n_jobs))
+    print('per-lake tasks:           {:.2f} s, {:.0%} core utilisation'.format(lake_time, lake_utilisation))
+    print('per-file, largest first:  {:.2f} s, {:.0%} core utilisation'.format(file_time, file_utilisation))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--n-jobs', type=int, default=cpu_count())
+    args = parser.parse_args()
+    main(hours=args.hours, n_jobs=args.n_jobs)
@@ -0,0 +1,75 @@
+"""
+local_noaa_server.py
+--------------------
+This module provide a local HTTP stand-in for the NOAA gridded fields server that serves fixture files from disk.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import time
+import threading
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _FixtureRequestHandler(SimpleHTTPRequestHandler):
+
+    """Serve files from a directory after an optional fixed latency."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, *args, latency=0., **kwargs):
+        self.latency = latency
+        super(_FixtureRequestHandler, self).__init__(*args, **kwargs)
+
+    def send_head(self):
+        time.sleep(self.latency)
+        return super(_FixtureRequestHandler, self).send_head()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalNOAAServer(object):
+
+    """
+    Serve a fixture directory over HTTP on localhost.
+
+    Lay out the directory like the NOAA server (e.g. NCAST/, FCAST/, map_files/) and point the 'url' column of a
+    files DataFrame, NOAA_URL or MAP_URL at LocalNOAAServer.url.
+    """
+
+    def __init__(self, directory, port=0, latency=0.):
+
+        # Set parameters
+        self.directory = directory
+        self.latency = latency
+
+        # Set attributes
+        handler = partial(_FixtureRequestHandler, directory=self.directory, latency=self.latency)
+        self.server = _ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+        self.thread = None
+
+    def start(self):
+        """Serve requests from a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        """Stop serving requests."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,104 @@
+"""
+synthetic_noaa.py
+-----------------
+This module provide methods for generating realistic NOAA gridded field files from the archived map files.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import io
+import os
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from datetime import datetime, timedelta
+
+# Local imports
+from surfcast import MAP_FILES, LAKES, EXTENSIONS
+from bench_noaa_forecast_file import GRID_FILES_DIR
+
+# First forecast hour of generated posts
+START = datetime(2020, 2, 17)
+
+# Hours between consecutive posts
+POST_INTERVALS = {'NCAST': 6, 'FCAST': 12}
+
+# Columns after the grid number of each NOAA file extension, as (name, low, high, text format), written out here
+# rather than taken from FILE_ATTRIBUTES so that the synthetic files follow NOAA's layout and not the parser's
+FILE_LAYOUTS = {'wav': [('wave_height', 0., 4., '%7.3f'), ('wave_direction', 0., 360., '%4d'),
+                        ('wave_period', 0., 9., '%4.1f')],
+                'wnd': [('wind_speed', 0., 20., '%6.2f'), ('wind_direction', 0., 360., '%4d')],
+                'cur': [('current_speed', 0., 1., '%6.3f'), ('current_direction', 0., 360., '%4d')],
+                'swt': [('surface_temperature', 0., 25., '%6.2f')],
+                'ice': [('ice_concentration', 0., 1., '%5.2f'), ('ice_thickness', 0., 1.5, '%5.2f'),
+                        ('ice_speed', 0., 0.5, '%6.3f'), ('ice_direction', 0., 360., '%4d')]}
+
+
+@lru_cache(maxsize=None)
+def load_grid_numbers(map_name):
+    """Load the grid numbers (sequence numbers) of an archived map file, e.g. superior10km.map or sb-200m_all.map."""
+    return np.loadtxt(os.path.join(GRID_FILES_DIR, map_name), usecols=0, dtype=np.int32)
+
+
+def get_grid_numbers(map_name, grid_points=None):
+    """Get the grid numbers of a synthetic file.
+
+    By default every grid point of the map file is used. grid_points keeps the first grid_points of the map, or
+    extends the map with further consecutive grid numbers if it has fewer.
+    """
+    grid_numbers = load_grid_numbers(map_name=map_name)
+    if grid_points is None:
+        return grid_numbers
+    if grid_points <= len(grid_numbers):
+        return grid_numbers[:grid_points]
+
+    return np.arange(1, grid_points + 1, dtype=np.int32)
+
+
+def generate_file(map_name, extension, hours, grid_points=None, start=START, seed=0):
+    """Generate the text of a NOAA gridded field file (wav, wnd, ...) with one hour block per forecast hour."""
+    grid_numbers = get_grid_numbers(map_name=map_name, grid_points=grid_points)
+    layout = FILE_LAYOUTS[extension]
+    random_state = np.random.RandomState(seed)
+    formats = ['%6d'] + [text_format for _, _, _, text_format in layout]
+    dat_name = map_name.split('.')[0].split('_')[0].replace('superior', 'sup')
+
+    text = io.StringIO()
+    for hour in range(hours):
+        date_time = start + timedelta(hours=hour)
+        text.write('{}     /glcfs/bathy/{}.dat    {}    {}\n'.format(
+            date_time.strftime('%Y %j %H'), dat_name, EXTENSIONS[extension], len(grid_numbers)))
+        values = [random_state.uniform(low, high, len(grid_numbers)) for _, low, high, _ in layout]
+        np.savetxt(text, np.column_stack([grid_numbers] + values), fmt=formats)
+
+    return text.getvalue()
+
+
+def write_post(directory, db_type, date_time, hours, grid_points=None, map_files=MAP_FILES, url=''):
+    """Write one file per lake and extension of a post to {directory}/{db_type}/.
+
+    Returns a files DataFrame (url, filename, extension, filetype, lake, file_datetime, forecast) of the post.
+    """
+    os.makedirs(os.path.join(directory, db_type), exist_ok=True)
+    rows = list()
+    for letter, lake in LAKES.items():
+        map_name = [map_name for map_name in map_files if map_name.startswith(lake)][0]
+        for extension, filetype in EXTENSIONS.items():
+            filename = '{}{}.0.{}'.format(letter, date_time.strftime('%Y%j%H'), extension)
+            with open(os.path.join(directory, db_type, filename), 'w') as file:
+                file.write(generate_file(map_name=map_name, extension=extension, hours=hours, grid_points=grid_points,
+                                         start=date_time, seed=len(rows)))
+            rows.append({'url': '{}{}/'.format(url, db_type), 'filename': filename, 'extension': extension,
+                         'filetype': filetype, 'lake': lake, 'file_datetime': str(pd.Timestamp(date_time, tz='UTC')),
+                         'forecast': db_type})
+
+    return pd.DataFrame(rows)
+
+
+def write_archive(directory, posts, hours, grid_points=None, map_files=MAP_FILES, url=''):
+    """Write posts consecutive NCAST and FCAST posts, returning a files DataFrame per db_type."""
+    return {db_type: pd.concat([write_post(directory=directory, db_type=db_type,
+                                           date_time=START + timedelta(hours=post * interval), hours=hours,
+                                           grid_points=grid_points, map_files=map_files, url=url)
+                                for post in range(posts)], ignore_index=True)
+            for db_type, interval in POST_INTERVALS.items()}
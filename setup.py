@@ -1,5 +1,5 @@
 """Setup for Surfcast"""
-from setuptools import setup
+from setuptools import setup, find_packages
 
 setup(
     name='surfcast',
@@ -9,6 +9,7 @@ setup(
     author='Sebastian D. Goodfellow, Ph.D.',
     license='MIT',
     keywords='surfing',
-    package_dir={'': 'surfcast'},
+    packages=find_packages(include=['surfcast', 'surfcast.*']),
+    entry_points={'console_scripts': ['surfcast = surfcast.cli:main']},
     zip_safe=False
 )
@@ -13,14 +13,24 @@ WORKING_DIR = (
 # Set data directory
 DATA_DIR = os.path.join(WORKING_DIR, 'data')
 
+# Set local map file directory
+GRID_FILES_DIR = os.path.join(WORKING_DIR, 'archive', 'GetData', 'GridFiles')
+
+# Set parsed map file directory
+MAP_CACHE_DIR = os.path.join(DATA_DIR, 'map_cache')
+
+# Set raw NOAA file cache directory and size limit (bytes)
+CACHE_DIR = os.path.join(DATA_DIR, 'raw_cache')
+CACHE_MAX_BYTES = 10 * 1024 ** 3
+
 # File types of interest [wave, wind, surface current, surface temperature, ice]
 EXTENSIONS = {'wav': 'WAVES', 'wnd': 'WINDS', 'cur': 'SURFACE CURRENTS', 'swt': 'SURFACE TEMPS', 'ice': 'ICE PARAMS'}
 
-# File attributes
+# File attributes (columns after the grid number of each file type, listed in grid data table column order)
 FILE_ATTRIBUTES = {'WAVES': ['wave_height', 'wave_direction', 'wave_period'],
                    'WINDS': ['wind_speed', 'wind_direction'],
-                   'SURFACE CURRENTS': ['surface_temperature'],
-                   'SURFACE TEMPS': ['current_speed', 'current_direction'],
+                   'SURFACE TEMPS': ['surface_temperature'],
+                   'SURFACE CURRENTS': ['current_speed', 'current_direction'],
                    'ICE PARAMS': ['ice_concentration', 'ice_thickness', 'ice_speed', 'ice_direction']}
 
 # Map files
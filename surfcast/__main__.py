@@ -0,0 +1,10 @@
+"""Run the surfcast command line interface with python -m surfcast."""
+
+# 3rd party imports
+import sys
+
+# Local imports
+from surfcast.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+cli.py
+------
+This module provide the surfcast command line interface.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+
+Subcommands import their modules when they run, so that e.g. 'surfcast cache-info' starts without loading pandas,
+requests, joblib or scipy.
+"""
+
+# 3rd party imports
+import os
+import sys
+import argparse
+
+# Local imports
+from surfcast import CACHE_DIR, LAKES
+
+
+def refresh_files(args):
+    """Update the NCAST and FCAST files tables from the NOAA directory listings."""
+    surfcast_db = _get_surfcast_db(args=args)
+    surfcast_db.update_files_tables(incremental=args.incremental, predict=args.predict)
+
+
+def ingest(args):
+    """Download, parse and store every uncommitted NOAA file."""
+    surfcast_db = _get_surfcast_db(args=args)
+    surfcast_db.update_grid_data_tables(stream=args.stream, pipeline=args.pipeline)
+
+
+def render(args):
+    """Render map frames of stored cubes that have none yet."""
+    surfcast_db = _get_surfcast_db(args=args)
+    count = surfcast_db.render_frames(lake=args.lake, db_type=args.db_type, variables=args.variables)
+    print('Rendered {} posts into {}'.format(count, surfcast_db.frame_store.directory))
+
+
+def quantize(args):
+    """Rewrite REAL grid data tables with quantized INTEGER attributes."""
+    surfcast_db = _get_surfcast_db(args=args)
+    print('Quantized {} tables'.format(surfcast_db.quantize_grid_data_tables()))
+
+
+def watch(args):
+    """Ingest new NOAA posts as soon as they appear, probing expected filenames instead of the directory listings."""
+    surfcast_db = _get_surfcast_db(args=args)
+    surfcast_db.watch(poll_interval=args.interval, stream=args.stream, pipeline=args.pipeline)
+
+
+def query(args):
+    """Print the forecast time series at one or more surf spots."""
+    import pandas as pd
+
+    start = pd.Timestamp(args.start) if args.start is not None else pd.Timestamp.utcnow()
+    end = pd.Timestamp(args.end) if args.end is not None else start + pd.Timedelta(hours=args.hours)
+    surfcast_db = _get_surfcast_db(args=args)
+    forecasts = surfcast_db.get_spot_forecast(spot=args.spots, start=start, end=end, variables=args.variables,
+                                              db_type=args.db_type)
+    forecast = pd.concat(forecasts, names=['spot']).reset_index()
+    if args.format == 'json':
+        forecast['datetime'] = forecast['datetime'].astype(str)
+        forecast.to_json(args.output or sys.stdout, orient='records', lines=True)
+    else:
+        forecast.to_csv(args.output or sys.stdout, index=False)
+
+
+def best(args):
+    """Print the surf spots with the best forecast scores in the next hours."""
+    import pandas as pd
+
+    start = pd.Timestamp(args.start) if args.start is not None else None
+    surfcast_db = _get_surfcast_db(args=args)
+    best_spots = surfcast_db.get_best_spots(start=start, hours=args.hours, count=args.count, lake=args.lake,
+                                            db_type=args.db_type)
+    best_spots.to_csv(args.output or sys.stdout, index=False)
+
+
+def cache_info(args):
+    """Print the number and total size of raw NOAA files in the cache."""
+    from surfcast.data.noaa_cache import NOAACache
+
+    cache = NOAACache(directory=args.cache_dir)
+    count, size = cache.connection.execute('select count(*), coalesce(sum(size), 0) from entries').fetchone()
+    print('{}: {} files, {:.1f} MB of {:.1f} MB'.format(cache.directory, count, size / 1024 ** 2,
+                                                        cache.max_bytes / 1024 ** 2))
+
+
+def metrics(args):
+    """Aggregate recorded metrics into metrics.prom and print it."""
+    from surfcast.data.metrics import Metrics
+
+    path = Metrics(enabled=True, directory=args.metrics).write_prometheus()
+    with open(path) as file:
+        print(file.read(), end='')
+
+
+def get_parser():
+    """Get the command line argument parser."""
+    parser = argparse.ArgumentParser(prog='surfcast', description='Find the best surf spots on the Great Lakes.')
+    parser.add_argument('--metrics', metavar='DIR', default=os.environ.get('SURFCAST_METRICS'),
+                        help='record per stage metrics to DIR (default: $SURFCAST_METRICS)')
+    parser.add_argument('--offline', action='store_true', help='only read NOAA files from the raw file cache')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    # refresh-files
+    subparser = subparsers.add_parser('refresh-files', help=refresh_files.__doc__)
+    subparser.add_argument('--incremental', action='store_true',
+                           help='only add files newer than the latest file already in the files tables')
+    subparser.add_argument('--predict', action='store_true',
+                           help='probe the expected next filenames, listing directories only on a miss (implies '
+                                '--incremental)')
+    subparser.set_defaults(func=refresh_files, storage='rows')
+
+    # ingest
+    subparser = subparsers.add_parser('ingest', help=ingest.__doc__)
+    subparser.add_argument('--stream', action='store_true', help='parse files while they download')
+    subparser.add_argument('--pipeline', action='store_true', help='overlap download, parse and write stages')
+    subparser.add_argument('--storage', choices=['rows', 'cube', 'both'], default='rows')
+    subparser.add_argument('--render', action='store_true', help='render map frames of each pushed lake post')
+    subparser.add_argument('--quantize', action='store_true',
+                           help='create new grid data tables with quantized INTEGER attributes')
+    subparser.set_defaults(func=ingest)
+
+    # quantize
+    subparser = subparsers.add_parser('quantize', help=quantize.__doc__)
+    subparser.set_defaults(func=quantize, storage='rows')
+
+    # render
+    subparser = subparsers.add_parser('render', help=render.__doc__)
+    subparser.add_argument('--lake', choices=sorted(LAKES.values()))
+    subparser.add_argument('--db-type', choices=['fcast', 'ncast'], default='fcast')
+    subparser.add_argument('--variables', nargs='+', help='grid data attributes, default: all')
+    subparser.set_defaults(func=render, storage='cube')
+
+    # watch
+    subparser = subparsers.add_parser('watch', help=watch.__doc__)
+    subparser.add_argument('--interval', type=float, default=300, help='seconds between polls (default: 300)')
+    subparser.add_argument('--stream', action='store_true', help='parse files while they download')
+    subparser.add_argument('--pipeline', action='store_true', help='overlap download, parse and write stages')
+    subparser.add_argument('--storage', choices=['rows', 'cube', 'both'], default='rows')
+    subparser.add_argument('--render', action='store_true', help='render map frames of each pushed lake post')
+    subparser.add_argument('--quantize', action='store_true',
+                           help='create new grid data tables with quantized INTEGER attributes')
+    subparser.set_defaults(func=watch)
+
+    # query
+    subparser = subparsers.add_parser('query', help=query.__doc__)
+    subparser.add_argument('spots', nargs='+', help='surf spot names')
+    subparser.add_argument('--start', help='first datetime (GMT), default: this hour')
+    subparser.add_argument('--end', help='last datetime (GMT), default: start + --hours')
+    subparser.add_argument('--hours', type=int, default=48)
+    subparser.add_argument('--variables', nargs='+', help='grid data attributes, default: all')
+    subparser.add_argument('--db-type', choices=['fcast', 'ncast'], default='fcast')
+    subparser.add_argument('--format', choices=['csv', 'json'], default='csv')
+    subparser.add_argument('--output', help='output file, default: stdout')
+    subparser.set_defaults(func=query, storage='rows')
+
+    # best
+    subparser = subparsers.add_parser('best', help=best.__doc__)
+    subparser.add_argument('--start', help='first datetime (GMT), default: this hour')
+    subparser.add_argument('--hours', type=int, default=48)
+    subparser.add_argument('--count', type=int, default=10, help='number of spots (default: 10)')
+    subparser.add_argument('--lake', choices=sorted(LAKES.values()))
+    subparser.add_argument('--db-type', choices=['fcast', 'ncast'], default='fcast')
+    subparser.add_argument('--output', help='output file, default: stdout')
+    subparser.set_defaults(func=best, storage='rows')
+
+    # cache-info
+    subparser = subparsers.add_parser('cache-info', help=cache_info.__doc__)
+    subparser.add_argument('--cache-dir', default=CACHE_DIR)
+    subparser.set_defaults(func=cache_info)
+
+    # metrics
+    subparser = subparsers.add_parser('metrics', help=metrics.__doc__)
+    subparser.set_defaults(func=metrics)
+
+    return parser
+
+
+def main(argv=None):
+    """Run the surfcast command line interface."""
+    args = get_parser().parse_args(argv)
+
+    # Worker processes inherit the metrics directory through the environment
+    if args.metrics is not None:
+        os.environ['SURFCAST_METRICS'] = args.metrics
+    elif args.func is metrics:
+        get_parser().error('metrics requires --metrics DIR or $SURFCAST_METRICS')
+
+    args.func(args)
+
+    return 0
+
+
+def _get_surfcast_db(args):
+    """Connect to the Surfcast database, reading NOAA files from the raw file cache only if offline."""
+    from surfcast.data.surfcast_db import SurfcastDB
+
+    if args.offline:
+        from surfcast.data.noaa_cache import NOAACache
+        from surfcast.data.noaa_fetcher import NOAAFetcher, set_fetcher
+        set_fetcher(NOAAFetcher(cache=NOAACache(offline=True)))
+
+    return SurfcastDB(storage=args.storage, render=getattr(args, 'render', False),
+                      quantize=getattr(args, 'quantize', False))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+codec.py
+--------
+This module provide a class and methods for storing grid data attributes as quantized integers.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import numpy as np
+
+
+class QuantizedCodec(object):
+
+    """
+    Stores an attribute as integer codes, code = round(value * factor), decoded as code / factor.
+
+    factor is the number of steps per unit, i.e. 1 / resolution, and is a whole number so that decoding is a single
+    correctly rounded division: a value written in the NOAA text with at most log10(factor) decimals decodes to
+    exactly the float64 that parsing the text would give. Missing values are coded as the sentinel (the smallest
+    value of dtype, or the largest for unsigned dtypes) and are NULL in SQLite. Values outside the dtype range are
+    clipped to it.
+    """
+
+    def __init__(self, name, dtype, factor, source_format):
+
+        # Set parameters
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.factor = factor
+        self.source_format = source_format
+
+        # Set attributes
+        info = np.iinfo(self.dtype)
+        self.sentinel = info.max if info.min == 0 else info.min
+        self.min_code = info.min if info.min == 0 else info.min + 1
+        self.max_code = info.max - 1 if info.min == 0 else info.max
+
+    @property
+    def resolution(self):
+        """Value of one code step."""
+        return 1. / self.factor
+
+    def encode(self, values):
+        """Encode an array of values into an array of dtype codes."""
+        values = np.asarray(values, dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            codes = np.clip(np.round(values * self.factor), self.min_code, self.max_code)
+
+        return np.where(np.isnan(values), self.sentinel, codes).astype(self.dtype)
+
+    def decode(self, codes):
+        """Decode an array of codes (sentinels, None or NaN being missing) into float64 values."""
+        codes = np.asarray(codes, dtype=np.float64)
+
+        return np.where(codes == self.sentinel, np.nan, codes / self.factor)
+
+    def encode_sql(self, values):
+        """Encode an array of values into a list of Python ints for SQLite, None being missing."""
+        codes = self.encode(values=values)
+
+        return np.where(codes == self.sentinel, None, codes.astype(object)).tolist()
+
+
+# Codec of each grid data attribute, lossless for the NOAA text format noted. SQLite stores integers from -128 to
+# 127 in 1 byte and up to 32767 in 2 bytes instead of 8 bytes for REAL, so steps coarser than the text resolution
+# (e.g. 2 degree directions) would lose precision for little or no saving.
+CODECS = {codec.name: codec for codec in [
+    QuantizedCodec(name='wave_height', dtype='int16', factor=1000, source_format='%7.3f'),  # mm, up to 32.767 m
+    QuantizedCodec(name='wave_direction', dtype='int16', factor=1, source_format='%4d'),  # degrees
+    QuantizedCodec(name='wave_period', dtype='uint8', factor=10, source_format='%4.1f'),  # 0.1 s, up to 25.4 s
+    QuantizedCodec(name='wind_speed', dtype='int16', factor=100, source_format='%6.2f'),  # cm/s, up to 327.67 m/s
+    QuantizedCodec(name='wind_direction', dtype='int16', factor=1, source_format='%4d'),  # degrees
+    QuantizedCodec(name='surface_temperature', dtype='int16', factor=100, source_format='%6.2f'),  # 0.01 C
+    QuantizedCodec(name='current_speed', dtype='int16', factor=1000, source_format='%6.3f'),  # mm/s
+    QuantizedCodec(name='current_direction', dtype='int16', factor=1, source_format='%4d'),  # degrees
+    QuantizedCodec(name='ice_concentration', dtype='uint8', factor=100, source_format='%5.2f'),  # percent
+    QuantizedCodec(name='ice_thickness', dtype='int16', factor=100, source_format='%5.2f'),  # cm
+    QuantizedCodec(name='ice_speed', dtype='int16', factor=1000, source_format='%6.3f'),  # mm/s
+    QuantizedCodec(name='ice_direction', dtype='int16', factor=1, source_format='%4d')]}  # degrees
+
+
+def get_codec(attribute):
+    """Get the codec of a grid data attribute."""
+    return CODECS[attribute]
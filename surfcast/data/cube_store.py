@@ -0,0 +1,215 @@
+"""
+cube_store.py
+-------------
+This module provide classes and methods for storing lake posts as memory-mapped [hour, grid point, variable] cubes.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import numpy as np
+import pandas as pd
+
+# Local imports
+from surfcast import DATA_DIR
+
+# Set cube store directory
+CUBE_DIR = os.path.join(DATA_DIR, 'cubes')
+
+
+class ForecastCube(object):
+
+    """
+    Dense float32 grid data of one lake post with shape [hour, grid point, variable].
+
+    Hours are consecutive from first_hour (hours since the Unix epoch, GMT) and grid points are consecutive from
+    first_grid_number, so positions are computed rather than looked up. Cells missing from the post are NaN. The
+    data is a read-only memory map and every slicing method returns a view of it, nothing is read from disk until
+    the view is used.
+    """
+
+    def __init__(self, data, first_hour, first_grid_number, variables, lake, map_name, db_type):
+
+        # Set parameters
+        self.data = data
+        self.first_hour = first_hour
+        self.first_grid_number = first_grid_number
+        self.variables = list(variables)
+        self.lake = lake
+        self.map_name = map_name
+        self.db_type = db_type
+
+    @property
+    def datetimes(self):
+        """Forecast datetimes (GMT) of the hour axis."""
+        return np.arange(self.first_hour, self.first_hour + self.data.shape[0]).astype('datetime64[h]').astype(
+            'datetime64[ns]')
+
+    @property
+    def grid_numbers(self):
+        """Grid numbers of the grid point axis."""
+        return np.arange(self.first_grid_number, self.first_grid_number + self.data.shape[1])
+
+    def hour(self, date_time):
+        """Get the [grid point, variable] slice at a forecast datetime (GMT)."""
+        return self.data[self._get_hour_index(date_time=date_time)]
+
+    def grid_point(self, grid_number):
+        """Get the [hour, variable] time series of a grid point."""
+        return self.data[:, grid_number - self.first_grid_number]
+
+    def variable(self, variable):
+        """Get the [hour, grid point] field of a variable."""
+        return self.data[:, :, self.variables.index(variable)]
+
+    def to_frame(self):
+        """Convert to long format grid data with one row per (datetime, grid_number)."""
+        hour_count, grid_count, variable_count = self.data.shape
+        grid_data = pd.DataFrame(np.asarray(self.data).reshape(-1, variable_count), columns=self.variables)
+        grid_data.insert(0, 'grid_number', np.tile(self.grid_numbers, hour_count))
+        grid_data.insert(0, 'datetime', np.repeat(self.datetimes, grid_count))
+
+        return grid_data[grid_data[self.variables].notnull().any(axis=1)].reset_index(drop=True)
+
+    def _get_hour_index(self, date_time):
+        """Get the hour axis position of a datetime (GMT)."""
+        date_time = pd.Timestamp(date_time)
+        if date_time.tzinfo is not None:
+            date_time = date_time.tz_convert('UTC').tz_localize(None)
+        index = int(date_time.to_datetime64().astype('datetime64[h]').astype(np.int64)) - self.first_hour
+        if not 0 <= index < self.data.shape[0]:
+            raise KeyError('{} is outside the {} {} post.'.format(date_time, self.lake, self.db_type))
+
+        return index
+
+
+class CubeStore(object):
+
+    """
+    Alternative grid data backend storing each lake post as a float32 .npy file, memory-mapped on read. Cube files
+    are named db_type/lake/YYYYMMDDHH.npy after the post datetime.
+
+    The cubes table of the SQLite database indexes every cube by (db_type, lake, post datetime) together with its
+    axes, so that listing and opening cubes never touches the cube files themselves.
+    """
+
+    def __init__(self, connection, directory=CUBE_DIR):
+
+        # Set parameters
+        self.connection = connection
+        self.directory = directory
+
+        # Set attributes
+        self._create_index_table()
+
+    def write(self, post, db_type):
+        """Write a NOAALakePost as a cube, merged into any previous cube of the same post.
+
+        Variables, hours and grid points of the previous cube that are not in the post are kept, so a post pushed in
+        parts (e.g. a late ice file) adds its variables to the cube instead of replacing the earlier ones.
+        """
+        # Get axes
+        grid_data = post.grid_data
+        variables = [column for column in grid_data.columns if column not in ['datetime', 'grid_number', 'map', 'lake']]
+        hours = grid_data['datetime'].values.astype('datetime64[h]').astype(np.int64)
+        grid_numbers = grid_data['grid_number'].values.astype(np.int64)
+        first_hour, last_hour = int(hours.min()), int(hours.max())
+        first_grid_number, last_grid_number = int(grid_numbers.min()), int(grid_numbers.max())
+
+        # Extend axes by the previous cube of the post
+        previous_path = self._get_indexed_path(lake=post.lake, datetime=post.datetime, db_type=db_type)
+        previous = None
+        if previous_path is not None:
+            previous = self.read(lake=post.lake, datetime=post.datetime, db_type=db_type)
+            first_hour, last_hour = min(first_hour, previous.first_hour), max(
+                last_hour, previous.first_hour + previous.data.shape[0] - 1)
+            first_grid_number, last_grid_number = min(first_grid_number, previous.first_grid_number), max(
+                last_grid_number, previous.first_grid_number + previous.data.shape[1] - 1)
+            variables = previous.variables + [variable for variable in variables
+                                              if variable not in previous.variables]
+        shape = (last_hour - first_hour + 1, last_grid_number - first_grid_number + 1, len(variables))
+
+        # Write cube to a temporary file and move it into place once complete
+        path = self._get_path(lake=post.lake, db_type=db_type, datetime=post.datetime)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp.npy'
+        cube = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float32, shape=shape)
+        cube[:] = np.nan
+        if previous is not None:
+            hour_offset = previous.first_hour - first_hour
+            grid_offset = previous.first_grid_number - first_grid_number
+            cube[hour_offset:hour_offset + previous.data.shape[0], grid_offset:grid_offset + previous.data.shape[1],
+                 :len(previous.variables)] = previous.data
+            previous = None
+        post_variables = [column for column in grid_data.columns if column in variables]
+        if post_variables == variables:
+            cube[hours - first_hour, grid_numbers - first_grid_number] = \
+                grid_data[variables].values.astype(np.float32, copy=False)
+        else:
+            cube[(hours - first_hour)[:, np.newaxis], (grid_numbers - first_grid_number)[:, np.newaxis],
+                 [variables.index(variable) for variable in post_variables]] = \
+                grid_data[post_variables].values.astype(np.float32, copy=False)
+        cube.flush()
+        del cube
+        os.replace(temp_path, path)
+
+        # Update index
+        row = (db_type, post.lake, str(post.datetime), post.map_name, first_hour, shape[0], first_grid_number,
+               shape[1], ','.join(variables), os.path.relpath(path, self.directory))
+        with self.connection:
+            self.connection.execute('insert or replace into cubes values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+
+        # Drop the previous cube file if it was stored under another path (cubes written before paths were keyed
+        # by post)
+        if previous_path is not None and os.path.join(self.directory, previous_path) != path:
+            try:
+                os.remove(os.path.join(self.directory, previous_path))
+            except OSError:
+                pass
+
+        return path
+
+    def read(self, lake, datetime, db_type='fcast'):
+        """Open the cube of a lake post (post datetime as in the files tables) as a read-only memory map."""
+        row = self.connection.execute('select map, first_hour, first_grid_number, variables, path from cubes '
+                                      'where db_type=? and lake=? and post=?',
+                                      (db_type, lake, str(datetime))).fetchone()
+        if row is None:
+            raise KeyError('No {} cube for {} {}.'.format(db_type, lake, datetime))
+        map_name, first_hour, first_grid_number, variables, path = row
+
+        return ForecastCube(data=np.load(os.path.join(self.directory, path), mmap_mode='r'), first_hour=first_hour,
+                            first_grid_number=first_grid_number, variables=variables.split(','), lake=lake,
+                            map_name=map_name, db_type=db_type)
+
+    def list(self, lake=None, db_type=None):
+        """Get the cube index as a DataFrame, optionally for one lake and/or db_type."""
+        conditions, params = list(), list()
+        for column, value in [('lake', lake), ('db_type', db_type)]:
+            if value is not None:
+                conditions.append('{}=?'.format(column))
+                params.append(value)
+        where = ' where {}'.format(' and '.join(conditions)) if len(conditions) > 0 else ''
+
+        return pd.read_sql_query('select * from cubes{} order by db_type, lake, first_hour'.format(where),
+                                 self.connection, params=params)
+
+    def _create_index_table(self):
+        """Create the cube index table."""
+        with self.connection:
+            self.connection.execute('create table if not exists cubes (db_type text, lake text, post text, map text, '
+                                    'first_hour integer, hour_count integer, first_grid_number integer, '
+                                    'grid_count integer, variables text, path text, '
+                                    'primary key (db_type, lake, post)) without rowid')
+
+    def _get_path(self, lake, db_type, datetime):
+        """Get the cube file path of a lake post, keyed by post datetime like the index."""
+        return os.path.join(self.directory, db_type, lake, '{}.npy'.format(pd.Timestamp(datetime).strftime('%Y%m%d%H')))
+
+    def _get_indexed_path(self, lake, datetime, db_type):
+        """Get the indexed cube file path of a lake post relative to the store directory, or None."""
+        row = self.connection.execute('select path from cubes where db_type=? and lake=? and post=?',
+                                      (db_type, lake, str(datetime))).fetchone()
+
+        return None if row is None else row[0]
+
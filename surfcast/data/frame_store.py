@@ -0,0 +1,257 @@
+"""
+frame_store.py
+--------------
+This module provide a class and methods for rendering lake posts as cached PNG map frames.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import zlib
+import shutil
+import struct
+import numpy as np
+import pandas as pd
+
+# Local imports
+from surfcast import DATA_DIR
+
+# Set frame store directory
+FRAME_DIR = os.path.join(DATA_DIR, 'frames')
+
+# Number of posts of each lake and db_type whose frames are kept
+FRAME_POSTS = 4
+
+# Approximate length (pixels) of the long side of a frame, grid cells are scaled up by a whole number of pixels
+FRAME_SIZE = 512
+
+# zlib compression level of frames (1 is several times faster than the default for a few percent larger files)
+PNG_COMPRESS_LEVEL = 1
+
+# Colour scale (vmin, vmax) of each variable, shared by every frame so that hours and posts are comparable
+VARIABLE_RANGES = {'wave_height': (0., 4.), 'wave_direction': (0., 360.), 'wave_period': (0., 10.),
+                   'wind_speed': (0., 25.), 'wind_direction': (0., 360.), 'surface_temperature': (0., 30.),
+                   'current_speed': (0., 1.), 'current_direction': (0., 360.), 'ice_concentration': (0., 1.),
+                   'ice_thickness': (0., 2.), 'ice_speed': (0., 1.), 'ice_direction': (0., 360.)}
+
+
+class FrameStore(object):
+
+    """
+    Renders lake posts into one PNG frame per variable and forecast hour, as used for the README wave height map.
+
+    Grid values are colour mapped into 8-bit palette indices and scattered into a [hour, fortran_row, fortran_column]
+    raster of the lake's map file with a single vectorized assignment, land is transparent and north is up. Each
+    frame is then written as a palette PNG with one zlib call, matplotlib only provides the colour maps. Frames are
+    written to FRAME_DIR/db_type/lake/post/variable/YYYYMMDDHH.png and indexed by (db_type, lake, post) in the frames
+    table of the SQLite database, so rendering a new post only touches the frames of its own lake. Rendering part of
+    a post (e.g. a late ice file) only replaces the frames of its own variables.
+    """
+
+    def __init__(self, connection, directory=FRAME_DIR, posts=FRAME_POSTS):
+
+        # Set parameters
+        self.connection = connection
+        self.directory = directory
+        self.posts = posts
+
+        # Set attributes
+        self._lattices = dict()
+        self._create_index_table()
+
+    def render(self, post, db_type, variables=None):
+        """Render the frames of a NOAALakePost, replacing any previous frames of the same post."""
+        grid_data = post.grid_data
+        variables = self._get_variables(columns=grid_data.columns, variables=variables)
+        hours = grid_data['datetime'].values.astype('datetime64[h]').astype(np.int64)
+
+        return self._render(lake=post.lake, db_type=db_type, datetime=post.datetime, map_name=post.map_name,
+                            hours=hours, grid_numbers=grid_data['grid_number'].values.astype(np.int64),
+                            values={variable: grid_data[variable].values for variable in variables})
+
+    def render_cube(self, cube, datetime, variables=None):
+        """Render the frames of a ForecastCube (post datetime as in the files tables)."""
+        variables = self._get_variables(columns=cube.variables, variables=variables)
+        hour_count, grid_count = cube.data.shape[:2]
+        hours = np.repeat(np.arange(cube.first_hour, cube.first_hour + hour_count), grid_count)
+
+        return self._render(lake=cube.lake, db_type=cube.db_type, datetime=datetime, map_name=cube.map_name,
+                            hours=hours, grid_numbers=np.tile(cube.grid_numbers, hour_count),
+                            values={variable: cube.variable(variable).ravel() for variable in variables})
+
+    def get_frames(self, lake, variable, db_type='fcast'):
+        """Get the frame paths of a lake and variable by forecast datetime (GMT), latest post first for each hour."""
+        index = self.list(lake=lake, db_type=db_type).sort_values(by='post', ascending=False)
+        frames = dict()
+        for post, first_hour, hour_count, path in zip(index['post'], index['first_hour'], index['hour_count'],
+                                                      index['path']):
+            for hour in range(first_hour, first_hour + hour_count):
+                frame_path = os.path.join(self.directory, path, variable, '{}.png'.format(_format_hour(hour)))
+                if hour not in frames and os.path.isfile(frame_path):
+                    frames[hour] = frame_path
+
+        return pd.Series({np.datetime64(hour, 'h').astype('datetime64[ns]'): frames[hour]
+                          for hour in sorted(frames)}, dtype=object)
+
+    def list(self, lake=None, db_type=None):
+        """Get the frame index as a DataFrame, optionally for one lake and/or db_type."""
+        conditions, params = list(), list()
+        for column, value in [('lake', lake), ('db_type', db_type)]:
+            if value is not None:
+                conditions.append('{}=?'.format(column))
+                params.append(value)
+        where = ' where {}'.format(' and '.join(conditions)) if len(conditions) > 0 else ''
+
+        return pd.read_sql_query('select * from frames{} order by db_type, lake, post'.format(where),
+                                 self.connection, params=params)
+
+    def has_frames(self, lake, datetime, db_type='fcast'):
+        """Check if the frames of a lake post have been rendered."""
+        return self.connection.execute('select 1 from frames where db_type=? and lake=? and post=?',
+                                       (db_type, lake, str(datetime))).fetchone() is not None
+
+    def _render(self, lake, db_type, datetime, map_name, hours, grid_numbers, values):
+        """Scatter long format values into a raster and write one frame per variable and hour."""
+
+        # Get raster positions of grid points
+        rows, columns, shape = self._get_lattice(map_name=map_name)
+        first_hour = int(hours.min())
+        hour_count = int(hours.max()) - first_hour + 1
+        hour_index = hours - first_hour
+        row_index, column_index = rows[grid_numbers], columns[grid_numbers]
+        scale = max(1, FRAME_SIZE // max(shape))
+
+        # Write frames to a temporary directory and move it into place once complete
+        path = os.path.join(db_type, lake, _format_post(datetime=datetime))
+        temp_path = os.path.join(self.directory, path + '.tmp')
+        shutil.rmtree(temp_path, ignore_errors=True)
+        for variable, variable_values in values.items():
+            os.makedirs(os.path.join(temp_path, variable))
+
+            # Scatter all hours at once into palette indices (0 is transparent)
+            variable_values = np.asarray(variable_values, dtype=np.float32)
+            vmin, vmax = VARIABLE_RANGES.get(variable, (np.nanmin(variable_values), np.nanmax(variable_values)))
+            raster = np.zeros((hour_count,) + shape, dtype=np.uint8)
+            raster[hour_index, row_index, column_index] = to_palette_index(values=variable_values, vmin=vmin,
+                                                                           vmax=vmax)
+
+            # Scale grid cells to pixels
+            if scale > 1:
+                raster = raster.repeat(scale, axis=1).repeat(scale, axis=2)
+
+            # Write frames
+            palette = get_palette(cmap='twilight' if variable.endswith('_direction') else 'jet')
+            for hour in np.unique(hour_index):
+                write_png(path=os.path.join(temp_path, variable, '{}.png'.format(_format_hour(first_hour + hour))),
+                          indices=raster[hour], palette=palette)
+
+        # Replace the frames of the rendered variables only, keeping other variables of a post rendered in parts
+        os.makedirs(os.path.join(self.directory, path), exist_ok=True)
+        for variable in values:
+            shutil.rmtree(os.path.join(self.directory, path, variable), ignore_errors=True)
+            os.replace(os.path.join(temp_path, variable), os.path.join(self.directory, path, variable))
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+        # Update index, merging hours and variables with any previous frames of the post
+        variables = list(values)
+        row = self.connection.execute('select first_hour, hour_count, variables from frames where db_type=? and '
+                                      'lake=? and post=?', (db_type, lake, str(datetime))).fetchone()
+        if row is not None:
+            last_hour = max(first_hour + hour_count, row[0] + row[1]) - 1
+            first_hour = min(first_hour, row[0])
+            hour_count = last_hour - first_hour + 1
+            variables = row[2].split(',') + [variable for variable in variables if variable not in row[2].split(',')]
+        with self.connection:
+            self.connection.execute('insert or replace into frames values (?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (db_type, lake, str(datetime), map_name, first_hour, hour_count,
+                                     ','.join(variables), path))
+
+        # Drop frames of old posts
+        self._prune(lake=lake, db_type=db_type)
+
+        return os.path.join(self.directory, path)
+
+    def _get_lattice(self, map_name):
+        """Get the raster row (north up) and column of each grid number and the raster shape."""
+        if map_name not in self._lattices:
+            map_data = pd.read_sql_query('select sequence_number, fortran_column, fortran_row from {}'.format(
+                map_name.split('.')[0]), self.connection).astype(np.int64)
+            sequence_number = map_data['sequence_number'].values
+            first_row, last_row = map_data['fortran_row'].min(), map_data['fortran_row'].max()
+            first_column, last_column = map_data['fortran_column'].min(), map_data['fortran_column'].max()
+            rows = np.zeros(sequence_number.max() + 1, dtype=np.int64)
+            columns = np.zeros(sequence_number.max() + 1, dtype=np.int64)
+            rows[sequence_number] = last_row - map_data['fortran_row'].values
+            columns[sequence_number] = map_data['fortran_column'].values - first_column
+            shape = (int(last_row - first_row + 1), int(last_column - first_column + 1))
+            self._lattices[map_name] = (rows, columns, shape)
+
+        return self._lattices[map_name]
+
+    def _prune(self, lake, db_type):
+        """Delete the frames of all but the latest posts of a lake and db_type."""
+        old_posts = self.connection.execute('select post, path from frames where db_type=? and lake=? '
+                                            'order by post desc limit -1 offset ?',
+                                            (db_type, lake, self.posts)).fetchall()
+        for post, path in old_posts:
+            shutil.rmtree(os.path.join(self.directory, path), ignore_errors=True)
+        with self.connection:
+            self.connection.executemany('delete from frames where db_type=? and lake=? and post=?',
+                                        [(db_type, lake, post) for post, path in old_posts])
+
+    @staticmethod
+    def _get_variables(columns, variables):
+        """Get the variables to render, defaulting to all grid data attributes."""
+        columns = [column for column in columns if column not in ['datetime', 'grid_number', 'map', 'lake']]
+
+        return columns if variables is None else [variable for variable in variables if variable in columns]
+
+    def _create_index_table(self):
+        """Create the frame index table."""
+        with self.connection:
+            self.connection.execute('create table if not exists frames (db_type text, lake text, post text, '
+                                    'map text, first_hour integer, hour_count integer, variables text, path text, '
+                                    'primary key (db_type, lake, post)) without rowid')
+
+
+def to_palette_index(values, vmin, vmax):
+    """Map values to palette indices 1 to 255 between vmin and vmax, NaN to the transparent index 0."""
+    with np.errstate(invalid='ignore'):
+        indices = 1. + np.clip((values - vmin) / max(vmax - vmin, 1e-12), 0., 1.) * 254.
+
+    return np.where(np.isnan(values), 0, np.round(indices)).astype(np.uint8)
+
+
+def get_palette(cmap):
+    """Get the 256 x RGB palette of a matplotlib colour map, index 0 being the transparent colour."""
+    from matplotlib import cm
+
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    palette[1:] = np.round(getattr(cm, cmap)(np.linspace(0., 1., 255))[:, :3] * 255.)
+
+    return palette
+
+
+def write_png(path, indices, palette):
+    """Write a [row, column] array of palette indices as an 8-bit palette PNG with a transparent index 0."""
+    height, width = indices.shape
+    data = np.zeros((height, width + 1), dtype=np.uint8)
+    data[:, 1:] = indices
+
+    with open(path, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        for chunk_type, chunk in [(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)),
+                                  (b'PLTE', palette.tobytes()), (b'tRNS', b'\x00'),
+                                  (b'IDAT', zlib.compress(data.tobytes(), PNG_COMPRESS_LEVEL)), (b'IEND', b'')]:
+            file.write(struct.pack('>I', len(chunk)) + chunk_type + chunk +
+                       struct.pack('>I', zlib.crc32(chunk_type + chunk) & 0xffffffff))
+
+
+def _format_hour(hour):
+    """Format hours since the Unix epoch (GMT) as a YYYYMMDDHH frame name."""
+    return pd.Timestamp(np.datetime64(int(hour), 'h')).strftime('%Y%m%d%H')
+
+
+def _format_post(datetime):
+    """Format a post datetime as a YYYYMMDDHH directory name."""
+    return pd.Timestamp(datetime).strftime('%Y%m%d%H')
@@ -0,0 +1,212 @@
+"""
+grid_interpolator.py
+--------------------
+This module provide classes and methods for bilinear interpolation of grid data at arbitrary coordinates.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+# Local imports
+from surfcast.data.spatial_index import project, chord_to_arc
+
+# Degree of the polynomial fit of (lat, lon) to fractional (fortran_row, fortran_column)
+LATTICE_FIT_DEGREE = 3
+
+# Grid interpolators built in this process, keyed by map file name
+_GRID_INTERPOLATORS = dict()
+
+
+class GridInterpolator(object):
+
+    """
+    Bilinear interpolation over the structured (fortran_row, fortran_column) lattice of a map file.
+
+    The lattice holds the position of each grid point in map order, or -1 for land. Coordinates are placed on the
+    lattice with a cubic polynomial fit of (lat, lon) to (row, column), which reproduces the grid point positions of
+    every map in MAP_FILES to within 0.001 cells. Longitudes follow the map file convention of decimal degrees W.
+    """
+
+    def __init__(self, map_name, sequence_number, fortran_column, fortran_row, lat, lon, depth):
+
+        # Set parameters
+        self.map_name = map_name
+        self.sequence_number = np.asarray(sequence_number, dtype=np.int64)
+        self.fortran_column = np.asarray(fortran_column, dtype=np.int64)
+        self.fortran_row = np.asarray(fortran_row, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.depth = np.asarray(depth, dtype=np.float64)
+
+        # Set attributes
+        self.lattice = np.full((self.fortran_row.max() + 2, self.fortran_column.max() + 2), -1, dtype=np.int64)
+        self.lattice[self.fortran_row, self.fortran_column] = np.arange(len(self.sequence_number))
+        self._center = (self.lat.mean(), self.lon.mean())
+        self._row_coefficients, self._column_coefficients = np.linalg.lstsq(
+            self._get_design_matrix(lat=self.lat, lon=self.lon),
+            np.column_stack([self.fortran_row, self.fortran_column]).astype(np.float64), rcond=None)[0].T
+        self._nearest_trees = dict()
+
+    @classmethod
+    def from_map_data(cls, map_name, map_data):
+        """Create grid interpolator from a map data DataFrame."""
+        return cls(map_name=map_name, **{column: map_data[column].values for column in
+                                         ['sequence_number', 'fortran_column', 'fortran_row', 'lat', 'lon', 'depth']})
+
+    @classmethod
+    def from_table(cls, map_name, connection):
+        """Create grid interpolator from a SQLite map table."""
+        map_data = pd.read_sql_query('select sequence_number, fortran_column, fortran_row, lat, lon, depth '
+                                     'from {}'.format(map_name.split('.')[0]), connection)
+
+        return cls.from_map_data(map_name=map_name, map_data=map_data)
+
+    def get_lattice_position(self, lat, lon):
+        """Get the fractional (row, column) lattice position of each coordinate."""
+        design_matrix = self._get_design_matrix(lat=lat, lon=lon)
+
+        return design_matrix.dot(self._row_coefficients), design_matrix.dot(self._column_coefficients)
+
+    def weights(self, lat, lon, min_depth=0., max_distance=None):
+        """Get the interpolation weights of a set of coordinates.
+
+        Each coordinate is weighted over the four grid points of its lattice cell. Land corners and grid points
+        shallower than min_depth (m) are dropped and the remaining weights renormalized. Coordinates without a usable
+        corner (on land or outside the grid) take the nearest grid point at least min_depth deep, if it is within
+        max_distance (km, default: any distance), and are NaN otherwise.
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+
+        # Get lattice cells
+        row, column = self.get_lattice_position(lat=lat, lon=lon)
+        row0, column0 = np.floor(row).astype(np.int64), np.floor(column).astype(np.int64)
+        row_fraction, column_fraction = row - row0, column - column0
+
+        # Get [point, corner] positions and bilinear weights
+        corner_rows = row0[:, np.newaxis] + np.array([0, 0, 1, 1])
+        corner_columns = column0[:, np.newaxis] + np.array([0, 1, 0, 1])
+        corner_weights = np.column_stack([(1. - row_fraction) * (1. - column_fraction),
+                                          (1. - row_fraction) * column_fraction,
+                                          row_fraction * (1. - column_fraction),
+                                          row_fraction * column_fraction])
+        inside = ((corner_rows >= 0) & (corner_rows < self.lattice.shape[0]) &
+                  (corner_columns >= 0) & (corner_columns < self.lattice.shape[1]))
+        positions = np.where(inside, self.lattice[np.where(inside, corner_rows, 0),
+                                                  np.where(inside, corner_columns, 0)], -1)
+
+        # Mask land and shallow corners and renormalize
+        wet = positions >= 0
+        wet[wet] = self.depth[positions[wet]] >= min_depth
+        corner_weights = np.where(wet, corner_weights, 0.)
+        totals = corner_weights.sum(axis=1)
+        corner_weights[totals > 0] /= totals[totals > 0, np.newaxis]
+
+        # Fall back to the nearest usable grid point
+        stranded = np.flatnonzero(totals <= 0)
+        if len(stranded) > 0:
+            distance, nearest = self._get_nearest(lat=lat[stranded], lon=lon[stranded], min_depth=min_depth)
+            found = np.isfinite(distance) if max_distance is None else distance <= max_distance
+            positions[stranded, 0] = nearest
+            corner_weights[stranded, 0] = np.where(found, 1., 0.)
+
+        # Build sparse [point, grid point] matrix
+        keep = corner_weights > 0
+        matrix = sparse.csr_matrix((corner_weights[keep], (np.nonzero(keep)[0], positions[keep])),
+                                   shape=(len(lat), len(self.sequence_number)))
+
+        return InterpolationWeights(matrix=matrix, sequence_number=self.sequence_number)
+
+    def _get_nearest(self, lat, lon, min_depth):
+        """Get the (distance, position) of the nearest grid point at least min_depth deep to each coordinate."""
+        if min_depth not in self._nearest_trees:
+            positions = np.flatnonzero(self.depth >= min_depth)
+            tree = cKDTree(project(lat=self.lat[positions], lon=self.lon[positions])) if len(positions) > 0 else None
+            self._nearest_trees[min_depth] = (tree, positions)
+        tree, positions = self._nearest_trees[min_depth]
+        if tree is None:
+            return np.full(len(lat), np.inf), np.zeros(len(lat), dtype=np.int64)
+        distance, index = tree.query(project(lat=lat, lon=lon))
+
+        return chord_to_arc(distance), positions[index]
+
+    def _get_design_matrix(self, lat, lon):
+        """Get the polynomial terms of centred (lat, lon) for the lattice fit."""
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64)) - self._center[0]
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64)) - self._center[1]
+
+        return np.column_stack([lat ** i * lon ** j for i in range(LATTICE_FIT_DEGREE + 1)
+                                for j in range(LATTICE_FIT_DEGREE + 1 - i)])
+
+
+class InterpolationWeights(object):
+
+    """
+    Sparse [point, grid point] bilinear weights of a set of coordinates, grid points in map order.
+
+    Weights are applied to all hours at once as one sparse matrix product. Missing (NaN) grid values are dropped and
+    the remaining weights renormalized, so a point is only NaN if all of its grid points are.
+    """
+
+    def __init__(self, matrix, sequence_number):
+
+        # Set parameters
+        self.matrix = matrix
+        self.sequence_number = sequence_number
+
+        # Set attributes
+        self.grid_numbers = self.sequence_number[np.unique(self.matrix.indices)]
+        self._empty = np.diff(self.matrix.indptr) == 0
+
+    def interpolate(self, values, grid_numbers=None, circular=False):
+        """Interpolate [grid point] or [hour, grid point] values, returning [point] or [hour, point] values.
+
+        grid_numbers gives the grid number of each values column (default: the map order). A ForecastCube field is
+        interpolated with weights.interpolate(cube.variable(variable), grid_numbers=cube.grid_numbers). Set
+        circular=True for directions in degrees, which are interpolated as unit vectors.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        squeeze = values.ndim == 1
+        values = np.atleast_2d(values)
+
+        # Scatter columns into map order
+        if grid_numbers is not None:
+            positions = np.clip(np.searchsorted(self.sequence_number, grid_numbers), 0, len(self.sequence_number) - 1)
+            known = self.sequence_number[positions] == np.asarray(grid_numbers)
+            ordered = np.full((values.shape[0], len(self.sequence_number)), np.nan)
+            ordered[:, positions[known]] = values[:, known]
+            values = ordered
+
+        # Interpolate directions as unit vectors
+        if circular:
+            radians = np.radians(values)
+            result = np.degrees(np.arctan2(self._apply(values=np.sin(radians)), self._apply(values=np.cos(radians))))
+            result = np.mod(result, 360.)
+        else:
+            result = self._apply(values=values)
+
+        return result[0] if squeeze else result
+
+    def _apply(self, values):
+        """Apply the weights to [hour, grid point] values in map order, returning [hour, point] values."""
+        finite = np.isfinite(values)
+        if finite.all():
+            result = self.matrix.dot(values.T)
+            result[self._empty] = np.nan
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = self.matrix.dot(np.where(finite, values, 0.).T) / self.matrix.dot(finite.T.astype(np.float64))
+
+        return result.T
+
+
+def get_grid_interpolator(map_name, connection):
+    """Get the grid interpolator of a map file, building it from SQLite once per process."""
+    if map_name not in _GRID_INTERPOLATORS:
+        _GRID_INTERPOLATORS[map_name] = GridInterpolator.from_table(map_name=map_name, connection=connection)
+
+    return _GRID_INTERPOLATORS[map_name]
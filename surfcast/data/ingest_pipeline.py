@@ -0,0 +1,199 @@
+"""
+ingest_pipeline.py
+------------------
+This module provide a class and methods for ingesting NCAST and FCAST posts with overlapping download, parse and
+SQLite write stages.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import numpy as np
+from joblib.externals.loky import get_reusable_executor
+
+# Local imports
+from surfcast.data.retry import Deadline, RetryError
+from surfcast.data.noaa_fetcher import get_fetcher
+from surfcast.data.noaa_forecast_post import NOAAForecastPost, NOAALakePost, get_file_labels
+
+# End of stream marker
+_DONE = object()
+
+# Interval (s) at which blocked queue operations check if the pipeline was stopped
+_POLL_INTERVAL = 0.1
+
+
+class IngestPipeline(object):
+
+    """
+    Three stage pipeline for a backlog of uncommitted NOAA posts.
+
+    1. Download - I/O threads (NOAAFetcher) download every file of a post concurrently.
+    2. Parse    - a process pool parses one file per task, largest files first.
+    3. Write    - the calling thread is the single SQLite writer and commits lake posts in post order.
+
+    Stages are connected by bounded queues holding at most queue_size posts, so a slow stage blocks the stages
+    feeding it instead of letting downloaded text or parsed frames pile up in memory.
+
+    A post whose downloads fail under the fetcher's retry policy (attempts or post deadline exhausted) is skipped and
+    left uncommitted for the next update. Any other error stops every stage and is raised by run.
+    """
+
+    def __init__(self, surfcast_db, db_type, parse_workers=None, queue_size=2, fetcher=None):
+
+        # Set parameters
+        self.surfcast_db = surfcast_db
+        self.db_type = db_type
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.fetcher = fetcher if fetcher is not None else get_fetcher()
+
+        # Set attributes
+        self.download_queue = queue.Queue(maxsize=self.queue_size)
+        self.write_queue = queue.Queue(maxsize=self.queue_size)
+        self.executor = None
+        self.directory = None
+        self.threads = list()
+        self.stopped = threading.Event()
+        self.posts = 0
+
+    def run(self, df):
+        """Ingest all posts of a files DataFrame, returning throughput in posts/minute."""
+        # Get posts, oldest first so that newer forecasts of the same hours overwrite older ones
+        date_times = sorted(df['file_datetime'].unique())
+        print('Pipelining {} {} forecasts...'.format(len(date_times), self.db_type.upper()))
+        if len(date_times) == 0:
+            return 0.
+
+        # Start download and parse stages
+        start_time = time.time()
+        self.executor = get_reusable_executor(max_workers=self.parse_workers)
+        self.directory = tempfile.mkdtemp(prefix='surfcast_')
+        self.threads = [threading.Thread(target=self._download_stage, args=(df, date_times), daemon=True),
+                        threading.Thread(target=self._parse_stage, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+        # Write stage
+        try:
+            self._write_stage(post_count=len(date_times), start_time=start_time)
+            for thread in self.threads:
+                thread.join()
+
+        except BaseException:
+            self._stop()
+            raise
+
+        finally:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+        return self.posts / ((time.time() - start_time) / 60.)
+
+    def _download_stage(self, df, date_times):
+        """Download every file of each post and pass the texts on to the parse stage."""
+        try:
+            for date_time in date_times:
+                post_df = df[df['file_datetime'] == date_time]
+                urls = {url + filename: filename for url, filename in zip(post_df['url'], post_df['filename'])}
+                try:
+                    texts = {urls[url]: text for url, text in self.fetcher.fetch_all(
+                        urls=list(urls), deadline=Deadline(self.fetcher.retrier.policy.post_deadline),
+                        labels=get_file_labels(df=post_df, db_type=self.db_type)).items()}
+                except RetryError as exception:
+                    print('Skipping {} {} forecast: {}'.format(self.db_type.upper(), date_time, exception))
+                    texts = None
+                if not self._put(stage_queue=self.download_queue, item=(date_time, post_df, texts)):
+                    return
+            self._put(stage_queue=self.download_queue, item=_DONE)
+
+        except Exception as exception:
+            self._put(stage_queue=self.download_queue, item=exception)
+
+    def _parse_stage(self):
+        """Submit files to the process pool, largest first, and pass their futures on to the write stage."""
+        try:
+            while True:
+                item = self._get(stage_queue=self.download_queue)
+                if item is _DONE or isinstance(item, Exception):
+                    self._put(stage_queue=self.write_queue, item=item)
+                    return
+
+                # Pass skipped posts straight through
+                date_time, post_df, texts = item
+                if texts is None:
+                    if not self._put(stage_queue=self.write_queue, item=item):
+                        return
+                    continue
+
+                # Submit one task per file
+                order = sorted(post_df.index, key=lambda df_index: len(texts[post_df.loc[df_index, 'filename']]),
+                               reverse=True)
+                futures = {post_df.loc[df_index, 'filename']: self.executor.submit(
+                    NOAAForecastPost._process_file, post_df.loc[df_index, 'url'], post_df.loc[df_index, 'filename'],
+                    post_df.loc[df_index, 'filetype'], post_df.loc[df_index, 'lake'], False,
+                    texts.pop(post_df.loc[df_index, 'filename']), self.directory, None, self.db_type)
+                    for df_index in order}
+                if not self._put(stage_queue=self.write_queue, item=(date_time, post_df, futures)):
+                    return
+
+        except Exception as exception:
+            self._put(stage_queue=self.write_queue, item=exception)
+
+    def _put(self, stage_queue, item):
+        """Put an item on a bounded queue, giving up if the pipeline is stopped. Returns True if the item was put."""
+        while not self.stopped.is_set():
+            try:
+                stage_queue.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def _get(self, stage_queue):
+        """Get an item from a queue, or the end of stream marker if the pipeline is stopped."""
+        while not self.stopped.is_set():
+            try:
+                return stage_queue.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+
+        return _DONE
+
+    def _stop(self):
+        """Stop the download and parse stages and drop the posts queued between stages."""
+        self.stopped.set()
+        for stage_queue in [self.download_queue, self.write_queue]:
+            while True:
+                try:
+                    stage_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _write_stage(self, post_count, start_time):
+        """Push parsed lake posts into SQLite."""
+        while True:
+            item = self.write_queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+
+            # Push lake posts
+            date_time, post_df, futures = item
+            if futures is None:
+                continue
+            for lake in post_df['lake'].unique():
+                filenames = post_df.loc[post_df['lake'] == lake, 'filename']
+                post = NOAALakePost(df=post_df[post_df['lake'] == lake], datetime=date_time, db_type=self.db_type,
+                                    lake=lake, noaa_files=[futures[filename].result() for filename in filenames])
+                self.surfcast_db._push_lake_post(post=post, db_type=self.db_type)
+            self.posts += 1
+
+            print('Processed {} / {} {} forecasts: {} posts/minute'.format(
+                self.posts, post_count, self.db_type.upper(),
+                np.round(self.posts / ((time.time() - start_time) / 60.), 2)))
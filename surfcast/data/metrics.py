@@ -0,0 +1,214 @@
+"""
+metrics.py
+----------
+This module provide classes and methods for recording per-stage performance metrics of NOAA ingestion.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+
+# Local imports
+from surfcast import DATA_DIR
+
+# Optional peak RSS (not available on Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Set metrics directory
+METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+
+# Environment variable holding the metrics directory, set when metrics are enabled so worker processes record too
+METRICS_ENV = 'SURFCAST_METRICS'
+
+# Span counters
+COUNTERS = ['bytes', 'rows', 'retries']
+
+# Labels aggregated in the Prometheus file (filenames are only kept in the JSON-lines file)
+PROMETHEUS_LABELS = ['stage', 'lake', 'db_type']
+
+# Default shared metrics
+_METRICS = None
+_METRICS_LOCK = threading.Lock()
+
+
+class Metrics(object):
+
+    """
+    Records one JSON line per span to {directory}/metrics.jsonl and aggregates them into {directory}/metrics.prom.
+
+    Spans are timed blocks of a stage (list, download, parse, merge, write) labelled by lake, db_type and filename
+    that count bytes, rows and retries and record the peak RSS of the process on exit. When disabled, span() returns a
+    shared no-op span, so instrumented code costs one method call per span.
+    """
+
+    def __init__(self, enabled=False, directory=METRICS_DIR):
+
+        # Set parameters
+        self.enabled = enabled
+        self.directory = directory
+
+        # Set attributes
+        self.jsonl_path = os.path.join(self.directory, 'metrics.jsonl')
+        self.prometheus_path = os.path.join(self.directory, 'metrics.prom')
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def span(self, stage, **labels):
+        """Get a context manager timing a stage."""
+        if not self.enabled:
+            return _NULL_SPAN
+
+        return Span(metrics=self, stage=stage, labels=labels)
+
+    def record(self, record):
+        """Append a span record to the JSON-lines file."""
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            with open(self.jsonl_path, 'a') as file:
+                file.write(line)
+
+    def read(self):
+        """Read all span records, including those written by worker processes."""
+        if not os.path.isfile(self.jsonl_path):
+            return list()
+        with open(self.jsonl_path) as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    def write_prometheus(self):
+        """Aggregate span records by stage, lake and db_type into a Prometheus text format file."""
+        if not self.enabled:
+            return None
+
+        # Aggregate records
+        totals = OrderedDict()
+        peak_rss = 0
+        for record in self.read():
+            key = tuple(record.get(label) for label in PROMETHEUS_LABELS)
+            total = totals.setdefault(key, dict(spans=0, seconds=0., **{counter: 0 for counter in COUNTERS}))
+            total['spans'] += 1
+            total['seconds'] += record['seconds']
+            for counter in COUNTERS:
+                total[counter] += record.get(counter, 0)
+            peak_rss = max(peak_rss, record.get('peak_rss') or 0)
+
+        # Format metrics
+        lines = list()
+        for name, description in [('spans', 'Number of spans'), ('seconds', 'Time spent'),
+                                  ('bytes', 'Bytes processed'), ('rows', 'Rows processed'),
+                                  ('retries', 'Request retries')]:
+            metric = 'surfcast_stage_{}_total'.format(name)
+            lines.append('# HELP {} {} per stage.'.format(metric, description))
+            lines.append('# TYPE {} counter'.format(metric))
+            for key, total in totals.items():
+                labels = ','.join('{}="{}"'.format(label, value) for label, value in zip(PROMETHEUS_LABELS, key)
+                                  if value is not None)
+                lines.append('{}{{{}}} {}'.format(metric, labels, total[name]))
+        lines.append('# HELP surfcast_peak_rss_bytes Peak resident set size of any process.')
+        lines.append('# TYPE surfcast_peak_rss_bytes gauge')
+        lines.append('surfcast_peak_rss_bytes {}'.format(peak_rss))
+
+        # Write atomically so scrapers never see a partial file
+        temp_path = self.prometheus_path + '.tmp'
+        with open(temp_path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, self.prometheus_path)
+
+        return self.prometheus_path
+
+
+class Span(object):
+
+    """Timed block of a stage, recorded on exit."""
+
+    def __init__(self, metrics, stage, labels):
+
+        # Set parameters
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+
+        # Set attributes
+        self.counts = {counter: 0 for counter in COUNTERS}
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record = OrderedDict([('stage', self.stage), ('time', time.time())])
+        record.update(self.labels)
+        record['seconds'] = time.perf_counter() - self.start_time
+        record.update(self.counts)
+        record['peak_rss'] = get_peak_rss()
+        record['pid'] = os.getpid()
+        record['error'] = None if exc_type is None else exc_type.__name__
+        self.metrics.record(record=record)
+
+        return False
+
+    def add(self, **counts):
+        """Add to the bytes, rows and/or retries counters."""
+        for counter, count in counts.items():
+            self.counts[counter] += int(count)
+
+
+class _NullSpan(object):
+
+    """Span used when metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add(self, **counts):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def get_peak_rss():
+    """Get the peak resident set size of this process in bytes, or None if unavailable."""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Reported in bytes on macOS and KiB on Linux
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def get_metrics():
+    """Get the process wide shared Metrics, enabled if the SURFCAST_METRICS environment variable is set."""
+    global _METRICS
+    with _METRICS_LOCK:
+        if _METRICS is None:
+            directory = os.environ.get(METRICS_ENV)
+            _METRICS = Metrics(enabled=True, directory=directory) if directory else Metrics(enabled=False)
+
+        return _METRICS
+
+
+def set_metrics(metrics):
+    """Replace the process wide shared Metrics.
+
+    Also sets (or clears) SURFCAST_METRICS so that worker processes started afterwards record to the same directory.
+    """
+    global _METRICS
+    with _METRICS_LOCK:
+        _METRICS = metrics
+        if metrics.enabled:
+            os.environ[METRICS_ENV] = metrics.directory
+        else:
+            os.environ.pop(METRICS_ENV, None)
@@ -0,0 +1,162 @@
+"""
+noaa_cache.py
+-------------
+This module provide a class and methods for caching raw NOAA files on disk.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+# Local imports
+from surfcast import CACHE_DIR, CACHE_MAX_BYTES
+
+# Immutable NOAA filenames (gridded fields LYYYYDDDHH.N.EXT and map files)
+IMMUTABLE_FILENAME = re.compile(r'^[a-z]\d{9}\.\d+\.[a-z]+$|\.map$')
+
+
+class CacheMissError(Exception):
+    """Raised when an offline cache does not hold the requested url."""
+    pass
+
+
+class NOAACache(object):
+
+    """
+    Content addressed on-disk cache of raw NOAA files.
+
+    File contents are stored once under objects/ by their SHA-256 digest. An SQLite index maps each url (and its
+    filename) to a digest together with the ETag and Last-Modified headers used for conditional GETs and the last
+    access time used for LRU eviction.
+
+    NOAA gridded field and map filenames are immutable once published and are served from the cache without
+    revalidation. Anything else (e.g. directory listings) is revalidated with If-None-Match / If-Modified-Since.
+    In offline mode the network is never used and a miss raises CacheMissError.
+    """
+
+    def __init__(self, directory=None, max_bytes=CACHE_MAX_BYTES, offline=False):
+
+        # Set parameters
+        self.directory = directory if directory is not None else CACHE_DIR
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+        # Set attributes
+        self.objects_dir = os.path.join(self.directory, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'), timeout=60,
+                                          check_same_thread=False)
+        self._create_index_table()
+
+    def lookup(self, url):
+        """Get the index entry for url as a dictionary, or None if url is not cached."""
+        with self._lock:
+            row = self.connection.execute('select url, filename, digest, size, etag, last_modified, last_access '
+                                          'from entries where url=?', (url,)).fetchone()
+        if row is None or not os.path.isfile(self.get_path(digest=row[2])):
+            return None
+
+        return dict(zip(['url', 'filename', 'digest', 'size', 'etag', 'last_modified', 'last_access'], row))
+
+    def is_fresh(self, url):
+        """Check if the cached copy of url can be used without revalidation."""
+        return self.offline or IMMUTABLE_FILENAME.search(self._get_filename(url=url)) is not None
+
+    def get_path(self, digest):
+        """Get the object file path for a content digest."""
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def conditional_headers(self, entry):
+        """Get the revalidation headers for a cached entry."""
+        headers = dict()
+        if entry is not None and entry['etag'] is not None:
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry['last_modified'] is not None:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        return headers
+
+    def read(self, url):
+        """Read the cached content of url."""
+        entry = self.lookup(url=url)
+        if entry is None:
+            raise CacheMissError('{} is not in the raw file cache.'.format(url))
+        self.touch(url=url)
+        with open(self.get_path(digest=entry['digest']), 'rb') as file:
+            return file.read()
+
+    def open(self, url):
+        """Open the cached content of url as a binary file."""
+        entry = self.lookup(url=url)
+        if entry is None:
+            raise CacheMissError('{} is not in the raw file cache.'.format(url))
+        self.touch(url=url)
+
+        return open(self.get_path(digest=entry['digest']), 'rb')
+
+    def store(self, url, content, etag=None, last_modified=None):
+        """Store content for url."""
+        file = tempfile.NamedTemporaryFile(dir=self.objects_dir, delete=False)
+        with file:
+            file.write(content)
+
+        return self.store_file(url=url, path=file.name, digest=hashlib.sha256(content).hexdigest(),
+                               etag=etag, last_modified=last_modified)
+
+    def store_file(self, url, path, digest, etag=None, last_modified=None):
+        """Move a completely written temporary file into the cache as the content of url."""
+        object_path = self.get_path(digest=digest)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        os.replace(path, object_path)
+        with self._lock:
+            with self.connection:
+                self.connection.execute('insert or replace into entries values (?, ?, ?, ?, ?, ?, ?)',
+                                        (url, self._get_filename(url=url), digest, os.path.getsize(object_path),
+                                         etag, last_modified, time.time()))
+        self.evict()
+
+        return object_path
+
+    def touch(self, url):
+        """Mark url as recently used."""
+        with self._lock:
+            with self.connection:
+                self.connection.execute('update entries set last_access=? where url=?', (time.time(), url))
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            with self.connection:
+                total = self.connection.execute('select coalesce(sum(size), 0) from '
+                                                '(select distinct digest, size from entries)').fetchone()[0]
+                rows = self.connection.execute('select url, digest, size from entries '
+                                               'order by last_access').fetchall()
+                for url, digest, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self.connection.execute('delete from entries where url=?', (url,))
+                    if self.connection.execute('select 1 from entries where digest=?', (digest,)).fetchone() is None:
+                        if os.path.isfile(self.get_path(digest=digest)):
+                            os.remove(self.get_path(digest=digest))
+                        total -= size
+
+    def _create_index_table(self):
+        """Create the cache index table."""
+        with self._lock:
+            with self.connection:
+                self.connection.execute('create table if not exists entries (url text primary key, filename text, '
+                                        'digest text, size integer, etag text, last_modified text, '
+                                        'last_access real)')
+                self.connection.execute('create index if not exists entries_last_access on entries (last_access)')
+
+    @staticmethod
+    def _get_filename(url):
+        """Get the filename part of a url."""
+        return url.rstrip('/').split('/')[-1]
@@ -7,15 +7,30 @@ By: Sebastian D. Goodfellow, Ph.D., 2018
 
 # 3rd party imports
 import os
-import time
-import requests
+import re
 import pandas as pd
 from dateutil import tz
-from bs4 import BeautifulSoup
-from datetime import datetime
+from datetime import datetime, timedelta
+from collections import OrderedDict
 
 # Local imports
 from surfcast import DATA_DIR, NOAA_URL, EXTENSIONS, LAKES
+from surfcast.data.metrics import get_metrics
+from surfcast.data.noaa_fetcher import get_fetcher
+
+# Anchor hrefs holding a gridded fields filename of interest (LYYYYDDDHH.N.EXT)
+HREF_FILENAME = re.compile(r'(?i:<a\s[^>]*?href)\s*=\s*["\']?(?:[^"\'>]*/)?([{}]\d{{9}}\.\d+\.(?:{}))["\'\s>]'.format(
+    ''.join(LAKES), '|'.join(EXTENSIONS)))
+
+# Files DataFrame columns
+FILENAME_COLUMNS = ['filename', 'extension', 'filetype', 'lake', 'file_datetime', 'current_datetime', 'forecast',
+                    'url']
+
+# Hours between consecutive posts
+POST_INTERVALS = {'NCAST': 6, 'FCAST': 12}
+
+# Number of post intervals an expected post may be late before the directory listing is downloaded
+PROBE_GRACE_POSTS = 2
 
 
 class NOAADB(object):
@@ -30,12 +45,25 @@ class NOAADB(object):
     DDD  - Day Of Year at start of simulation (GMT)
     HH   - hr at start of simulation (GMT)
     N    - Site Number
+
+    In incremental mode high_water_marks holds, per db_type, the latest filename already seen for each
+    (lake letter, extension), e.g. {'NCAST': {('h', 'wav'): 'h202004718.0.wav'}}. Only files newer than their
+    high-water mark are kept and the noaa_db_{type}.csv snapshots are not rewritten.
+
+    In predict mode (incremental only) the filenames expected one post interval (NCAST 6 h, FCAST 12 h) after each
+    high-water mark, with the same site number, are probed with HEAD requests instead of downloading the directory
+    listing, following each hit with the next post. Pairs more than PROBE_GRACE_POSTS intervals behind the latest
+    (e.g. seasonal ice files) are probed at the next post only. The listing is downloaded on a miss: no high-water
+    marks, a stale pair posting again (its files since the gap are unknown), or no new post although the next one
+    is more than PROBE_GRACE_POSTS intervals late (e.g. a skipped post or a changed schedule).
     """
 
-    def __init__(self, process=True):
+    def __init__(self, process=True, high_water_marks=None, predict=False):
 
         # Set parameters
         self.process = process
+        self.high_water_marks = high_water_marks
+        self.predict = predict
 
         # Set attributes
         self.ncast_db = None
@@ -50,85 +78,126 @@ class NOAADB(object):
     def generate(self, db_type):
         """Generate current NCAST or FCAST database."""
         print('Pulling {} files...'.format(db_type.upper()))
-        # Get HTML from database page
-        html_obj = self._get_html_object(db_type=db_type.upper())
+        # Probe expected filenames
+        filenames = None
+        if self.predict and self.high_water_marks is not None:
+            filenames = self._predict_filenames(db_type=db_type.upper())
+
+        # Fall back to the directory listing
+        if filenames is None:
+            with get_metrics().span('list', db_type=db_type.lower()) as span:
+                # Get HTML from database page
+                html = self._get_html_object(db_type=db_type.upper())
 
-        # Get filename dictionaries from url
-        filename_dicts = self._get_filename_dicts(html_obj=html_obj, db_type=db_type.upper())
+                # Get filenames of interest from anchor hrefs
+                filenames = self._get_filenames(html=html, db_type=db_type.upper())
+                span.add(bytes=len(html), rows=len(filenames),
+                         retries=get_fetcher().retry_counts['{}{}/'.format(NOAA_URL, db_type.upper())])
 
         # Get DataFrame attribute
-        setattr(self, '{}_db'.format(db_type.lower()), pd.DataFrame(filename_dicts))
+        setattr(self, '{}_db'.format(db_type.lower()), self._get_filename_frame(filenames=filenames,
+                                                                                db_type=db_type.upper()))
         getattr(self, '{}_db'.format(db_type.lower())).sort_values(by=['file_datetime', 'lake', 'extension'],
                                                                    inplace=True, ascending=False)
         getattr(self, '{}_db'.format(db_type.lower())).reset_index(drop=True, inplace=True)
 
         # Save DataFrame as CSV
-        getattr(self, '{}_db'.format(db_type.lower())).to_csv(
-            os.path.join(DATA_DIR, 'noaa_db_{}.csv'.format(db_type.lower())), index=False)
-        print('Complete.')
-
-    def _get_filename_dicts(self, html_obj, db_type):
-        """Get filename from html object."""
-        # List for accepted filenames
-        filename_dicts = list()
-
-        # Loop through html tags
-        for link in html_obj.findAll('a', href=True):
-
-            # Get filename
-            filename = link.contents[0]
+        if self.high_water_marks is None:
+            getattr(self, '{}_db'.format(db_type.lower())).to_csv(
+                os.path.join(DATA_DIR, 'noaa_db_{}.csv'.format(db_type.lower())), index=False)
+        print('Complete: {} files.'.format(len(filenames)))
+
+    def _get_filenames(self, html, db_type):
+        """Get filenames of interest from the anchor hrefs of a directory listing."""
+        # Get high-water marks
+        high_water_marks = None if self.high_water_marks is None else self.high_water_marks.get(db_type, dict())
+
+        # Unique filenames in listing order
+        filenames = OrderedDict.fromkeys(match.group(1) for match in HREF_FILENAME.finditer(html))
+
+        return [filename for filename in filenames if self._is_new(filename=filename,
+                                                                   high_water_marks=high_water_marks)]
+
+    def _predict_filenames(self, db_type):
+        """Probe the filenames expected after the high-water marks, returning None on a miss."""
+        # Datetime and site number of the latest file of each lake and extension
+        high_water_marks = {key: datetime.strptime(filename[1:10], '%Y%j%H')
+                            for key, filename in self.high_water_marks.get(db_type, dict()).items()}
+        if len(high_water_marks) == 0:
+            return None
+        sites = {key: filename.split('.')[1] for key, filename in self.high_water_marks[db_type].items()}
+        interval = timedelta(hours=POST_INTERVALS[db_type])
+        grace = PROBE_GRACE_POSTS * interval
+        latest = max(high_water_marks.values())
+
+        # Expected datetime of the next file of each lake and extension, stale pairs at the next post
+        expected = {key: high_water_mark + interval for key, high_water_mark in high_water_marks.items()
+                    if latest - high_water_mark <= grace}
+        stale = {key: latest + interval for key in high_water_marks if key not in expected}
+
+        # Probe expected files until none appear, moving each file found on to the next post
+        filenames = list()
+        with get_metrics().span('probe', db_type=db_type.lower()) as span:
+            if len(stale) > 0:
+                urls = self._get_probe_urls(db_type=db_type, expected=stale, sites=sites)
+                exists = get_fetcher().exists_all(urls=list(urls.values()))
+                span.add(rows=len(urls))
+                resumed = [key for key in stale if exists[urls[key]]]
+                if len(resumed) > 0:
+                    print('{} files of {} posted again after a gap, pulling directory listing...'.format(
+                        db_type, ', '.join('{}.{}'.format(*key) for key in resumed)))
+                    return None
+            while len(expected) > 0:
+                urls = self._get_probe_urls(db_type=db_type, expected=expected, sites=sites)
+                exists = get_fetcher().exists_all(urls=list(urls.values()))
+                span.add(rows=len(urls))
+                expected = {key: date_time + interval for key, date_time in expected.items() if exists[urls[key]]}
+                filenames.extend(urls[key].split('/')[-1] for key in expected)
+                latest = max([latest] + [date_time - interval for date_time in expected.values()])
+
+        # Miss if the next post is overdue
+        if latest + interval + grace < self.current_datetime_GMT.replace(tzinfo=None):
+            print('{} post after {} is overdue, pulling directory listing...'.format(db_type, latest))
+            return None
+
+        return filenames
 
-            # Check filename
-            if self._check_filename(filename=filename):
-                filename_dicts.append(self._get_filename_dict(filename=filename, db_type=db_type))
-            else:
-                pass
-
-        return filename_dicts
-
-    def _get_filename_dict(self, filename, db_type):
-        """Generate a filename dictionary from a filename."""
-        # File extension
-        extension = filename.split('.')[-1]
-
-        # Lake label
-        lake = filename[0]
-
-        return {'filename': filename, 'extension': extension, 'filetype': EXTENSIONS[extension],
-                'lake': LAKES[lake], 'file_datetime': self._get_file_datetime(filename=filename),
-                'current_datetime': self.current_datetime_GMT, 'forecast': db_type,
-                'url': '{}{}/'.format(NOAA_URL, db_type)}
+    @staticmethod
+    def _get_probe_urls(db_type, expected, sites):
+        """Get the url of the file expected at a datetime for each lake and extension."""
+        return {key: '{}{}/{}{}.{}.{}'.format(NOAA_URL, db_type, key[0], date_time.strftime('%Y%j%H'), sites[key],
+                                              key[1])
+                for key, date_time in expected.items()}
+
+    def _get_filename_frame(self, filenames, db_type):
+        """Decode filenames into a files DataFrame in vectorized calls."""
+        df = pd.DataFrame({'filename': pd.Series(filenames, dtype=object)})
+        df['extension'] = df['filename'].str.split('.').str[-1]
+        df['filetype'] = df['extension'].map(EXTENSIONS)
+        df['lake'] = df['filename'].str[0].map(LAKES)
+        df['file_datetime'] = pd.to_datetime(df['filename'].str[1:10], format='%Y%j%H', utc=True)
+        df['current_datetime'] = self.current_datetime_GMT
+        df['forecast'] = db_type
+        df['url'] = '{}{}/'.format(NOAA_URL, db_type)
+
+        return df[FILENAME_COLUMNS]
 
     @staticmethod
     def _get_html_object(db_type):
-        """Get HTML object from url"""
-        html_obj = None
-        while html_obj is None:
-            try:
-                # Get HTML from database page
-                html = requests.get('{}{}/'.format(NOAA_URL, db_type.upper()))
-
-                # Create BeautifulSoup object
-                html_obj = BeautifulSoup(html.content)
-
-                return html_obj
+        """Get HTML text from url"""
+        # Get HTML from database page (revalidated against the raw file cache, retried by the fetcher's retry policy)
+        html = get_fetcher().fetch('{}{}/'.format(NOAA_URL, db_type.upper()))
 
-            except Exception:
-                print('Connection Error, retrying...')
-                time.sleep(1)
-                pass
+        return html.decode('utf-8', errors='replace')
 
     @staticmethod
-    def _get_file_datetime(filename):
-        """Extract the datetime as GMT from file name"""
-        file_datetime = datetime.strptime(filename.split('.')[0][1:len(filename.split('.')[0])], "%Y%j%H")
-        file_datetime = file_datetime.replace(tzinfo=tz.gettz('GMT'))
-        return file_datetime
+    def _is_new(filename, high_water_marks):
+        """Check if filename is newer than the high-water mark (latest filename) of its lake and extension.
 
-    @staticmethod
-    def _check_filename(filename):
-        """Check if filename is of interest."""
-        if filename.split('.')[-1] in EXTENSIONS.keys() and filename[0] in LAKES.keys():
+        YYYYDDDHH strings sort chronologically, so no datetime parsing is needed.
+        """
+        if high_water_marks is None:
             return True
-        else:
-            return False
+        high_water_mark = high_water_marks.get((filename[0], filename.split('.')[-1]))
+
+        return high_water_mark is None or filename[1:10] > high_water_mark[1:10]
@@ -0,0 +1,307 @@
+"""
+noaa_fetcher.py
+---------------
+This module provide a class and methods for concurrently downloading NOAA files over pooled keep-alive connections.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import hashlib
+import tempfile
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+# Local imports
+from surfcast.data.noaa_cache import NOAACache, CacheMissError
+from surfcast.data.retry import Retrier
+from surfcast.data.metrics import get_metrics
+
+# Default shared fetcher
+_FETCHER = None
+_FETCHER_LOCK = threading.Lock()
+
+# Environment variable holding the raw file cache directory of an offline shared fetcher
+OFFLINE_ENV = 'SURFCAST_OFFLINE'
+
+
+class NOAAFetcher(object):
+
+    """
+    Thread pool fetcher sharing one requests Session (keep-alive connection pool) across all downloads.
+
+    max_workers  - number of downloads in flight across all hosts
+    max_per_host - number of downloads in flight against a single host
+    cache        - NOAACache to read through, or None to always download
+    retry_policy - RetryPolicy for backoff, deadlines, circuit breakers and hedging (default RetryPolicy())
+    """
+
+    def __init__(self, max_workers=16, max_per_host=8, timeout=120, verify=False, verbose=False, cache=None,
+                 retry_policy=None):
+
+        # Set parameters
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.verify = verify
+        self.verbose = verbose
+        self.cache = cache
+
+        # Set attributes
+        self.session = self._create_session()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.retrier = Retrier(policy=retry_policy, verbose=self.verbose)
+        self._hedge_executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._host_semaphores = dict()
+        self._lock = threading.Lock()
+
+    def get(self, url, deadline=None, **kwargs):
+        """Send a GET request through the pooled session, retrying under the retry policy."""
+        return self.retry(url=url, func=lambda: self._send(url=url, **kwargs), deadline=deadline)
+
+    def retry(self, url, func, deadline=None):
+        """Call func() for url under the retry policy, e.g. to restart a stream that failed part way through."""
+        return self.retrier.call(url=url, func=func, deadline=deadline)
+
+    @property
+    def retry_counts(self):
+        """Number of retries per url."""
+        return self.retrier.retry_counts
+
+    def fetch(self, url, deadline=None):
+        """Get the content of url, reading through the raw file cache."""
+        if self.cache is None:
+            return self.get(url=url, deadline=deadline).content
+
+        # Serve immutable files (and everything when offline) straight from the cache
+        entry = self.cache.lookup(url=url)
+        if entry is not None and self.cache.is_fresh(url=url):
+            return self.cache.read(url=url)
+        if self.cache.offline:
+            raise CacheMissError('{} is not in the raw file cache (offline mode).'.format(url))
+
+        # Revalidate or download
+        response = self.get(url=url, deadline=deadline, headers=self.cache.conditional_headers(entry=entry))
+        if response.status_code == 304 and entry is not None:
+            return self.cache.read(url=url)
+        self.cache.store(url=url, content=response.content, etag=response.headers.get('ETag'),
+                         last_modified=response.headers.get('Last-Modified'))
+
+        return response.content
+
+    def get_text(self, url, deadline=None):
+        """Download a text file."""
+        return self.fetch(url=url, deadline=deadline).decode('utf-8', errors='replace')
+
+    def iter_chunks(self, url, chunk_size):
+        """Iterate over the content of url in chunks, reading through the raw file cache.
+
+        The server is sent a single request, so a stream is retried once, as a whole, by wrapping its parsing in
+        retry.
+        """
+        # Read from cache
+        if self.cache is not None and self.cache.lookup(url=url) is not None and self.cache.is_fresh(url=url):
+            with self.cache.open(url=url) as file:
+                for chunk in iter(lambda: file.read(chunk_size), b''):
+                    yield chunk
+            return
+        if self.cache is not None and self.cache.offline:
+            raise CacheMissError('{} is not in the raw file cache (offline mode).'.format(url))
+
+        # Stream from server
+        response = self._send(url=url, stream=True)
+        if self.cache is None:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                yield chunk
+            return
+
+        # Stream from server while writing to the cache
+        digest = hashlib.sha256()
+        file = tempfile.NamedTemporaryFile(dir=self.cache.objects_dir, delete=False)
+        try:
+            with file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    digest.update(chunk)
+                    file.write(chunk)
+                    yield chunk
+            self.cache.store_file(url=url, path=file.name, digest=digest.hexdigest(),
+                                  etag=response.headers.get('ETag'),
+                                  last_modified=response.headers.get('Last-Modified'))
+        finally:
+            if os.path.isfile(file.name):
+                os.remove(file.name)
+
+    def iter_lines(self, url, chunk_size):
+        """Iterate over the rows of url as bytes without line breaks."""
+        remainder = b''
+        for chunk in self.iter_chunks(url=url, chunk_size=chunk_size):
+            rows = (remainder + chunk).split(b'\n')
+            remainder = rows.pop()
+            for row in rows:
+                yield row
+        if remainder:
+            yield remainder
+
+    def get_size(self, url):
+        """Get the size of url in bytes from the raw file cache or a HEAD request, or 0 if unknown."""
+        entry = self.cache.lookup(url=url) if self.cache is not None else None
+        if entry is not None:
+            return entry['size']
+        if self.cache is not None and self.cache.offline:
+            return 0
+        try:
+            with self._get_host_semaphore(url=url):
+                response = self.session.head(url, verify=self.verify, timeout=self.timeout, allow_redirects=True)
+
+            return int(response.headers.get('Content-Length', 0))
+
+        except Exception:
+            return 0
+
+    def get_sizes(self, urls):
+        """Get the sizes of all urls concurrently and return a dictionary of url to size in bytes (0 if unknown)."""
+        futures = {url: self.executor.submit(self.get_size, url) for url in urls}
+
+        return {url: future.result() for url, future in futures.items()}
+
+    def exists(self, url, deadline=None):
+        """Check if url exists with a HEAD request, or a one byte range request if the server refuses HEAD.
+
+        Cached urls exist without a request, and when offline only cached urls exist.
+        """
+        if self.cache is not None and self.cache.lookup(url=url) is not None:
+            return True
+        if self.cache is not None and self.cache.offline:
+            return False
+
+        return self.retry(url=url, func=lambda: self._probe(url=url), deadline=deadline)
+
+    def exists_all(self, urls, deadline=None):
+        """Probe all urls concurrently and return a dictionary of url to existence."""
+        futures = {url: self.executor.submit(self.exists, url, deadline) for url in urls}
+
+        return {url: future.result() for url, future in futures.items()}
+
+    def fetch_all(self, urls, deadline=None, labels=None):
+        """Download all urls concurrently and return a dictionary of url to text.
+
+        One download span is recorded per url, labelled by labels[url] (default: its filename).
+        """
+        labels = labels if labels is not None else dict()
+        futures = {url: self.executor.submit(self._download_text, url, deadline, labels.get(url)) for url in urls}
+
+        return {url: future.result() for url, future in futures.items()}
+
+    def close(self):
+        """Shut down worker threads and close pooled connections."""
+        self.executor.shutdown(wait=True)
+        self._hedge_executor.shutdown(wait=True)
+        self.session.close()
+
+    def _download_text(self, url, deadline, labels):
+        """Download a text file inside a download span."""
+        labels = labels if labels is not None else dict(filename=url.rstrip('/').split('/')[-1])
+        with get_metrics().span('download', **labels) as span:
+            text = self.get_text(url=url, deadline=deadline)
+            span.add(bytes=len(text), retries=self.retry_counts[url])
+
+        return text
+
+    def _send(self, url, **kwargs):
+        """Send one GET attempt, hedging it with a second request if the first is slow to respond."""
+        hedge_after = self.retrier.policy.hedge_after
+        if hedge_after is None:
+            return self._request(url=url, **kwargs)
+
+        # Send hedged request if the first has not responded in time
+        futures = [self._hedge_executor.submit(self._request, url, **kwargs)]
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            futures.append(self._hedge_executor.submit(self._request, url, **kwargs))
+
+        # Use the first successful response, closing the other
+        while True:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    for pending in futures:
+                        pending.add_done_callback(_close_response)
+                    return future.result()
+                if not futures:
+                    raise future.exception()
+
+    def _request(self, url, **kwargs):
+        """Send a GET request, raising HTTPError on 4xx and 5xx responses."""
+        with self._get_host_semaphore(url=url):
+            response = self.session.get(url, verify=self.verify, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+
+        return response
+
+    def _probe(self, url):
+        """Send one HEAD (or range GET) attempt, returning False on 404 and raising HTTPError on other errors."""
+        with self._get_host_semaphore(url=url):
+            response = self.session.head(url, verify=self.verify, timeout=self.timeout, allow_redirects=True)
+            if response.status_code in (405, 501):
+                response = self.session.get(url, verify=self.verify, timeout=self.timeout, stream=True,
+                                            headers={'Range': 'bytes=0-0'})
+                response.close()
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+
+        return True
+
+    def _create_session(self):
+        """Create a requests Session with a connection pool large enough for all workers."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
+
+    def _get_host_semaphore(self, url):
+        """Get the semaphore limiting concurrent requests to the url's host."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+
+            return self._host_semaphores[host]
+
+
+def get_fetcher():
+    """Get the process wide shared NOAAFetcher, reading only from the raw file cache if SURFCAST_OFFLINE is set."""
+    global _FETCHER
+    with _FETCHER_LOCK:
+        if _FETCHER is None:
+            directory = os.environ.get(OFFLINE_ENV)
+            _FETCHER = NOAAFetcher(cache=NOAACache(directory=directory, offline=True) if directory else NOAACache())
+
+        return _FETCHER
+
+
+def set_fetcher(fetcher):
+    """Replace the process wide shared NOAAFetcher (e.g. with an offline cache).
+
+    Also sets (or clears) SURFCAST_OFFLINE so that worker processes started afterwards, e.g. the parse workers of
+    streamed posts, download through an offline cache too instead of going online.
+    """
+    global _FETCHER
+    with _FETCHER_LOCK:
+        _FETCHER = fetcher
+        if fetcher.cache is not None and fetcher.cache.offline:
+            os.environ[OFFLINE_ENV] = fetcher.cache.directory
+        else:
+            os.environ.pop(OFFLINE_ENV, None)
+
+
+def _close_response(future):
+    """Close the response of a losing hedged request."""
+    if future.exception() is None:
+        future.result().close()
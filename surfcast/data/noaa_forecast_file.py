@@ -6,21 +6,25 @@ By: Sebastian D. Goodfellow, Ph.D., 2018
 """
 
 # 3rd party imports
-import time
-import requests
+import os
 import numpy as np
 import pandas as pd
-import timeout_decorator
 from datetime import datetime
 
 
 # Local imports
 from surfcast import FILE_ATTRIBUTES
+from surfcast.data.metrics import get_metrics
+from surfcast.data.noaa_fetcher import get_fetcher
+
+# Streaming download chunk size (bytes)
+CHUNK_SIZE = 1024 * 1024
 
 
 class NOAAForecastFile(object):
 
-    def __init__(self, url, filename, filetype, lake, verbose=False):
+    def __init__(self, url, filename, filetype, lake, verbose=False, stream=False, text=None, deadline=None,
+                 db_type=None):
 
         # Set parameters
         self.url = url
@@ -28,54 +32,115 @@ class NOAAForecastFile(object):
         self.filetype = filetype
         self.lake = lake
         self.verbose = verbose
+        self.stream = stream
+        self.text = text
+        self.deadline = deadline
+        self.db_type = db_type
 
         # Set attributes
-        start_time = time.time()
-        self.text_file = self._download_file()
-        self.grid_count = self._get_grid_count()
-        self.hour_count = self._get_hour_count()
+        self.labels = dict(lake=self.lake, db_type=None if self.db_type is None else self.db_type.lower(),
+                           filename=self.filename)
+        if self.stream:
+            self.text_file = None
+            self.header_indices = None
+            self.grid_count = None
+            self.hour_count = None
+            self.map_name = None
+            self.grid_data = self._stream_grid_data()
+        else:
+            self.text_file = self._download_file() if self.text is None else self._split_text(text=self.text)
+            self.text = None
+            self.header_indices = self._get_header_indices()
+            self.grid_count = self._get_grid_count(header=self.text_file[0])
+            self.hour_count = self._get_hour_count()
+            self.map_name = self._get_map_name(header=self.text_file[0])
+            with get_metrics().span('parse', **self.labels) as span:
+                self.grid_data = self._get_grid_data()
+                span.add(rows=self.grid_data.shape[0])
+
+            # Release raw text
+            self.text_file = None
+            self.header_indices = None
         self.row_count = int(self.hour_count * self.grid_count)
-        self.map_name = self._get_map_name()
-        self.grid_data = self._get_grid_data()
-        print('{} {} processed: {} minutes'.format(self.lake, self.filename,
-                                                   np.round((time.time() - start_time) / 60., 4)))
+        if self.verbose:
+            print('{} {} processed'.format(self.lake, self.filename))
 
     def _download_file(self):
         """This function will download from the NOAA database text file corresponding to the filename and url
         input by the user and return a row delimited text file."""
-        """Get HTML object from url"""
-        text_file = None
         if self.verbose:
             print('Downloading NOAA file {}'.format(self.filename))
-        while text_file is None:
-            try:
-                # Send file request to server and download
-                start_time = time.time()
-                response = requests.get(self.url + self.filename, verify=False, timeout=120)
-                if self.verbose:
-                    print('Download complete: {} minutes'.format(np.round((time.time() - start_time) / 60., 4)))
-
-                # Parse text file by line breaks
-                start_time = time.time()
-                text_file = [row for row in response.text.split('\n')]
-                if self.verbose:
-                    print('Text parsing complete: {} minutes'.format(np.round((time.time() - start_time) / 60., 4)))
-
-                return text_file
-
-            except Exception:
-                if self.verbose:
-                    print('Connection Error, retrying...')
-                time.sleep(1)
-                pass
-
-    def _get_grid_count(self):
+
+        # Send file request to server and download (retried by the fetcher's retry policy)
+        with get_metrics().span('download', **self.labels) as span:
+            text = get_fetcher().get_text(self.url + self.filename, deadline=self.deadline)
+            span.add(bytes=len(text), retries=get_fetcher().retry_counts[self.url + self.filename])
+
+        # Parse text file by line breaks
+        return self._split_text(text=text)
+
+    def _stream_grid_data(self):
+        """Download the file in chunks and parse each hour block as it arrives without keeping the raw text.
+
+        A stream that fails part way through is restarted from the beginning under the fetcher's retry policy.
+        """
+        if self.verbose:
+            print('Streaming NOAA file {}'.format(self.filename))
+
+        # Download and parse are interleaved, so the whole stream is one parse span
+        with get_metrics().span('parse', stream=True, **self.labels) as span:
+            grid_data = get_fetcher().retry(url=self.url + self.filename, func=self._parse_stream,
+                                            deadline=self.deadline)
+            span.add(rows=grid_data.shape[0], retries=get_fetcher().retry_counts[self.url + self.filename])
+
+        return grid_data
+
+    def _parse_stream(self):
+        """Parse hour blocks as they arrive from the server or raw file cache.
+
+        Raises ValueError if the stream holds no hour header, e.g. an error page served in place of the file.
+        """
+        self.grid_count = None
+        self.map_name = None
+        blocks = list()
+        header = None
+        rows = list()
+        for row in get_fetcher().iter_lines(self.url + self.filename, chunk_size=CHUNK_SIZE):
+            if b'dat' in row:
+                if header is not None:
+                    blocks.append(self._parse_streamed_block(header=header, rows=rows))
+                header = row.decode('ascii')
+                rows = list()
+                if self.grid_count is None:
+                    self.grid_count = self._get_grid_count(header=header)
+                    self.map_name = self._get_map_name(header=header)
+            elif header is not None:
+                rows.append(row)
+        if header is None:
+            raise ValueError('NOAA file {} has no hour header.'.format(self.filename))
+        blocks.append(self._parse_streamed_block(header=header, rows=rows))
+        self.hour_count = len(blocks)
+
+        return blocks_to_frame(blocks=blocks, attributes=FILE_ATTRIBUTES[self.filetype])
+
+    @staticmethod
+    def _split_text(text):
+        """Split a text file by line breaks."""
+        return [row for row in text.split('\n')]
+
+    def _parse_streamed_block(self, header, rows):
+        """Parse a streamed hour block of raw byte rows."""
+        return parse_hour_block(header=header, rows=[b' '.join(rows).decode('ascii')],
+                                attribute_count=len(FILE_ATTRIBUTES[self.filetype]))
+
+    @staticmethod
+    def _get_grid_count(header):
         """Get number of grid point in file."""
-        return int(self.text_file[0].split()[-1])
+        return int(header.split()[-1])
 
-    def _get_map_name(self):
+    def _get_map_name(self, header):
         """Get the grid map name for file."""
-        map_name = self.text_file[0].split()[3].split('/')[-1]
+        map_name = header.split()[3].split('/')[-1]
         map_name = '{}.{}'.format(map_name.split('.')[0], 'map')
         if self.lake == 'superior':
             map_name = 'superior' + map_name.split('sup')[1]
@@ -84,51 +149,114 @@ class NOAAForecastFile(object):
 
     def _get_hour_count(self):
         """Get number of hours in file."""
-        return len([row for row in self.text_file if 'dat' in row])
+        return len(self.header_indices)
+
+    def _get_header_indices(self):
+        """Get the row index of each hourly 'dat' header in text file."""
+        return [idx for idx, row in enumerate(self.text_file) if 'dat' in row]
 
     def _get_grid_data(self):
         """Extract grid data from text file and save to DataFrame."""
-        # Set start time
-        start_time = time.time()
-
-        # Set current datetime
-        datetime_current = None
+        # Hour block boundaries
+        starts = self.header_indices
+        stops = self.header_indices[1:] + [len(self.text_file)]
 
-        # List to collect grid data
-        grid_data = list()
-
-        # Loop through test file rows
+        # Loop through hour blocks
         if self.verbose:
             print('Processing grid data: {} hours, '
                   '{} grid points, {} rows, {} attributes'.format(self.hour_count, self.grid_count, self.row_count,
                                                                   len(FILE_ATTRIBUTES[self.filetype])))
-        for row in self.text_file:
+        blocks = [parse_hour_block(header=self.text_file[start], rows=self.text_file[start + 1:stop],
+                                   attribute_count=len(FILE_ATTRIBUTES[self.filetype]))
+                  for start, stop in zip(starts, stops)]
+
+        return blocks_to_frame(blocks=blocks, attributes=FILE_ATTRIBUTES[self.filetype])
 
-            # Check for header
-            if 'dat' in row:
 
-                # Parse row string
-                row = row.split()
+class NOAAFileResult(object):
 
-                # Set datetime from header
-                datetime_current = datetime.strptime(row[0] + row[1] + row[2], "%Y%j%H")
+    """
+    Compact result of a NOAAForecastFile processed in a worker process.
 
-            elif 'dat' not in row and len(row.split()) != 0:
+    The grid data columns are written to .npy files in directory and memory-mapped back on first access to
+    grid_data, after which the files are removed. Only this small metadata object is pickled between processes.
+    """
 
-                # Parse row string
-                row = row.split()
+    def __init__(self, noaa_file, directory):
 
-                # Create row dictionary
-                row_dict = {'datetime': datetime_current, 'grid_number': np.int16(row[0])}
-                row_dict.update({key: val for key, val in zip(FILE_ATTRIBUTES[self.filetype], row[1:])})
+        # Set attributes
+        self.url = noaa_file.url
+        self.filename = noaa_file.filename
+        self.filetype = noaa_file.filetype
+        self.lake = noaa_file.lake
+        self.grid_count = noaa_file.grid_count
+        self.hour_count = noaa_file.hour_count
+        self.row_count = noaa_file.row_count
+        self.map_name = noaa_file.map_name
+        self.text_file = None
+        self.paths = self._save_columns(grid_data=noaa_file.grid_data, directory=directory)
+        self._grid_data = None
 
-                # Collect grid data
-                grid_data.append(row_dict)
+    @property
+    def grid_data(self):
+        """Grid data DataFrame, memory-mapped from the worker's column files."""
+        if self._grid_data is None:
+            self._grid_data = pd.DataFrame({column: np.load(path, mmap_mode='r')
+                                            for column, path in self.paths.items()})
+            for path in self.paths.values():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
 
-            else:
-                pass
+        return self._grid_data
 
-        if self.verbose:
-            print('Grid data formatting complete: {} minutes\n'.format(np.round((time.time() - start_time) / 60., 4)))
+    def _save_columns(self, grid_data, directory):
+        """Save each grid data column as a .npy file."""
+        paths = dict()
+        for column in grid_data.columns:
+            paths[column] = os.path.join(directory, '{}.{}.npy'.format(self.filename, column))
+            np.save(paths[column], np.ascontiguousarray(grid_data[column].values))
+
+        return paths
+
+
+def parse_hour_block(header, rows, attribute_count):
+    """Convert an hour block (header row plus grid rows) into typed arrays.
+
+    Returns a tuple (datetime, grid_number, values) where grid_number is int32 with shape [grid_count] and values
+    is float32 with shape [grid_count, attribute_count]. Raises ValueError if the block does not hold exactly the
+    header's grid count of rows of attribute_count + 1 values.
+    """
+    # Set datetime and grid count from header
+    header = header.split()
+    date_time = np.datetime64(datetime.strptime(header[0] + header[1] + header[2], '%Y%j%H'), 'ns')
+    grid_count = int(header[-1])
+
+    # Parse all grid rows in a single call
+    data = np.fromstring(' '.join(rows), dtype=np.float64, sep=' ')
+    if data.size != grid_count * (attribute_count + 1):
+        raise ValueError('Hour block {} has {} values, expected {} grid points x {} columns.'.format(
+            date_time, data.size, grid_count, attribute_count + 1))
+    data = data.reshape(grid_count, attribute_count + 1)
+
+    return date_time, data[:, 0].astype(np.int32), data[:, 1:].astype(np.float32)
+
+
+def blocks_to_frame(blocks, attributes):
+    """Stack parsed hour blocks into a long format grid data DataFrame."""
+    if len(blocks) == 0:
+        return pd.DataFrame(columns=['datetime', 'grid_number'] + list(attributes))
+
+    # Stack blocks
+    block_sizes = [grid_number.shape[0] for _, grid_number, _ in blocks]
+    date_times = np.repeat(np.array([date_time for date_time, _, _ in blocks]), block_sizes)
+    grid_numbers = np.concatenate([grid_number for _, grid_number, _ in blocks])
+    values = np.concatenate([block_values for _, _, block_values in blocks])
+
+    # Create DataFrame
+    grid_data = pd.DataFrame({'datetime': date_times, 'grid_number': grid_numbers})
+    for idx, attribute in enumerate(attributes):
+        grid_data[attribute] = values[:, idx]
 
-        return pd.DataFrame(grid_data)
+    return grid_data
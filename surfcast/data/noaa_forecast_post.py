@@ -6,78 +6,121 @@ By: Sebastian D. Goodfellow, Ph.D., 2018
 """
 
 # 3rd party imports
-import time
+import shutil
+import tempfile
 import numpy as np
 import pandas as pd
 from functools import reduce
 from joblib import Parallel, delayed
 
 # Local imports
-from surfcast import LAKES
-from surfcast.data.noaa_forecast_file import NOAAForecastFile
+from surfcast.data.retry import Deadline
+from surfcast.data.metrics import get_metrics
+from surfcast.data.noaa_fetcher import get_fetcher
+from surfcast.data.noaa_forecast_file import NOAAForecastFile, NOAAFileResult
 
 
 class NOAAForecastPost(object):
 
-    def __init__(self, df, datetime, db_type):
+    def __init__(self, df, datetime, db_type, stream=False, fetcher=None, n_jobs=-1):
 
         # Set parameters
         self.df = df
         self.datetime = datetime
         self.db_type = db_type
+        self.stream = stream
+        self.fetcher = fetcher if fetcher is not None else get_fetcher()
+        self.n_jobs = n_jobs
 
         # Set attributes
-        start_time = time.time()
+        self.deadline = Deadline(self.fetcher.retrier.policy.post_deadline)
         print('{} {} forecast processing...'.format(self.db_type, self.datetime))
+        self.texts = self._fetch_post()
         self.lake_posts = self._process_post_parallel()
-        print('Processing complete: {} minutes'.format(np.round((time.time() - start_time) / 60., 4)))
+        self.texts = None
+        print('Processing complete')
 
-    def _process_post(self):
-        """Process a NOAA forecast post."""
-        # Empty list for post
-        lake_posts = dict()
+    def _process_post_parallel(self):
+        """Parallel process a NOAA forecast post with one task per file, largest files first.
+
+        Workers take the next task as soon as they are free, so lakes on 2 km grids no longer keep one worker busy
+        while the workers given 5 and 10 km lakes sit idle.
+        """
+        # Order files by size
+        sizes = self._get_file_sizes()
+        order = sorted(self.df.index, key=lambda df_index: sizes[df_index], reverse=True)
+
+        # Process files, returning column files plus metadata instead of pickled frames
+        directory = tempfile.mkdtemp(prefix='surfcast_')
+        try:
+            noaa_files = Parallel(n_jobs=self.n_jobs, batch_size=1, pre_dispatch='all')(
+                delayed(self._process_file)(self.df.loc[df_index, 'url'], self.df.loc[df_index, 'filename'],
+                                            self.df.loc[df_index, 'filetype'], self.df.loc[df_index, 'lake'],
+                                            self.stream, self.texts.pop(self.df.loc[df_index, 'filename'], None),
+                                            directory, self.deadline, self.db_type)
+                for df_index in order)
+
+            # Assemble lake posts
+            return self._get_lake_posts(noaa_files=noaa_files)
+
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
 
-        # Loop through post files
-        for lake in self.df['lake'].unique():
+    @staticmethod
+    def _process_file(url, filename, filetype, lake, stream, text, directory, deadline=None, db_type=None):
+        """Wrapper for NOAAForecastFile for parallel calls, returning a compact NOAAFileResult."""
+        noaa_file = NOAAForecastFile(url=url, filename=filename, filetype=filetype, lake=lake, verbose=False,
+                                     stream=stream, text=text, deadline=deadline, db_type=db_type)
 
-            # Process lake post
-            lake_posts[lake] = NOAALakePost(df=self.df[self.df['lake'] == lake], datetime=self.datetime,
-                                            db_type=self.db_type, lake=lake)
+        return NOAAFileResult(noaa_file=noaa_file, directory=directory)
 
-        return lake_posts
+    def _get_lake_posts(self, noaa_files):
+        """Assemble processed NOAA files into lake posts."""
+        noaa_files = {noaa_file.filename: noaa_file for noaa_file in noaa_files}
 
-    def _process_post_parallel(self):
-        """Parallel process a NOAA forecast post."""
-        # Processes lake posts
-        outputs = Parallel(n_jobs=-1)(delayed(self._process_lake_post)(idx, self.df, self.db_type, self.datetime)
-                                      for idx in range(len(LAKES)))
+        return {lake: NOAALakePost(df=self.df[self.df['lake'] == lake], datetime=self.datetime, db_type=self.db_type,
+                                   lake=lake, noaa_files=[noaa_files[filename] for filename
+                                                          in self.df.loc[self.df['lake'] == lake, 'filename']])
+                for lake in self.df['lake'].unique()}
 
-        # Gather data
-        lake_posts = {output.lake: output for output in outputs}
+    def _get_file_sizes(self):
+        """Get the size of each file in bytes, from its downloaded text or its Content-Length."""
+        # Request the sizes of streamed files concurrently
+        sizes = self.fetcher.get_sizes(urls=[url + filename for url, filename
+                                             in zip(self.df['url'], self.df['filename']) if filename not in self.texts])
 
-        return lake_posts
+        return {df_index: len(self.texts[filename]) if filename in self.texts else sizes[url + filename]
+                for df_index, url, filename in zip(self.df.index, self.df['url'], self.df['filename'])}
 
-    @staticmethod
-    def _process_lake_post(idx, df, db_type, datetime):
-        """Wrapper for NOAALakePost for parallel calls."""
-        # Get inputs
-        lake = list(LAKES.values())[idx]
+    def _fetch_post(self):
+        """Download every file in the post concurrently, returning a dictionary of filename to text."""
+        # Streamed files are downloaded and parsed by each NOAAForecastFile
+        if self.stream:
+            return dict()
 
-        return NOAALakePost(df=df[df['lake'] == lake], datetime=datetime, db_type=db_type, lake=lake)
+        # Issue all downloads at once
+        urls = {url + filename: filename for url, filename in zip(self.df['url'], self.df['filename'])}
+        texts = {urls[url]: text for url, text in self.fetcher.fetch_all(
+            urls=list(urls), deadline=self.deadline, labels=get_file_labels(df=self.df, db_type=self.db_type)).items()}
+        print('{} files downloaded'.format(len(texts)))
+
+        return texts
 
 
 class NOAALakePost(object):
 
-    def __init__(self, df, datetime, db_type, lake):
+    def __init__(self, df, datetime, db_type, lake, stream=False, texts=None, noaa_files=None):
 
         # Set parameters
         self.df = df
         self.datetime = datetime
         self.db_type = db_type
         self.lake = lake
+        self.stream = stream
+        self.texts = texts if texts is not None else dict()
 
         # Set attributes
-        self.noaa_files = list()
+        self.noaa_files = noaa_files
         self.year = self.datetime.split('-')[0]
         self.filenames = list()
         self.grid_count = None
@@ -91,26 +134,53 @@ class NOAALakePost(object):
 
     def _process_lake(self):
         """Process specific lake post."""
-        # Loop through files
-        for idx, df_index, noaa_file in zip(range(self.df.shape[0]), self.df.index, self.df['filename']):
-
-            # Process NOAA file
-            noaa_file = NOAAForecastFile(url=self.df.loc[df_index, 'url'],
-                                         filename=self.df.loc[df_index, 'filename'],
-                                         filetype=self.df.loc[df_index, 'filetype'],
-                                         lake=self.df.loc[df_index, 'lake'],
-                                         verbose=False)
-            self.noaa_files.append(noaa_file)
-            self.filenames.append(noaa_file.filename)
-
-            if idx == 0:
-                self.grid_count = noaa_file.grid_count
-                self.hour_count = noaa_file.hour_count
-                self.row_count = noaa_file.row_count
-                self.map_name = noaa_file.map_name
+        # Process NOAA files, unless processed by the caller
+        if self.noaa_files is None:
+            self.noaa_files = [NOAAForecastFile(url=self.df.loc[df_index, 'url'],
+                                                filename=self.df.loc[df_index, 'filename'],
+                                                filetype=self.df.loc[df_index, 'filetype'],
+                                                lake=self.df.loc[df_index, 'lake'],
+                                                verbose=False, stream=self.stream,
+                                                text=self.texts.pop(self.df.loc[df_index, 'filename'], None),
+                                                db_type=self.db_type)
+                               for df_index in self.df.index]
+
+        # Set attributes from files
+        self.filenames = [noaa_file.filename for noaa_file in self.noaa_files]
+        self.grid_count = self.noaa_files[0].grid_count
+        self.hour_count = self.noaa_files[0].hour_count
+        self.row_count = self.noaa_files[0].row_count
+        self.map_name = self.noaa_files[0].map_name
 
         # Concatenate grid data
-        self.grid_data = reduce(lambda left, right: pd.merge(left, right, on=['datetime', 'grid_number']),
-                                [file.grid_data for file in self.noaa_files])
-        self.grid_data['map'] = self.map_name
-        self.grid_data['lake'] = self.lake
+        with get_metrics().span('merge', lake=self.lake, db_type=self.db_type.lower()) as span:
+            self.grid_data = self._merge_grid_data(grid_data=[file.grid_data for file in self.noaa_files])
+            self.grid_data['map'] = self.map_name
+            self.grid_data['lake'] = self.lake
+            span.add(rows=self.grid_data.shape[0])
+
+    @staticmethod
+    def _merge_grid_data(grid_data):
+        """Merge file grid data on (datetime, grid_number).
+
+        Files of the same lake and post cover the same hours and grid points in the same order, so when the keys of
+        every file match the attribute columns are stacked side by side (without copying under Copy-on-Write). A join
+        is used otherwise.
+        """
+        keys = ['datetime', 'grid_number']
+        if all(NOAALakePost._keys_match(left=grid_data[0], right=right, keys=keys) for right in grid_data[1:]):
+            return pd.concat([grid_data[0]] + [right.drop(columns=keys) for right in grid_data[1:]], axis=1)
+
+        return reduce(lambda left, right: pd.merge(left, right, on=keys), grid_data)
+
+    @staticmethod
+    def _keys_match(left, right, keys):
+        """Check if two grid data DataFrames have identical keys in identical order."""
+        return left.shape[0] == right.shape[0] and all(np.array_equal(left[key].values, right[key].values)
+                                                       for key in keys)
+
+
+def get_file_labels(df, db_type):
+    """Get the metrics span labels of each file url in a files DataFrame."""
+    return {url + filename: dict(lake=lake, db_type=db_type.lower(), filename=filename)
+            for url, filename, lake in zip(df['url'], df['filename'], df['lake'])}
@@ -6,73 +6,145 @@ By: Sebastian D. Goodfellow, Ph.D., 2018
 """
 
 # 3rd party imports
-import time
-import requests
+import os
+import hashlib
+import tempfile
 import numpy as np
 import pandas as pd
 
 
 # Local imports
-from surfcast import MAP_URL, MAP_ATTRIBUTES
+from surfcast import MAP_URL, MAP_ATTRIBUTES, GRID_FILES_DIR, MAP_CACHE_DIR
+from surfcast.data.metrics import get_metrics
+from surfcast.data.noaa_fetcher import get_fetcher
+
+
+# Streaming download chunk size (bytes)
+CHUNK_SIZE = 256 * 1024
+
+# Structured array dtype of parsed map files
+MAP_DTYPE = np.dtype([(key['name'], key['dtype']) for key in MAP_ATTRIBUTES])
 
 
 class NOAAMapFile(object):
 
-    def __init__(self, filename):
+    """
+    Map file grid points (sequence number, fortran column and row, lat, lon and depth).
+
+    Map files are read from the first local directory holding a copy (archive/GetData/GridFiles by default), then
+    from the raw file cache, and only downloaded from NOAA if neither has it (set local=False to always download).
+    Parsed maps are kept as .npy sidecars in MAP_CACHE_DIR keyed by the SHA-256 of the map text, so each map is
+    parsed once.
+    """
+
+    def __init__(self, filename, stream=False, local=True, directories=None, verbose=False):
 
         # Set parameters
         self.filename = filename
+        self.stream = stream
+        self.local = local
+        self.directories = directories if directories is not None else [GRID_FILES_DIR]
+        self.verbose = verbose
 
         # Set attributes
-        self.text_file = self._download_file()
-        self.grid_count = len(self.text_file)
-        self.map_data = self._get_map_data()
+        self.text_file = None
+        self.map_data = self._load_map_data()
+        self.grid_count = self.map_data.shape[0]
+
+    def _load_map_data(self):
+        """Load map data from a local copy, the raw file cache or NOAA."""
+        content = self._read_local_file() if self.local else None
+        if content is None and self.stream:
+            return self._stream_map_data()
+        if content is None:
+            content = self._download_file()
+
+        return self._get_map_data(content=content)
+
+    def _read_local_file(self):
+        """Read the map file from a local directory or the raw file cache, or None if there is no local copy."""
+        for directory in self.directories:
+            path = os.path.join(directory, self.filename)
+            if os.path.isfile(path):
+                with open(path, 'rb') as file:
+                    return file.read()
+
+        cache = get_fetcher().cache
+        if cache is not None and cache.lookup(url=MAP_URL + self.filename) is not None:
+            return cache.read(url=MAP_URL + self.filename)
+
+        return None
 
     def _download_file(self):
         """This function will download from the NOAA map text file corresponding to the filename
-        input by the user and return a row delimited text file."""
-        """Get HTML object from url"""
-        text_file = None
-        print('Downloading NOAA map file {}'.format(self.filename))
-        while text_file is None:
-            try:
-                # Send file request to server and download
-                start_time = time.time()
-                response = requests.get(url=MAP_URL + self.filename, verify=False, timeout=60)
-                print('Download complete: {} minutes'.format(np.round((time.time() - start_time) / 60., 4)))
-
-                # Parse text file by line breaks
-                start_time = time.time()
-                text_file = [row for row in response.text.split('\n')]
-                print('Text parsing complete: {} minutes'.format(np.round((time.time() - start_time) / 60., 4)))
-
-                return text_file
-
-            except Exception:
-                print('Connection Error, retrying...')
-                time.sleep(1)
-                pass
-
-    def _get_map_data(self):
-        """Extract grid data from map file and format as DataFrame."""
-        # List to collect grid data
-        grid_data = list()
-
-        # Set start time
-        start_time = time.time()
-
-        for row in self.text_file:
-            if len(row.split()) != 0:
-
-                # Parse row string
-                row = row.split()
-
-                # Create row dictionary
-                row_dict = {key['name']: key['dtype'](val) for key, val in zip(MAP_ATTRIBUTES, row)}
-
-                # Collect grid data
-                grid_data.append(row_dict)
-
-        print('Map data formatted: {} minutes'.format(np.round((time.time() - start_time) / 60., 4)))
-
-        return pd.DataFrame(grid_data)
+        input by the user and return its content."""
+        if self.verbose:
+            print('Downloading NOAA map file {}'.format(self.filename))
+
+        # Send file request to server and download (retried by the fetcher's retry policy)
+        with get_metrics().span('download', filename=self.filename) as span:
+            content = get_fetcher().fetch(url=MAP_URL + self.filename)
+            span.add(bytes=len(content), retries=get_fetcher().retry_counts[MAP_URL + self.filename])
+
+        return content
+
+    def _stream_map_data(self):
+        """Download the map file in chunks and parse each chunk as it arrives without keeping the raw text.
+
+        A stream that fails part way through is restarted from the beginning under the fetcher's retry policy.
+        """
+        if self.verbose:
+            print('Streaming NOAA map file {}'.format(self.filename))
+
+        # Download and parse are interleaved, so the whole stream is one parse span
+        with get_metrics().span('parse', stream=True, filename=self.filename) as span:
+            map_data = get_fetcher().retry(url=MAP_URL + self.filename, func=self._parse_stream)
+            span.add(rows=map_data.shape[0], retries=get_fetcher().retry_counts[MAP_URL + self.filename])
+
+        return map_data
+
+    def _parse_stream(self):
+        """Parse complete rows of each chunk from the server or raw file cache, carrying partial rows over."""
+        chunks = list()
+        remainder = b''
+        for chunk in get_fetcher().iter_chunks(url=MAP_URL + self.filename, chunk_size=CHUNK_SIZE):
+            chunk = remainder + chunk
+            end = chunk.rfind(b'\n') + 1
+            chunks.append(np.fromstring(chunk[:end].decode('ascii'), dtype=np.float64, sep=' '))
+            remainder = chunk[end:]
+        chunks.append(np.fromstring(remainder.decode('ascii'), dtype=np.float64, sep=' '))
+        data = np.concatenate(chunks).reshape(-1, len(MAP_ATTRIBUTES))
+
+        # Cast columns
+        return pd.DataFrame({key['name']: data[:, idx].astype(key['dtype']) for idx, key in enumerate(MAP_ATTRIBUTES)})
+
+    def _get_map_data(self, content):
+        """Get map data from the sidecar of the map text, parsing and saving it if there is none."""
+        path = os.path.join(MAP_CACHE_DIR, '{}.npy'.format(hashlib.sha256(content).hexdigest()))
+        if os.path.isfile(path):
+            return pd.DataFrame(np.load(path))
+
+        with get_metrics().span('parse', filename=self.filename) as span:
+            map_data = parse_map_text(content=content)
+            span.add(bytes=len(content), rows=map_data.shape[0])
+
+        # Save sidecar atomically
+        os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(dir=MAP_CACHE_DIR, delete=False)
+        with file:
+            np.save(file, map_data)
+        os.replace(file.name, path)
+
+        return pd.DataFrame(map_data)
+
+
+def parse_map_text(content):
+    """Parse map file text (bytes or str) into a structured array with one MAP_DTYPE record per grid point."""
+    if isinstance(content, bytes):
+        content = content.decode('ascii')
+    data = np.fromstring(content, dtype=np.float64, sep=' ').reshape(-1, len(MAP_ATTRIBUTES))
+    map_data = np.empty(data.shape[0], dtype=MAP_DTYPE)
+    for idx, key in enumerate(MAP_ATTRIBUTES):
+        map_data[key['name']] = data[:, idx]
+
+    return map_data
@@ -0,0 +1,194 @@
+"""
+retry.py
+--------
+This module provide classes and methods for retrying NOAA requests with backoff, deadlines and circuit breakers.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import time
+import random
+import threading
+import requests
+from collections import Counter
+from concurrent.futures import TimeoutError
+from urllib.parse import urlsplit
+
+
+class RetryError(Exception):
+    """Raised when a request runs out of attempts or time."""
+    pass
+
+
+class CircuitOpenError(RetryError):
+    """Raised when requests to a host are suspended by its circuit breaker."""
+    pass
+
+
+class RetryPolicy(object):
+
+    """
+    Retry settings shared by all NOAA requests.
+
+    max_attempts  - attempts per request, including the first
+    base_delay    - backoff before the second attempt (s), doubled on each further attempt
+    max_delay     - upper bound on a single backoff (s)
+    file_deadline - time allowed for one file, including retries (s)
+    post_deadline - time allowed for all files of a forecast post (s)
+    hedge_after   - send a second, hedged request if the first has not answered after this many seconds (None = off)
+    failure_threshold, reset_timeout - consecutive failures that open a host's circuit breaker, and how long it stays
+                                       open before a trial request is let through (s)
+    """
+
+    def __init__(self, max_attempts=6, base_delay=1., max_delay=30., file_deadline=600., post_deadline=3600.,
+                 hedge_after=None, failure_threshold=5, reset_timeout=60.):
+
+        # Set parameters
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.file_deadline = file_deadline
+        self.post_deadline = post_deadline
+        self.hedge_after = hedge_after
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def backoff(self, attempt):
+        """Get the jittered exponential backoff (s) after a failed attempt (0 = first attempt)."""
+        return random.uniform(0., min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class Deadline(object):
+
+    """Point in time after which no further attempts are made."""
+
+    def __init__(self, seconds):
+        self.expires = None if seconds is None else time.time() + seconds
+
+    def remaining(self):
+        """Get the time left (s), or None if unbounded."""
+        return None if self.expires is None else self.expires - time.time()
+
+    def earliest(self, other):
+        """Get the earlier of this deadline and other."""
+        if other is None or other.expires is None:
+            return self
+        if self.expires is None or other.expires < self.expires:
+            return other
+
+        return self
+
+
+class CircuitBreaker(object):
+
+    """Stop sending requests to a host after repeated consecutive failures, then let one trial request through.
+
+    Until the trial request succeeds or fails, every other request is refused as if the circuit were still open.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+
+        # Set parameters
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        # Set attributes
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self, host):
+        """Raise CircuitOpenError if the circuit is open, letting one trial request through after reset_timeout."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if self.probing or time.time() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError('Circuit open for {} after {} consecutive failures.'.format(host, self.failures))
+            self.probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def release(self):
+        """End a trial request that neither succeeded nor failed, e.g. one that raised a non-retryable error."""
+        with self._lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+
+class Retrier(object):
+
+    """Run calls under a RetryPolicy with a circuit breaker per host, recording retry counts per url."""
+
+    def __init__(self, policy=None, verbose=False):
+
+        # Set parameters
+        self.policy = policy if policy is not None else RetryPolicy()
+        self.verbose = verbose
+
+        # Set attributes
+        self.retry_counts = Counter()
+        self._breakers = dict()
+        self._lock = threading.Lock()
+
+    def call(self, url, func, deadline=None):
+        """Call func() until it succeeds, a non-retryable error is raised, or attempts or time run out."""
+        host = urlsplit(url).netloc
+        breaker = self._get_breaker(host=host)
+        deadline = Deadline(self.policy.file_deadline).earliest(deadline)
+        attempt = 0
+        while True:
+            breaker.before_call(host=host)
+            try:
+                result = func()
+                breaker.record_success()
+                return result
+
+            except Exception as exception:
+                if not is_retryable(exception=exception):
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+
+                # Back off, unless out of attempts or time
+                attempt += 1
+                delay = self.policy.backoff(attempt=attempt - 1)
+                remaining = deadline.remaining()
+                if attempt >= self.policy.max_attempts or (remaining is not None and remaining < delay):
+                    raise RetryError('Giving up on {} after {} attempts: {}'.format(url, attempt, exception))
+                with self._lock:
+                    self.retry_counts[url] += 1
+                if self.verbose:
+                    print('Connection Error, retrying {} in {:.1f} s...'.format(url, delay))
+                time.sleep(delay)
+
+    def _get_breaker(self, host):
+        """Get the circuit breaker for a host."""
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(failure_threshold=self.policy.failure_threshold,
+                                                      reset_timeout=self.policy.reset_timeout)
+
+            return self._breakers[host]
+
+
+def is_retryable(exception):
+    """Check if a failed request is worth retrying (connection problems, timeouts, 5xx and 429 responses).
+
+    Anything else, e.g. a ValueError from parsing a streamed file, fails fast, so a malformed file is not downloaded
+    max_attempts times and fails the same way whether it is streamed or downloaded first.
+    """
+    if isinstance(exception, requests.HTTPError) and exception.response is not None:
+        return exception.response.status_code >= 500 or exception.response.status_code == 429
+
+    return isinstance(exception, (requests.RequestException, OSError, TimeoutError))
@@ -0,0 +1,131 @@
+"""
+spatial_index.py
+----------------
+This module provide a class and methods for mapping coordinates to the nearest map file grid points.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# Local imports
+from surfcast import DATA_DIR, MAP_FILES
+
+# Set spatial index directory
+SPATIAL_INDEX_DIR = os.path.join(DATA_DIR, 'spatial_index')
+
+# Mean Earth radius (km)
+EARTH_RADIUS = 6371.0088
+
+
+class GridSpatialIndex(object):
+
+    """
+    KD-tree over the grid points of a map file.
+
+    Grid points are projected to 3D Cartesian coordinates on a sphere so that Euclidean (chord) distances are
+    monotonic in great circle distance. Longitudes follow the map file convention of decimal degrees W.
+    """
+
+    def __init__(self, map_name, sequence_number, lat, lon):
+
+        # Set parameters
+        self.map_name = map_name
+        self.sequence_number = np.asarray(sequence_number, dtype=np.int32)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+
+        # Set attributes
+        self.tree = cKDTree(project(lat=self.lat, lon=self.lon))
+
+    @classmethod
+    def from_map_data(cls, map_name, map_data):
+        """Create spatial index from a map data DataFrame."""
+        return cls(map_name=map_name, sequence_number=map_data['sequence_number'].values,
+                   lat=map_data['lat'].values, lon=map_data['lon'].values)
+
+    @classmethod
+    def from_table(cls, map_name, connection):
+        """Create spatial index from a SQLite map table."""
+        map_data = pd.read_sql_query('select sequence_number, lat, lon from {}'.format(map_name.split('.')[0]),
+                                     connection)
+
+        return cls.from_map_data(map_name=map_name, map_data=map_data)
+
+    @staticmethod
+    def load(map_name, directory=None):
+        """Load a saved spatial index from directory (default SPATIAL_INDEX_DIR), or None if it has not been saved."""
+        directory = directory if directory is not None else SPATIAL_INDEX_DIR
+        path = os.path.join(directory, '{}.pkl'.format(map_name.split('.')[0]))
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+    def save(self, directory=None):
+        """Save spatial index to directory (default SPATIAL_INDEX_DIR)."""
+        directory = directory if directory is not None else SPATIAL_INDEX_DIR
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, '{}.pkl'.format(self.map_name.split('.')[0])), 'wb') as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def nearest(self, lat, lon, k=1):
+        """Get the k nearest grid points to each coordinate.
+
+        Returns (distance, sequence_number) arrays of shape [n, k] with distances in km.
+        """
+        distance, index = self.tree.query(project(lat=lat, lon=lon), k=k)
+        distance = np.asarray(distance).reshape(-1, k)
+        index = np.asarray(index).reshape(-1, k)
+
+        return chord_to_arc(distance), self.sequence_number[index]
+
+    def within_radius(self, lat, lon, radius):
+        """Get the grid points within radius (km) of each coordinate.
+
+        Returns a list with one array of sequence numbers per coordinate.
+        """
+        indices = self.tree.query_ball_point(project(lat=lat, lon=lon), r=arc_to_chord(radius))
+
+        return [self.sequence_number[np.asarray(index, dtype=np.int64)] for index in indices]
+
+
+def get_spatial_index(map_name, connection, rebuild=False):
+    """Load the saved spatial index for a map file, building and saving it from SQLite if needed."""
+    spatial_index = None if rebuild else GridSpatialIndex.load(map_name=map_name)
+    if spatial_index is None:
+        spatial_index = GridSpatialIndex.from_table(map_name=map_name, connection=connection)
+        spatial_index.save()
+
+    return spatial_index
+
+
+def get_lake_map_name(lake):
+    """Get the map file name used for a lake."""
+    for map_name in MAP_FILES:
+        if map_name.startswith(lake.strip().lower()):
+            return map_name
+
+    return None
+
+
+def project(lat, lon):
+    """Project lat (degrees N) and lon (degrees W) to 3D Cartesian coordinates (km)."""
+    lat = np.radians(np.atleast_1d(np.asarray(lat, dtype=np.float64)))
+    lon = -np.radians(np.atleast_1d(np.asarray(lon, dtype=np.float64)))
+
+    return EARTH_RADIUS * np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_arc(distance):
+    """Convert chord distance (km) to great circle distance (km)."""
+    return 2. * EARTH_RADIUS * np.arcsin(np.clip(distance / (2. * EARTH_RADIUS), 0., 1.))
+
+
+def arc_to_chord(distance):
+    """Convert great circle distance (km) to chord distance (km)."""
+    return 2. * EARTH_RADIUS * np.sin(np.minimum(distance, np.pi * EARTH_RADIUS) / (2. * EARTH_RADIUS))
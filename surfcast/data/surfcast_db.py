@@ -7,33 +7,78 @@ By: Sebastian D. Goodfellow, Ph.D., 2018
 
 # 3rd party imports
 import os
+import time
 import sqlite3
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from collections import OrderedDict
 
 # Local imports
-from surfcast.data.noaa_db import NOAADB
-from surfcast import DATA_DIR, MAP_FILES, LAKES
-from surfcast.data.noaa_map_file import NOAAMapFile
-from surfcast.data.noaa_forecast_post import NOAAForecastPost
+from surfcast import DATA_DIR, MAP_FILES, LAKES, FILE_ATTRIBUTES
+from surfcast.data.metrics import get_metrics
+from surfcast.data.cube_store import CubeStore
+from surfcast.data.frame_store import FrameStore
+from surfcast.data.codec import get_codec
+from surfcast.forecast.surf_score import SurfScore, SPOT_CONFIG_PATH, SCORE_VARIABLES
+
+# Download, ingestion and spatial index modules (requests, joblib, scipy) are imported by the methods using them so
+# that queries start without loading them
+
+# Grid data attribute columns
+GRID_DATA_ATTRIBUTES = [attribute for attributes in FILE_ATTRIBUTES.values() for attribute in attributes]
+
+# Number of nearest grid points stored per surf spot
+SPOT_GRID_POINTS = 4
+
+# Number of lake query results kept in the forecast cache
+FORECAST_CACHE_SIZE = 128
+
+# Grid data storage backends (long format rows in SQLite tables, memory-mapped cubes, or both)
+STORAGE_BACKENDS = ['rows', 'cube', 'both']
 
 
 class SurfcastDB(object):
 
-    def __init__(self):
+    def __init__(self, storage='rows', path=None, render=False, quantize=False):
+
+        # Set parameters
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError('Unknown storage {}, expected one of {}.'.format(storage, STORAGE_BACKENDS))
+        self.storage = storage
+        self.path = path if path is not None else os.path.join(DATA_DIR, 'surfcast_db.sqlite3')
+        self.render = render
+        self.quantize = quantize
 
         # Set attributes
         self.connection = None
         self.cursor = None
+        self._forecast_cache = OrderedDict()
+        self._surf_score = None
+        self._quantized_tables = dict()
 
         # Create SQLite DB
         self._connect_to_db()
+        self.cube_store = CubeStore(connection=self.connection)
+        self.frame_store = FrameStore(connection=self.connection)
+
+    def update_files_tables(self, incremental=False, predict=False):
+        """Update NCAST and FCAST files database with most recent files in NOAA database.
+
+        Set incremental=True to only hand filenames newer than the latest file of each lake, extension and db_type
+        already in the files tables downstream.
+
+        Set predict=True (implies incremental) to probe the filenames expected after the latest files instead of
+        downloading the directory listings, which are only downloaded on a miss.
+
+        Returns the number of files pulled.
+        """
+        from surfcast.data.noaa_db import NOAADB
 
-    def update_files_tables(self):
-        """Update NCAST and FCAST files database with most recent files in NOAA database."""
         print('Pulling most recent NOAA files...')
         # Get current NOAA database
-        noaa_db = NOAADB(process=True)
+        high_water_marks = self._get_high_water_marks() if incremental or predict else None
+        noaa_db = NOAADB(process=True, high_water_marks=high_water_marks, predict=predict)
 
         # Update NCAST files
         print('\nUpdating NCAST files...')
@@ -43,26 +88,285 @@ class SurfcastDB(object):
         print('Updating FCAST files...')
         self._df_to_table(df=noaa_db.fcast_db, db_type='fcast')
 
-    def update_grid_data_tables(self):
-        """Update NCAST and FCAST grid data database with most recent files in NOAA database."""
-        # Update grid data for all non-committed NCAST NOAA files
-        self._update_grid_data_table(db_type='ncast')
+        # Aggregate recorded metrics
+        get_metrics().write_prometheus()
+
+        return noaa_db.ncast_db.shape[0] + noaa_db.fcast_db.shape[0]
+
+    def _get_high_water_marks(self):
+        """Get the latest filename in the files tables for each db_type, lake letter and extension."""
+        high_water_marks = dict()
+        for db_type in ['ncast', 'fcast']:
+            # The bare filename column is taken from the row holding the max
+            self.cursor.execute('select substr(filename, 1, 1), extension, filename, max(substr(filename, 2, 9)) '
+                                'from {}_files group by 1, 2'.format(db_type))
+            high_water_marks[db_type.upper()] = {(lake, extension): filename for lake, extension, filename, _
+                                                 in self.cursor.fetchall()}
+
+        return high_water_marks
+
+    def update_grid_data_tables(self, stream=False, pipeline=False):
+        """Update NCAST and FCAST grid data database with most recent files in NOAA database.
+
+        Set stream=True to parse NOAA files hour block by hour block while they download instead of holding the
+        full raw text of each file in memory.
 
+        Set pipeline=True to overlap downloading, parsing and writing of consecutive posts with an IngestPipeline
+        (stream is ignored).
+
+        Set the SURFCAST_METRICS environment variable to a directory (or call metrics.set_metrics) to record per stage
+        metrics to metrics.jsonl and metrics.prom in that directory.
+        """
         # Update grid data for all non-committed NCAST NOAA files
-        self._update_grid_data_table(db_type='fcast')
+        self._update_grid_data_table(db_type='ncast', stream=stream, pipeline=pipeline)
 
-    def _update_grid_data_table(self, db_type):
+        # Update grid data for all non-committed NCAST NOAA files
+        self._update_grid_data_table(db_type='fcast', stream=stream, pipeline=pipeline)
+
+        # Aggregate recorded metrics
+        get_metrics().write_prometheus()
+
+    def watch(self, poll_interval=300, stream=False, pipeline=False, max_polls=None):
+        """Poll for the next NCAST and FCAST posts by probing their expected filenames, ingesting new files as soon
+        as they appear.
+
+        Runs until interrupted, or for max_polls polls.
+        """
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            if self.update_files_tables(predict=True) > 0:
+                self.update_grid_data_tables(stream=stream, pipeline=pipeline)
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(poll_interval)
+
+    def get_spot_forecast(self, spot, start, end, variables=None, db_type='fcast'):
+        """Get the forecast time series at one or more surf spots.
+
+        spot      - surf spot name, or a list of names
+        start     - first datetime (GMT) of the time series
+        end       - last datetime (GMT) of the time series
+        variables - grid data attributes to return, defaults to all
+        db_type   - 'fcast' or 'ncast'
+
+        Each spot uses its nearest grid point in spot_grid_points. Returns a DataFrame indexed by datetime for a
+        single spot, or a dictionary of spot name to DataFrame for a list of spots. All spots on a lake are read with
+        one query per lake-year table, and query results are cached until new data is pushed for the lake.
+        """
+        # Get inputs
+        spots = [spot] if isinstance(spot, str) else list(spot)
+        variables = GRID_DATA_ATTRIBUTES if variables is None else list(variables)
+        for variable in variables:
+            if variable not in GRID_DATA_ATTRIBUTES:
+                raise ValueError('Unknown variable {}, expected one of {}.'.format(variable, GRID_DATA_ATTRIBUTES))
+        start_hour, end_hour = datetime_to_epoch_hours(values=[_to_utc_datetime64(start), _to_utc_datetime64(end)])
+
+        # Get spot grid points
+        spot_points = pd.read_sql_query(
+            'select spot, lake, sequence_number from spot_grid_points where neighbor=0 and spot in ({})'.format(
+                ', '.join('?' * len(spots))), self.connection, params=spots)
+        missing = set(spots) - set(spot_points['spot'])
+        if len(missing) > 0:
+            raise ValueError('Unknown surf spots: {}'.format(', '.join(sorted(missing))))
+
+        # Loop through lakes
+        forecasts = dict()
+        for lake, lake_points in spot_points.groupby('lake'):
+
+            # Get lake grid data
+            grid_numbers = tuple(sorted(set(lake_points['sequence_number'].astype(int))))
+            grid_data = self._get_lake_grid_data(lake=lake, db_type=db_type, grid_numbers=grid_numbers,
+                                                 start_hour=int(start_hour), end_hour=int(end_hour),
+                                                 variables=tuple(variables))
+
+            # Split into spot time series
+            for name, sequence_number in zip(lake_points['spot'], lake_points['sequence_number']):
+                forecast = grid_data[grid_data['grid_number'] == sequence_number]
+                forecasts[name] = forecast.drop(columns='grid_number').set_index('datetime')
+
+        if isinstance(spot, str):
+            return forecasts[spot]
+
+        return {name: forecasts[name] for name in spots}
+
+    def get_point_forecast(self, lat, lon, lake, start, end, variables=None, db_type='fcast', min_depth=0.):
+        """Get forecast time series bilinearly interpolated at arbitrary coordinates on a lake.
+
+        lat       - latitude(s) in decimal degrees N
+        lon       - longitude(s) in decimal degrees W, as in the map files
+        lake      - lake name, e.g. 'ontario'
+        start     - first datetime (GMT) of the time series
+        end       - last datetime (GMT) of the time series
+        variables - grid data attributes to return, defaults to all
+        db_type   - 'fcast' or 'ncast'
+        min_depth - grid points shallower than min_depth (m) are not used, see GridInterpolator.weights
+
+        Only the grid points around the coordinates are read, through the forecast cache. Directions are interpolated
+        as unit vectors. Returns a long format DataFrame with one row per (point, datetime), point being the position
+        of the coordinate in lat and lon.
+        """
+        from surfcast.data.spatial_index import get_lake_map_name
+        from surfcast.data.grid_interpolator import get_grid_interpolator
+
+        # Get inputs
+        lat, lon = np.atleast_1d(lat).astype(np.float64), np.atleast_1d(lon).astype(np.float64)
+        variables = GRID_DATA_ATTRIBUTES if variables is None else list(variables)
+        for variable in variables:
+            if variable not in GRID_DATA_ATTRIBUTES:
+                raise ValueError('Unknown variable {}, expected one of {}.'.format(variable, GRID_DATA_ATTRIBUTES))
+        map_name = get_lake_map_name(lake=lake)
+        if map_name is None:
+            raise ValueError('Unknown lake {}.'.format(lake))
+        start_hour, end_hour = datetime_to_epoch_hours(values=[_to_utc_datetime64(start), _to_utc_datetime64(end)])
+
+        # Get interpolation weights
+        weights = get_grid_interpolator(map_name=map_name, connection=self.connection).weights(
+            lat=lat, lon=lon, min_depth=min_depth)
+
+        # Get grid data of the weighted grid points as [hour, grid point] arrays
+        grid_data = self._get_lake_grid_data(lake=lake.strip().lower(), db_type=db_type,
+                                             grid_numbers=tuple(int(number) for number in weights.grid_numbers),
+                                             start_hour=int(start_hour), end_hour=int(end_hour),
+                                             variables=tuple(variables))
+        datetimes = np.unique(grid_data['datetime'].values)
+        rows = np.searchsorted(datetimes, grid_data['datetime'].values)
+        columns = np.searchsorted(weights.grid_numbers, grid_data['grid_number'].values)
+
+        # Interpolate all points and hours of each variable at once
+        forecast = pd.DataFrame({'point': np.tile(np.arange(len(lat)), len(datetimes)),
+                                 'lat': np.tile(lat, len(datetimes)), 'lon': np.tile(lon, len(datetimes)),
+                                 'datetime': np.repeat(datetimes, len(lat))})
+        for variable in variables:
+            values = np.full((len(datetimes), len(weights.grid_numbers)), np.nan)
+            values[rows, columns] = grid_data[variable].values
+            forecast[variable] = weights.interpolate(values=values, grid_numbers=weights.grid_numbers,
+                                                     circular=variable.endswith('_direction')).ravel()
+
+        return forecast.sort_values(by=['point', 'datetime']).reset_index(drop=True)
+
+    def _get_lake_grid_data(self, lake, db_type, grid_numbers, start_hour, end_hour, variables):
+        """Get grid data for a set of grid points and an hour range of a lake, reading through the forecast cache."""
+        # Check cache
+        key = (lake, db_type, grid_numbers, start_hour, end_hour, variables)
+        if key in self._forecast_cache:
+            self._forecast_cache.move_to_end(key)
+            return self._forecast_cache[key]
+
+        # Enumerate hours so that (datetime, grid_number) are both primary key equality lookups
+        hours = ', '.join(str(hour) for hour in range(start_hour, end_hour + 1))
+        grid_numbers_sql = ', '.join(str(grid_number) for grid_number in grid_numbers)
+
+        # Query each lake-year table in range
+        years = range(pd.Timestamp(epoch_hours_to_datetime(values=[start_hour])[0]).year,
+                      pd.Timestamp(epoch_hours_to_datetime(values=[end_hour])[0]).year + 1)
+        tables = ['{}_{}_{}_grid_data'.format(lake, year, db_type) for year in years]
+        grid_data = [pd.DataFrame(columns=['datetime', 'grid_number'] + list(variables))]
+        for table in [table for table in tables if self._table_exists(name=table)]:
+            table_data = pd.read_sql_query(
+                'select datetime, grid_number, {} from {} where datetime in ({}) and grid_number in ({}) '
+                'order by datetime'.format(', '.join(variables), table, hours, grid_numbers_sql), self.connection)
+
+            # Decode quantized attributes
+            if self._is_quantized_grid_data_table(name=table):
+                for variable in variables:
+                    table_data[variable] = get_codec(attribute=variable).decode(codes=table_data[variable].values)
+            grid_data.append(table_data)
+        grid_data = pd.concat(grid_data[1:], ignore_index=True) if len(grid_data) > 1 else grid_data[0]
+        grid_data['datetime'] = epoch_hours_to_datetime(values=grid_data['datetime'].values)
+
+        # Update cache
+        self._forecast_cache[key] = grid_data
+        if len(self._forecast_cache) > FORECAST_CACHE_SIZE:
+            self._forecast_cache.popitem(last=False)
+
+        return grid_data
+
+    def get_best_spots(self, start=None, hours=48, count=10, lake=None, db_type='fcast'):
+        """Rank surf spots by their best precomputed score in a time window.
+
+        start   - first datetime (GMT) of the window, defaults to this hour
+        hours   - length of the window in hours
+        count   - number of spots to return
+        lake    - only rank spots on this lake (e.g. 'ontario'), defaults to all lakes
+        db_type - 'fcast' or 'ncast'
+
+        Reads the spot_scores table filled as posts are pushed, nothing is rescored. Returns a DataFrame with one row
+        per spot, best first, holding the datetime of its best score and the score inputs at that hour.
+        """
+        # Get window (truncated to the hour)
+        start = pd.Timestamp.utcnow() if start is None else start
+        start_hour = int(datetime_to_epoch_hours(values=[_to_utc_datetime64(start)])[0])
+
+        # Get best hour of each spot (SQLite takes bare columns from the row holding the max)
+        lake_sql = '' if lake is None else ' and lake = ?'
+        best_spots = pd.read_sql_query(
+            'select spot, lake, datetime, max(score) as score, onshore_wind, {} from spot_scores '
+            'where db_type = ? and datetime between ? and ?{} group by spot order by score desc limit ?'.format(
+                ', '.join(SCORE_VARIABLES), lake_sql), self.connection,
+            params=[db_type, start_hour, start_hour + hours - 1] + ([lake.lower()] if lake is not None else []) +
+            [count])
+        best_spots['datetime'] = epoch_hours_to_datetime(values=best_spots['datetime'].values)
+
+        return best_spots
+
+    def get_lake_cube(self, lake, datetime, db_type='fcast'):
+        """Get the grid data of a lake post as a memory-mapped ForecastCube of shape [hour, grid point, variable].
+
+        Only available for posts pushed with storage='cube' or storage='both'. datetime is the post datetime as in
+        the files tables.
+        """
+        return self.cube_store.read(lake=lake, datetime=datetime, db_type=db_type)
+
+    def render_frames(self, lake=None, db_type='fcast', variables=None):
+        """Render map frames of stored cubes without frames (see FrameStore), returning the number of posts rendered.
+
+        Posts pushed with render=True are rendered as they are pushed, this renders posts stored before.
+        """
+        cubes = self.cube_store.list(lake=lake, db_type=db_type)
+        count = 0
+        for cube_lake, post in zip(cubes['lake'], cubes['post']):
+            if self.frame_store.has_frames(lake=cube_lake, datetime=post, db_type=db_type):
+                continue
+            with get_metrics().span('render', lake=cube_lake, db_type=db_type):
+                self.frame_store.render_cube(cube=self.get_lake_cube(lake=cube_lake, datetime=post, db_type=db_type),
+                                             datetime=post, variables=variables)
+            count += 1
+
+        return count
+
+    def _invalidate_forecast_cache(self, lake, db_type):
+        """Drop cached query results for a lake."""
+        for key in [key for key in self._forecast_cache if key[0] == lake and key[1] == db_type]:
+            del self._forecast_cache[key]
+
+    def _update_grid_data_table(self, db_type, stream=False, pipeline=False):
         """Update NCAST or FCAST grid data database with most recent files in NOAA database."""
-        # Get DataFrame of all non-committed NOAA files
-        df = pd.read_sql_query('select * from {}_files where committed is null;'.format(db_type), self.connection)
+        from surfcast.data.retry import RetryError
+        from surfcast.data.ingest_pipeline import IngestPipeline
+        from surfcast.data.noaa_forecast_post import NOAAForecastPost
+
+        # Get DataFrame of all non-committed NOAA files, oldest post first so that newer forecasts of the same hours
+        # overwrite older ones
+        df = pd.read_sql_query('select * from {}_files where committed is null order by file_datetime;'.format(
+            db_type), self.connection)
+
+        # Overlap download, parse and write stages
+        if pipeline:
+            IngestPipeline(surfcast_db=self, db_type=db_type).run(df=df)
+            return
+
         print('Processing {} {} forecasts...'.format(len(df['file_datetime'].unique()), db_type.upper()))
 
         # Loop through unique datetimes
         for idx, date_time in enumerate(df['file_datetime'].unique()):
 
-            # Process forecast post
-            forecast_post = NOAAForecastPost(df=df[df['file_datetime'] == date_time],
-                                             datetime=date_time, db_type=db_type)
+            # Process forecast post, leaving it uncommitted for the next update if its downloads fail
+            try:
+                forecast_post = NOAAForecastPost(df=df[df['file_datetime'] == date_time],
+                                                 datetime=date_time, db_type=db_type, stream=stream)
+            except RetryError as exception:
+                print('Skipping {} {} forecast: {}'.format(db_type.upper(), date_time, exception))
+                continue
 
             # Push forecast
             self._push_forecast_post(forecast_post=forecast_post, db_type=db_type)
@@ -73,48 +377,133 @@ class SurfcastDB(object):
         """Push forecast post into SQLite tables."""
         # Loop through lake posts
         for lake, post in forecast_post.lake_posts.items():
+            self._push_lake_post(post=post, db_type=db_type)
+
+    def _push_lake_post(self, post, db_type):
+        """Push lake post into SQLite tables and/or the cube store."""
+        # Push grid data
+        with get_metrics().span('write', lake=post.lake, db_type=db_type, storage=self.storage) as span:
+            if self.storage in ['rows', 'both']:
+                self._push_grid_data(post=post, db_type=db_type)
+            if self.storage in ['cube', 'both']:
+                self.cube_store.write(post=post, db_type=db_type)
+            span.add(rows=post.grid_data.shape[0])
+
+        # Score surf spots
+        self._push_spot_scores(post=post, db_type=db_type)
 
-            # Push grid data
-            self._push_grid_data(post=post, db_type=db_type)
+        # Render map frames of the lake
+        if self.render:
+            with get_metrics().span('render', lake=post.lake, db_type=db_type) as span:
+                self.frame_store.render(post=post, db_type=db_type)
+                span.add(rows=post.grid_data.shape[0])
 
-            # Update files table with grid attributes
-            self._update_files_table_grid_attributes(post=post, db_type=db_type)
+        # Update files table with grid attributes
+        self._update_files_table_grid_attributes(post=post, db_type=db_type)
+
+        # Drop stale query results
+        self._invalidate_forecast_cache(lake=post.lake, db_type=db_type)
 
     def _push_grid_data(self, post, db_type):
         """Push grid data from forecast and lake combination."""
         # Check if table exists
         self._create_grid_data_table(db_type=db_type, year=post.year, lake=post.lake)
 
-        # Push grid data
-        post.grid_data.to_sql(name='{}_{}_{}_grid_data'.format(post.lake, post.year, db_type), con=self.connection,
-                              if_exists='append', index=False)
+        # Typed column values
+        attributes = [attribute for attribute in GRID_DATA_ATTRIBUTES if attribute in post.grid_data.columns]
+        columns = ['datetime', 'grid_number', 'map', 'lake'] + attributes
+        values = [datetime_to_epoch_hours(values=post.grid_data['datetime'].values).tolist(),
+                  post.grid_data['grid_number'].values.astype(np.int64).tolist(),
+                  post.grid_data['map'].tolist(), post.grid_data['lake'].tolist()]
+
+        # NOAA text values have at most 3 decimals, rounding (or quantizing) drops float32 representation noise
+        if self._is_quantized_grid_data_table(name='{}_{}_{}_grid_data'.format(post.lake, post.year, db_type)):
+            values.extend(get_codec(attribute=attribute).encode_sql(values=post.grid_data[attribute].values)
+                          for attribute in attributes)
+        else:
+            values.extend(np.round(post.grid_data[attribute].values.astype(np.float64), 4).tolist()
+                          for attribute in attributes)
+
+        # Push grid data, updating only the pushed columns of rows already pushed by other files of the post
+        with self.connection:
+            self.cursor.executemany(
+                'insert into {}_{}_{}_grid_data ({}) values ({}) on conflict (datetime, grid_number) do update set '
+                '{}'.format(post.lake, post.year, db_type, ', '.join(columns), ', '.join('?' * len(columns)),
+                            ', '.join('{0}=excluded.{0}'.format(column) for column in columns[2:])), zip(*values))
+
+    def _push_spot_scores(self, post, db_type):
+        """Score the surf spots of a lake post and push the scores into the spot_scores table."""
+        # Get surf score engine, scoring needs surf spots mapped to grid points
+        surf_score = self._get_surf_score()
+        if surf_score is None or not self._table_exists(name='spot_grid_points'):
+            return
+
+        # Get nearest grid point of each surf spot on the lake
+        self.cursor.execute('select spot, sequence_number from spot_grid_points where neighbor=0 and lake=?',
+                            (post.lake,))
+        spot_grid_numbers = dict(self.cursor.fetchall())
+
+        # Score all spots and hours at once
+        with get_metrics().span('score', lake=post.lake, db_type=db_type) as span:
+            scores = surf_score.score_grid_data(grid_data=post.grid_data, spot_grid_numbers=spot_grid_numbers)
+            span.add(rows=scores.shape[0])
+        if scores.shape[0] == 0:
+            return
+
+        # Later posts replace the scores of earlier posts for the same hours
+        columns = ['spot', 'db_type', 'datetime', 'lake', 'score', 'onshore_wind'] + SCORE_VARIABLES
+        values = [scores['spot'].tolist(), [db_type] * scores.shape[0],
+                  datetime_to_epoch_hours(values=scores['datetime'].values).tolist(), [post.lake] * scores.shape[0]]
+        values.extend(np.round(scores[column].values.astype(np.float64), 4).tolist() for column in columns[4:])
+        with self.connection:
+            self.cursor.executemany('insert or replace into spot_scores ({}) values ({})'.format(
+                ', '.join(columns), ', '.join('?' * len(columns))), zip(*values))
+
+    def _get_surf_score(self):
+        """Get the surf score engine, or None without a surf spot config."""
+        if self._surf_score is None and os.path.isfile(SPOT_CONFIG_PATH):
+            self._surf_score = SurfScore()
+
+        return self._surf_score
 
     def _update_files_table_grid_attributes(self, post, db_type):
         """Update files table with grid attributes (grid count, hours, rows)."""
-        # Loop through lake filenames
-        for filename in post.filenames:
-
-            # Update files table with grid attributes
-            values = ('true', '{}_{}_{}_grid_data'.format(post.lake, post.year, db_type),
-                      post.grid_count, post.hour_count, post.row_count, post.map_name, filename)
-            self.cursor.execute('update {}_files set committed=?, table_name=?, grid_count=?, hour_count=?, '
-                                'row_count=?, map_name=? where filename=?'.format(db_type), values)
-            self.connection.commit()
+        # Row values for lake filenames
+        values = [('true', '{}_{}_{}_grid_data'.format(post.lake, post.year, db_type),
+                   post.grid_count, post.hour_count, post.row_count, post.map_name, filename)
+                  for filename in post.filenames]
+
+        # Update files table with grid attributes
+        with self.connection:
+            self.cursor.executemany('update {}_files set committed=?, table_name=?, grid_count=?, hour_count=?, '
+                                    'row_count=?, map_name=? where filename=?'.format(db_type), values)
 
     def _connect_to_db(self):
         """Connect to SQLite database."""
-        if not os.path.isfile(os.path.join(DATA_DIR, 'surfcast_db.sqlite3')):
+        if not os.path.isfile(self.path):
             print('Creating new database...\n')
             self._create_sqlite_db()
         else:
             print('Connecting to existing database...\n')
-            self.connection = sqlite3.connect(os.path.join(DATA_DIR, 'surfcast_db.sqlite3'))
+            self.connection = sqlite3.connect(self.path)
             self.cursor = self.connection.cursor()
 
+            # Add filename indexes to files tables created before they existed
+            self._create_files_table(db_type='ncast')
+            self._create_files_table(db_type='fcast')
+
+            # Rewrite untyped grid data tables
+            self.migrate_grid_data_tables()
+
+            # Add spot grid points and spot scores tables to databases created before they existed
+            if not self._table_exists(name='spot_grid_points'):
+                self._create_spot_grid_points_table()
+            self._create_spot_scores_table()
+
     def _create_sqlite_db(self):
         """Create a SQLite database if one does not exist."""
         # Create database connection
-        self.connection = sqlite3.connect(os.path.join(DATA_DIR, 'surfcast_db.sqlite3'))
+        self.connection = sqlite3.connect(self.path)
 
         # Create cursor
         self.cursor = self.connection.cursor()
@@ -137,12 +526,21 @@ class SurfcastDB(object):
         # Add surf spots tables
         self._create_surf_spot_table()
 
+        # Add spot scores table
+        self._create_spot_scores_table()
+
     def _create_files_table(self, db_type):
         """Create NCAST or FCAST files table."""
         self.cursor.execute(
             'create table if not exists {}_files (committed, table_name, filename, extension, '
             'filetype, lake, file_datetime, current_datetime, forecast, url, grid_count, '
             'hour_count, row_count, map_name)'.format(db_type))
+
+        # Remove duplicate filenames and add unique filename index
+        self.cursor.execute('delete from {0}_files where rowid not in '
+                            '(select min(rowid) from {0}_files group by filename)'.format(db_type))
+        self.cursor.execute('create unique index if not exists {0}_files_filename '
+                            'on {0}_files (filename)'.format(db_type))
         self.connection.commit()
 
     def _create_grid_data_tables(self, db_type):
@@ -152,25 +550,115 @@ class SurfcastDB(object):
             self._create_grid_data_table(db_type=db_type, year=year, lake=lake)
 
     def _create_grid_data_table(self, db_type, year, lake):
-        """Create NCAST or FCAST files table."""
+        """Create NCAST or FCAST grid data table."""
+        self._create_typed_grid_data_table(name='{}_{}_{}_grid_data'.format(lake, year, db_type),
+                                           quantize=self.quantize)
+
+    def _create_typed_grid_data_table(self, name, quantize=False):
+        """Create a grid data table keyed by (datetime, grid_number).
+
+        datetime is stored as integer hours since the Unix epoch (GMT) and attributes are stored as REAL, or as
+        INTEGER codes of their codec if quantize=True (see codec.CODECS). Existing tables keep their attribute type.
+        """
         self.cursor.execute(
-            'create table if not exists {}_{}_{}_grid_data '
-            '(datetime, grid_number, map, lake, '
-            'wave_height, wave_direction, wave_period, '
-            'wind_speed, wind_direction, '
-            'surface_temperature, '
-            'current_speed, current_direction, '
-            'ice_concentration, ice_thickness, ice_speed, ice_direction)'.format(lake, year, db_type))
+            'create table if not exists {} '
+            '(datetime integer not null, grid_number integer not null, map text, lake text, {}, '
+            'primary key (datetime, grid_number)) without rowid'.format(
+                name, ', '.join('{} {}'.format(attribute, 'integer' if quantize else 'real')
+                                for attribute in GRID_DATA_ATTRIBUTES)))
         self.connection.commit()
+        self._quantized_tables.pop(name, None)
+
+    def quantize_grid_data_tables(self):
+        """Rewrite REAL grid data tables with quantized INTEGER attributes, returning the number of tables rewritten.
+
+        Values are rounded to the resolution of their codec, which is lossless for values read from NOAA text.
+        """
+        # Get grid data tables
+        self.cursor.execute("select name from sqlite_master where type='table' and name like '%\\_grid_data' "
+                            "escape '\\'")
+        names = [name for name, in self.cursor.fetchall() if not self._is_quantized_grid_data_table(name=name)]
+
+        # Loop through REAL tables
+        for name in names:
+            print('Quantizing {}...'.format(name))
+
+            # Copy codes into quantized table
+            self.cursor.execute('alter table {0} rename to {0}_real'.format(name))
+            self._create_typed_grid_data_table(name=name, quantize=True)
+            self.cursor.execute(
+                'insert into {0} select datetime, grid_number, map, lake, {1} from {0}_real'.format(
+                    name, ', '.join('cast(round({} * {}) as integer)'.format(attribute, get_codec(attribute).factor)
+                                    for attribute in GRID_DATA_ATTRIBUTES)))
+            self.cursor.execute('drop table {}_real'.format(name))
+            self.connection.commit()
+
+        # Reclaim space from REAL tables
+        if len(names) > 0:
+            self.cursor.execute('vacuum')
+
+        return len(names)
+
+    def _is_quantized_grid_data_table(self, name):
+        """Check if a grid data table stores quantized INTEGER attributes."""
+        if name not in self._quantized_tables:
+            self.cursor.execute('pragma table_info({})'.format(name))
+            types = {column[1]: column[2].lower() for column in self.cursor.fetchall()}
+            self._quantized_tables[name] = types.get(GRID_DATA_ATTRIBUTES[0]) == 'integer'
+
+        return self._quantized_tables[name]
+
+    def migrate_grid_data_tables(self):
+        """Rewrite untyped grid data tables into the typed (datetime, grid_number) keyed schema."""
+        # Get grid data tables
+        self.cursor.execute("select name from sqlite_master where type='table' and name like '%\\_grid_data' "
+                            "escape '\\'")
+        names = [name for name, in self.cursor.fetchall()]
+
+        # Loop through untyped tables
+        migrated = False
+        for name in names:
+            if self._is_typed_grid_data_table(name=name):
+                continue
+            print('Migrating {} to typed schema...'.format(name))
+
+            # Copy rows into typed table
+            self.cursor.execute('alter table {0} rename to {0}_untyped'.format(name))
+            self._create_typed_grid_data_table(name=name)
+            self.cursor.execute(
+                'insert or replace into {0} select '
+                "cast(strftime('%s', datetime) as integer) / 3600, cast(grid_number as integer), map, lake, {1} "
+                'from {0}_untyped where datetime is not null and grid_number is not null'.format(
+                    name, ', '.join('cast(nullif({0}, \'\') as real)'.format(attribute)
+                                    for attribute in GRID_DATA_ATTRIBUTES)))
+            self.cursor.execute('drop table {}_untyped'.format(name))
+            self.connection.commit()
+            migrated = True
+
+        # Reclaim space from untyped tables
+        if migrated:
+            self.cursor.execute('vacuum')
+
+    def _is_typed_grid_data_table(self, name):
+        """Check if a grid data table has the typed (datetime, grid_number) primary key."""
+        self.cursor.execute('pragma table_info({})'.format(name))
+
+        return {column[1]: column[5] for column in self.cursor.fetchall()}.get('datetime', 0) > 0
 
     def create_map_file_tables(self):
-        """Create a table for each map file."""
+        """Create a table for each map file (read from local copies where available, see NOAAMapFile)."""
         # Loop through map files
         for filename in MAP_FILES:
             self._create_map_file_table(filename=filename)
 
+        # Map surf spots to the new grid points
+        self._create_spot_grid_points_table()
+
     def _create_map_file_table(self, filename):
         """Create a table for a map file."""
+        from surfcast.data.noaa_map_file import NOAAMapFile
+        from surfcast.data.spatial_index import get_spatial_index
+
         # Create map table
         self.cursor.execute(
             'create table if not exists {} (sequence_number, fortran_column, '
@@ -184,6 +672,9 @@ class SurfcastDB(object):
         print('Pushing map data to SQL table...\n')
         map_file.map_data.to_sql(name=filename.split('.')[0], con=self.connection, if_exists='replace', index=False)
 
+        # Rebuild spatial index
+        get_spatial_index(map_name=filename, connection=self.connection, rebuild=True)
+
     def _create_surf_spot_table(self):
         """Create a table for a map file."""
         # Create map table
@@ -200,37 +691,97 @@ class SurfcastDB(object):
             print('Pushing surf spots to SQL table...\n')
             data.to_sql(name='surf_spots', con=self.connection, if_exists='replace', index=False)
 
-    def _df_to_table(self, df, db_type):
-        """Insert DataFrame into SQLite table."""
-        # Loop through DataFrame rows
-        for idx in df.index:
-            self._df_row_to_table(df_row=df.iloc[idx], db_type=db_type)
-
-    def _df_row_to_table(self, df_row, db_type):
-        """Insert DataFrame row into SQLite table."""
-        # Select all rows from table
-        self.cursor.execute('SELECT * FROM {}_files'.format(db_type).format(db_type))
-        entry = self.cursor.fetchone()
-
-        if entry is None:
-            # If the table is empty
-            self._df_row_to_table_insert(df_row=df_row, db_type=db_type)
-        else:
-            # Select rows with specified filename
-            self.cursor.execute('select * from {}_files where filename=?'.format(db_type), (df_row['filename'],))
-            entry = self.cursor.fetchone()
-
-            if entry is None:
-                # If file does not exist
-                self._df_row_to_table_insert(df_row=df_row, db_type=db_type)
-            else:
-                pass
-
-    def _df_row_to_table_insert(self, df_row, db_type):
-        """Inset row to table."""
-        values = (df_row['filename'], df_row['extension'], df_row['filetype'], df_row['lake'],
-                  str(df_row['file_datetime']), str(df_row['current_datetime']), df_row['forecast'], df_row['url'])
+        # Map surf spots to grid points
+        self._create_spot_grid_points_table()
+
+    def _create_spot_grid_points_table(self):
+        """Create a table mapping each surf spot to the nearest grid points of its lake's map."""
+        from surfcast.data.spatial_index import get_spatial_index, get_lake_map_name
+
+        # Create spot grid points table
+        self.cursor.execute('create table if not exists spot_grid_points (spot text, lake text, map text, '
+                            'neighbor integer, sequence_number integer, distance real, '
+                            'primary key (spot, neighbor))')
+        self.connection.commit()
+        if not self._table_exists(name='surf_spots'):
+            return
+
+        # Get surf spots
+        spots = pd.read_sql_query('select name, lake, lat, lon from surf_spots', self.connection)
+
+        # Loop through lakes
+        values = list()
+        for lake, lake_spots in spots.groupby(spots['lake'].str.strip().str.lower()):
+
+            # Get lake spatial index
+            map_name = get_lake_map_name(lake=lake)
+            if map_name is None or not self._table_exists(name=map_name.split('.')[0]):
+                continue
+            spatial_index = get_spatial_index(map_name=map_name, connection=self.connection)
+
+            # Get nearest grid points
+            distances, sequence_numbers = spatial_index.nearest(lat=lake_spots['lat'].values,
+                                                                lon=lake_spots['lon'].values, k=SPOT_GRID_POINTS)
+            values.extend((spot, lake, map_name, neighbor, int(sequence_number), float(distance))
+                          for spot, spot_distances, spot_sequence_numbers
+                          in zip(lake_spots['name'], distances, sequence_numbers)
+                          for neighbor, (distance, sequence_number)
+                          in enumerate(zip(spot_distances, spot_sequence_numbers)))
+
+        # Replace spot grid points
+        print('Pushing spot grid points to SQL table...\n')
+        with self.connection:
+            self.cursor.execute('delete from spot_grid_points')
+            self.cursor.executemany('insert into spot_grid_points values (?, ?, ?, ?, ?, ?)', values)
+
+    def _create_spot_scores_table(self):
+        """Create a table of surf scores keyed by (db_type, spot, datetime).
+
+        datetime is stored as integer hours since the Unix epoch (GMT), as in the grid data tables.
+        """
         self.cursor.execute(
-            'insert or ignore into {}_files values '
-            '(null, null, ?, ?, ?, ?, ?, ?, ?, ?, null, null, null, null)'.format(db_type), values)
+            'create table if not exists spot_scores (spot text not null, db_type text not null, '
+            'datetime integer not null, lake text, score real, onshore_wind real, {}, '
+            'primary key (db_type, spot, datetime)) without rowid'.format(
+                ', '.join('{} real'.format(variable) for variable in SCORE_VARIABLES)))
+        self.cursor.execute('create index if not exists spot_scores_datetime on spot_scores (db_type, datetime)')
         self.connection.commit()
+
+    def _table_exists(self, name):
+        """Check if a table exists."""
+        self.cursor.execute("select 1 from sqlite_master where type='table' and name=?", (name,))
+
+        return self.cursor.fetchone() is not None
+
+    def _df_to_table(self, df, db_type):
+        """Insert new DataFrame rows into SQLite table in a single transaction."""
+        # Row values
+        values = [(filename, extension, filetype, lake, str(file_datetime), str(current_datetime), forecast, url)
+                  for filename, extension, filetype, lake, file_datetime, current_datetime, forecast, url
+                  in zip(df['filename'], df['extension'], df['filetype'], df['lake'], df['file_datetime'],
+                         df['current_datetime'], df['forecast'], df['url'])]
+
+        # Insert rows, ignoring filenames already in the table
+        with self.connection:
+            self.cursor.executemany(
+                'insert or ignore into {}_files values '
+                '(null, null, ?, ?, ?, ?, ?, ?, ?, ?, null, null, null, null)'.format(db_type), values)
+
+
+def datetime_to_epoch_hours(values):
+    """Convert datetime64 values to integer hours since the Unix epoch."""
+    return np.asarray(values).astype('datetime64[h]').astype(np.int64)
+
+
+def epoch_hours_to_datetime(values):
+    """Convert integer hours since the Unix epoch to datetime64 values."""
+    return np.asarray(values, dtype=np.int64).astype('datetime64[h]').astype('datetime64[ns]')
+
+
+def _to_utc_datetime64(value):
+    """Convert a datetime-like value to a naive GMT datetime64."""
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert('UTC').tz_localize(None)
+
+    return value.to_datetime64()
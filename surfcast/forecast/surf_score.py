@@ -0,0 +1,155 @@
+"""
+surf_score.py
+-------------
+This module provide a class and methods for scoring surf quality at every surf spot and forecast hour.
+By: Sebastian D. Goodfellow, Ph.D., 2018
+"""
+
+# 3rd party imports
+import os
+import numpy as np
+import pandas as pd
+
+# Local imports
+from surfcast import DATA_DIR
+
+# Set surf spot config file (name, shore_angle, swell_window_start, swell_window_end in degrees clockwise from north)
+SPOT_CONFIG_PATH = os.path.join(DATA_DIR, 'surf_spot_config.csv')
+
+# Wave height (m) below which there is no surf and above which height scores fully
+MIN_WAVE_HEIGHT = 0.3
+IDEAL_WAVE_HEIGHT = 1.5
+
+# Wave period (s) below which period scores nothing and above which it scores fully
+MIN_WAVE_PERIOD = 3.
+IDEAL_WAVE_PERIOD = 8.
+
+# Onshore and cross-shore wind speeds (m/s) that blow the surf out
+ONSHORE_WIND_LIMIT = 10.
+CROSS_SHORE_WIND_LIMIT = 15.
+
+# Ice concentration above which a spot is not surfable
+ICE_LIMIT = 0.5
+
+# Score inputs (the ice concentration is optional)
+SCORE_VARIABLES = ['wave_height', 'wave_period', 'wave_direction', 'wind_speed', 'wind_direction']
+
+
+class SurfScore(object):
+
+    """
+    Scores surf quality from 0 (flat or blown out) to 10 for every surf spot and forecast hour in one broadcast
+    computation.
+
+    Each spot is configured by the direction its shore faces and its swell window, the directions (clockwise from
+    swell_window_start to swell_window_end) from which waves can reach it. Directions are in degrees clockwise from
+    north and follow NOAA: wave_direction is the direction waves travel toward (0 = toward north) and is turned
+    around to the direction they come from, wind_direction is the direction the wind comes from (0 = from north).
+
+    score = 10 * height * direction * (0.5 + 0.5 * period) * (0.5 + 0.5 * wind)
+
+    height    - wave height between MIN_WAVE_HEIGHT and IDEAL_WAVE_HEIGHT scaled to [0, 1]
+    direction - cosine of the angle between the waves and the shore angle, 0 outside the swell window
+    period    - wave period between MIN_WAVE_PERIOD and IDEAL_WAVE_PERIOD scaled to [0, 1]
+    wind      - 1 less the onshore and cross-shore wind components as fractions of their limits, clipped to [0, 1]
+                (offshore wind is not penalized)
+    """
+
+    def __init__(self, config=None):
+
+        # Set parameters
+        self.config = config if config is not None else load_spot_config()
+
+        # Set attributes
+        self.spots = list(self.config.index)
+        self._shore_angle = self.config['shore_angle'].values.astype(np.float64)[:, np.newaxis]
+        self._window_start = self.config['swell_window_start'].values.astype(np.float64)[:, np.newaxis]
+        self._window_width = np.mod(self.config['swell_window_end'].values - self.config['swell_window_start'].values,
+                                    360.).astype(np.float64)[:, np.newaxis]
+
+    def score(self, wave_height, wave_period, wave_direction, wind_speed, wind_direction, ice_concentration=None,
+              spots=None):
+        """Score [spot, hour] arrays of grid data, returning [spot, hour] arrays of scores and onshore wind speeds.
+
+        spots selects the config rows of the array rows (default: all configured spots, in config order). Cells with
+        missing wave data score NaN.
+        """
+        # Get spot config as [spot, 1] columns broadcast against the hours
+        if spots is None:
+            shore_angle, window_start, window_width = self._shore_angle, self._window_start, self._window_width
+        else:
+            index = self.config.index.get_indexer(spots)
+            shore_angle, window_start, window_width = (self._shore_angle[index], self._window_start[index],
+                                                       self._window_width[index])
+
+        # Wave height and period
+        height = np.clip((wave_height - MIN_WAVE_HEIGHT) / (IDEAL_WAVE_HEIGHT - MIN_WAVE_HEIGHT), 0., 1.)
+        period = np.clip((wave_period - MIN_WAVE_PERIOD) / (IDEAL_WAVE_PERIOD - MIN_WAVE_PERIOD), 0., 1.)
+
+        # Direction waves come from inside the swell window
+        wave_from = np.mod(wave_direction + 180., 360.)
+        in_window = np.mod(wave_from - window_start, 360.) <= window_width
+        direction = np.where(in_window, np.clip(np.cos(np.radians(wave_from - shore_angle)), 0., 1.), 0.)
+        direction[np.isnan(wave_direction)] = np.nan
+
+        # Onshore (positive) and cross-shore wind components
+        wind_angle = np.radians(wind_direction - shore_angle)
+        onshore_wind = wind_speed * np.cos(wind_angle)
+        cross_shore_wind = np.abs(wind_speed * np.sin(wind_angle))
+        wind = np.clip(1. - np.clip(onshore_wind, 0., None) / ONSHORE_WIND_LIMIT -
+                       cross_shore_wind / CROSS_SHORE_WIND_LIMIT, 0., 1.)
+
+        # Hours without wind data score on waves alone
+        wind = np.where(np.isnan(wind), 1., wind)
+
+        score = 10. * height * direction * (0.5 + 0.5 * period) * (0.5 + 0.5 * wind)
+        if ice_concentration is not None:
+            score = np.where(ice_concentration > ICE_LIMIT, 0., score)
+
+        return score, onshore_wind
+
+    def score_grid_data(self, grid_data, spot_grid_numbers):
+        """Score long format grid data (datetime, grid_number, attributes) of one lake.
+
+        spot_grid_numbers maps surf spot names to their grid numbers. Spots without a config are skipped. Returns a
+        long format DataFrame with one row per (spot, datetime) holding the score, onshore wind and score inputs.
+        """
+        # Get configured spots
+        spots = [spot for spot in spot_grid_numbers if spot.strip() in self.config.index]
+        if len(spots) == 0 or grid_data.shape[0] == 0:
+            return pd.DataFrame(columns=['spot', 'datetime', 'score', 'onshore_wind'] + SCORE_VARIABLES)
+
+        # Get spot rows as [grid point, hour] positions
+        grid_numbers = np.unique([spot_grid_numbers[spot] for spot in spots])
+        grid_data = grid_data[grid_data['grid_number'].isin(grid_numbers)]
+        datetimes = np.unique(grid_data['datetime'].values)
+        rows = np.searchsorted(grid_numbers, grid_data['grid_number'].values)
+        columns = np.searchsorted(datetimes, grid_data['datetime'].values)
+        spot_rows = np.searchsorted(grid_numbers, [spot_grid_numbers[spot] for spot in spots])
+
+        # Gather each variable into a [spot, hour] array
+        values = dict()
+        for variable in SCORE_VARIABLES + ['ice_concentration']:
+            array = np.full((len(grid_numbers), len(datetimes)), np.nan)
+            if variable in grid_data.columns:
+                array[rows, columns] = grid_data[variable].values
+            values[variable] = array[spot_rows]
+
+        # Score all spots and hours at once
+        score, onshore_wind = self.score(spots=[spot.strip() for spot in spots], **values)
+
+        # Convert to long format
+        scores = pd.DataFrame({'spot': np.repeat(spots, len(datetimes)), 'datetime': np.tile(datetimes, len(spots)),
+                               'score': score.ravel(), 'onshore_wind': onshore_wind.ravel()})
+        for variable in SCORE_VARIABLES:
+            scores[variable] = values[variable].ravel()
+
+        return scores[scores['score'].notnull()].reset_index(drop=True)
+
+
+def load_spot_config(path=SPOT_CONFIG_PATH):
+    """Load the surf spot config indexed by surf spot name."""
+    config = pd.read_csv(path)
+    config['name'] = config['name'].str.strip()
+
+    return config.set_index('name')
@@ -0,0 +1,52 @@
+# 3rd party imports
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local imports
+from surfcast.data import noaa_cache, noaa_map_file, spatial_index
+from surfcast.data.surfcast_db import SurfcastDB
+
+
+@pytest.fixture(autouse=True)
+def data_dirs(tmp_path, monkeypatch):
+    """Keep spatial indexes, parsed maps and raw files written by a test out of the working tree."""
+    monkeypatch.setattr(spatial_index, 'SPATIAL_INDEX_DIR', str(tmp_path / 'spatial_index'))
+    monkeypatch.setattr(noaa_cache, 'CACHE_DIR', str(tmp_path / 'raw_cache'))
+    monkeypatch.setattr(noaa_map_file, 'MAP_CACHE_DIR', str(tmp_path / 'map_cache'))
+
+
+class LakePost(object):
+
+    """Minimal NOAALakePost holding grid data for a few grid points and hours."""
+
+    def __init__(self, attributes, lake='huron', datetime='2020-02-17 00:00:00', hours=3, grid_numbers=(1, 2, 3),
+                 seed=0):
+        self.lake = lake
+        self.datetime = datetime
+        self.year = datetime.split('-')[0]
+        self.map_name = 'huron2km.map'
+        self.filenames = list()
+        self.grid_count = len(grid_numbers)
+        self.hour_count = hours
+        self.row_count = hours * len(grid_numbers)
+        random_state = np.random.RandomState(seed)
+        self.grid_data = pd.DataFrame({
+            'datetime': np.repeat(pd.date_range(datetime, periods=hours, freq='60min').values, len(grid_numbers)),
+            'grid_number': np.tile(np.asarray(grid_numbers, dtype=np.int64), hours)})
+        for attribute in attributes:
+            self.grid_data[attribute] = np.round(random_state.uniform(0, 4, self.row_count), 3).astype(np.float32)
+        self.grid_data['map'] = self.map_name
+        self.grid_data['lake'] = self.lake
+
+
+@pytest.fixture
+def surfcast_db(tmp_path):
+    """SurfcastDB connected to an existing, empty database (no map files or surf spots are loaded)."""
+    path = tmp_path / 'surfcast_db.sqlite3'
+    path.touch()
+    surfcast_db = SurfcastDB(path=str(path))
+    surfcast_db.cube_store.directory = str(tmp_path / 'cubes')
+    surfcast_db.frame_store.directory = str(tmp_path / 'frames')
+    yield surfcast_db
+    surfcast_db.connection.close()
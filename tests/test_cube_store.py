@@ -0,0 +1,46 @@
+# 3rd party imports
+import os
+import sqlite3
+import numpy as np
+import pytest
+
+# Local imports
+from conftest import LakePost
+from surfcast.data.cube_store import CubeStore
+
+
+@pytest.fixture
+def cube_store(tmp_path):
+    connection = sqlite3.connect(':memory:')
+    yield CubeStore(connection=connection, directory=str(tmp_path))
+    connection.close()
+
+
+def test_partial_posts_are_merged(cube_store):
+    waves = LakePost(attributes=['wave_height', 'wave_period'], seed=0)
+    ice = LakePost(attributes=['ice_concentration'], hours=4, grid_numbers=(2, 3, 4), seed=1)
+    cube_store.write(post=waves, db_type='fcast')
+    cube_store.write(post=ice, db_type='fcast')
+
+    cube = cube_store.read(lake='huron', datetime=waves.datetime, db_type='fcast')
+    assert cube.variables == ['wave_height', 'wave_period', 'ice_concentration']
+    assert cube.data.shape == (4, 4, 3)
+    grid_data = cube.to_frame().set_index(['datetime', 'grid_number'])
+    for post in [waves, ice]:
+        expected = post.grid_data.set_index(['datetime', 'grid_number'])
+        for attribute in [column for column in expected.columns if column not in ['map', 'lake']]:
+            np.testing.assert_array_equal(grid_data.loc[expected.index, attribute].values, expected[attribute].values)
+
+    # Cells of neither post are missing
+    assert np.isnan(cube.hour('2020-02-17 03:00:00')[0]).all()
+
+
+def test_path_is_keyed_by_post(cube_store):
+    first = LakePost(attributes=['wave_height'], seed=0)
+    later = LakePost(attributes=['wave_height'], datetime='2020-02-17 06:00:00', seed=1)
+    paths = [cube_store.write(post=post, db_type='fcast') for post in [first, later]]
+
+    assert paths == [os.path.join(cube_store.directory, 'fcast', 'huron', '{}.npy'.format(name))
+                     for name in ['2020021700', '2020021706']]
+    index = cube_store.list(lake='huron', db_type='fcast')
+    assert [os.path.join(cube_store.directory, path) for path in index['path']] == paths
@@ -0,0 +1,27 @@
+# 3rd party imports
+import sqlite3
+import pytest
+
+# Local imports
+from conftest import LakePost
+from surfcast.data.frame_store import FrameStore
+from surfcast.data.noaa_map_file import NOAAMapFile
+
+
+@pytest.fixture
+def frame_store(tmp_path):
+    connection = sqlite3.connect(':memory:')
+    NOAAMapFile(filename='huron2km.map').map_data.to_sql(name='huron2km', con=connection, index=False)
+    yield FrameStore(connection=connection, directory=str(tmp_path))
+    connection.close()
+
+
+def test_partial_posts_keep_each_others_frames(frame_store):
+    frame_store.render(post=LakePost(attributes=['wave_height'], seed=0), db_type='fcast')
+    frame_store.render(post=LakePost(attributes=['ice_concentration'], hours=4, seed=1), db_type='fcast')
+
+    assert len(frame_store.get_frames(lake='huron', variable='wave_height')) == 3
+    assert len(frame_store.get_frames(lake='huron', variable='ice_concentration')) == 4
+    index = frame_store.list(lake='huron', db_type='fcast')
+    assert index['variables'].tolist() == ['wave_height,ice_concentration']
+    assert index['hour_count'].tolist() == [4]
@@ -0,0 +1,89 @@
+# 3rd party imports
+import threading
+import numpy as np
+import pandas as pd
+
+# Local imports
+from surfcast.data.retry import RetryPolicy
+from surfcast.data.ingest_pipeline import IngestPipeline
+
+HEADER = '2020 048 00     /glcfs/bathy/huron2km.dat    {}    2\n'
+
+TEXTS = {'h202004800.0.wav': HEADER.format('WAVES') + '     1   0.512  270  3.1\n     2   0.634  265  3.3\n',
+         'h202004800.0.wnd': HEADER.format('WINDS') + '     1   5.12  270\n     2   6.34\n'}
+
+
+class Fetcher(object):
+
+    """Fetcher serving fixed texts, leaving out the files in missing."""
+
+    def __init__(self, missing=(), texts=None):
+        self.missing = missing
+        self.texts = texts if texts is not None else TEXTS
+        self.retrier = type('Retrier', (object,), {'policy': RetryPolicy()})()
+
+    def fetch_all(self, urls, deadline=None, labels=None):
+        return {url: self.texts[url] for url in urls if url not in self.missing}
+
+
+def _get_files(posts=1, extensions=('wav', 'wnd')):
+    date_times = pd.date_range('2020-02-17', periods=posts, freq='12h')
+    return pd.DataFrame({'url': '', 'filename': ['h{}.0.{}'.format(date_time.strftime('%Y%j%H'), extension)
+                                                 for date_time in date_times for extension in extensions],
+                         'filetype': [{'wav': 'WAVES', 'wnd': 'WINDS'}[extension] for extension in extensions] * posts,
+                         'lake': 'huron', 'file_datetime': np.repeat(date_times.astype(str), len(extensions))})
+
+
+def _run(pipeline, df=None):
+    """Run the pipeline in a thread, returning the exception it raised, or failing if it hangs."""
+    errors = list()
+
+    def run():
+        try:
+            pipeline.run(df=_get_files() if df is None else df)
+        except Exception as exception:
+            errors.append(exception)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    assert not thread.is_alive(), 'pipeline hung'
+
+    return errors[0] if len(errors) > 0 else None
+
+
+def test_parse_failure_fails_the_run(surfcast_db):
+    # The WINDS file is missing a wind direction
+    error = _run(pipeline=IngestPipeline(surfcast_db=surfcast_db, db_type='FCAST', parse_workers=1,
+                                         fetcher=Fetcher()))
+
+    assert isinstance(error, ValueError)
+
+
+def test_parse_stage_error_fails_the_run(surfcast_db):
+    error = _run(pipeline=IngestPipeline(surfcast_db=surfcast_db, db_type='FCAST', parse_workers=1,
+                                         fetcher=Fetcher(missing=['h202004800.0.wnd'])))
+
+    assert isinstance(error, KeyError)
+
+
+class FailingSurfcastDB(object):
+
+    """SurfcastDB whose writes fail."""
+
+    def _push_lake_post(self, post, db_type):
+        raise RuntimeError('disk full')
+
+
+def test_write_error_stops_every_stage():
+    # More posts than the queues between stages hold
+    df = _get_files(posts=6, extensions=['wav'])
+    fetcher = Fetcher(texts={filename: TEXTS['h202004800.0.wav'] for filename in df['filename']})
+    pipeline = IngestPipeline(surfcast_db=FailingSurfcastDB(), db_type='FCAST', parse_workers=1, queue_size=1,
+                              fetcher=fetcher)
+    error = _run(pipeline=pipeline, df=df)
+
+    assert isinstance(error, RuntimeError)
+    for thread in pipeline.threads:
+        thread.join(timeout=10)
+        assert not thread.is_alive()
@@ -0,0 +1,63 @@
+# 3rd party imports
+import pytest
+from dateutil import tz
+from datetime import datetime
+
+# Local imports
+from surfcast.data import noaa_db
+from surfcast.data.noaa_db import NOAADB
+
+
+class Fetcher(object):
+
+    """Fetcher on which only the filenames in posted exist, recording every probed filename."""
+
+    def __init__(self, posted):
+        self.posted = set(posted)
+        self.probed = list()
+
+    def exists_all(self, urls, deadline=None):
+        filenames = {url: url.split('/')[-1] for url in urls}
+        self.probed.extend(filenames.values())
+
+        return {url: filename in self.posted for url, filename in filenames.items()}
+
+
+def _predict(monkeypatch, high_water_marks, posted, now):
+    fetcher = Fetcher(posted=posted)
+    monkeypatch.setattr(noaa_db, 'get_fetcher', lambda: fetcher)
+    noaa = NOAADB(process=False, high_water_marks={'NCAST': high_water_marks}, predict=True)
+    noaa.current_datetime_GMT = now.replace(tzinfo=tz.gettz('GMT'))
+
+    return noaa._predict_filenames(db_type='NCAST'), fetcher.probed
+
+
+def test_site_number_comes_from_the_latest_filename(monkeypatch):
+    filenames, probed = _predict(monkeypatch=monkeypatch, high_water_marks={('h', 'wav'): 'h202004800.1.wav'},
+                                 posted=['h202004806.1.wav'], now=datetime(2020, 2, 17, 8))
+
+    assert filenames == ['h202004806.1.wav']
+    assert probed == ['h202004806.1.wav', 'h202004812.1.wav']
+
+
+def test_stale_pair_is_probed_at_the_next_post(monkeypatch):
+    high_water_marks = {('h', 'wav'): 'h202004800.0.wav', ('h', 'ice'): 'h202004500.0.ice'}
+    filenames, probed = _predict(monkeypatch=monkeypatch, high_water_marks=high_water_marks,
+                                 posted=['h202004806.0.wav'], now=datetime(2020, 2, 17, 8))
+
+    assert filenames == ['h202004806.0.wav']
+    assert 'h202004806.0.ice' in probed
+
+
+def test_stale_pair_posting_again_pulls_the_listing(monkeypatch):
+    high_water_marks = {('h', 'wav'): 'h202004800.0.wav', ('h', 'ice'): 'h202004500.0.ice'}
+    filenames, _ = _predict(monkeypatch=monkeypatch, high_water_marks=high_water_marks,
+                            posted=['h202004806.0.wav', 'h202004806.0.ice'], now=datetime(2020, 2, 17, 8))
+
+    assert filenames is None
+
+
+@pytest.mark.parametrize('filename, is_new', [('h202004806.0.wav', True), ('h202004800.0.wav', False),
+                                              ('h202004718.0.wav', False), ('e202004800.0.wav', True)])
+def test_is_new(filename, is_new):
+    assert NOAADB._is_new(filename=filename, high_water_marks={('h', 'wav'): 'h202004800.0.wav'}) is is_new
@@ -0,0 +1,79 @@
+# 3rd party imports
+import pytest
+import requests
+
+# Local imports
+from surfcast.data import noaa_fetcher
+from surfcast.data.noaa_cache import NOAACache, CacheMissError
+from surfcast.data.noaa_fetcher import NOAAFetcher, OFFLINE_ENV, get_fetcher, set_fetcher
+from surfcast.data.retry import RetryPolicy, RetryError
+
+
+@pytest.fixture
+def restore_fetcher(monkeypatch):
+    """Restore the shared fetcher and SURFCAST_OFFLINE after a test."""
+    monkeypatch.setattr(noaa_fetcher, '_FETCHER', None)
+    monkeypatch.delenv(OFFLINE_ENV, raising=False)
+
+
+def test_worker_fetcher_stays_offline(tmp_path, restore_fetcher):
+    set_fetcher(NOAAFetcher(cache=NOAACache(directory=str(tmp_path), offline=True)))
+
+    # A worker process starts without a shared fetcher and builds one from its environment
+    noaa_fetcher._FETCHER = None
+    fetcher = get_fetcher()
+
+    assert fetcher.cache.offline
+    assert fetcher.cache.directory == str(tmp_path)
+    with pytest.raises(CacheMissError):
+        fetcher.get_text('http://localhost/h202004800.0.wav')
+
+
+def test_online_fetcher_clears_offline(tmp_path, restore_fetcher):
+    set_fetcher(NOAAFetcher(cache=NOAACache(directory=str(tmp_path), offline=True)))
+    set_fetcher(NOAAFetcher())
+
+    # The default raw file cache is built in the test's data directories, not the working tree
+    noaa_fetcher._FETCHER = None
+    assert not get_fetcher().cache.offline
+    assert get_fetcher().cache.directory == str(tmp_path / 'raw_cache')
+
+
+def test_get_sizes(tmp_path):
+    cache = NOAACache(directory=str(tmp_path), offline=True)
+    cache.store(url='http://localhost/h202004800.0.wav', content=b'0' * 100, etag=None, last_modified=None)
+    fetcher = NOAAFetcher(cache=cache)
+
+    assert fetcher.get_sizes(urls=['http://localhost/h202004800.0.wav', 'http://localhost/h202004800.0.wnd']) == {
+        'http://localhost/h202004800.0.wav': 100, 'http://localhost/h202004800.0.wnd': 0}
+
+
+
+class BrokenStream(object):
+
+    """Response whose stream breaks before the first chunk."""
+
+    headers = dict()
+
+    def iter_content(self, chunk_size):
+        raise requests.exceptions.ChunkedEncodingError()
+
+
+def test_streams_are_retried_at_one_level(monkeypatch):
+    calls = list()
+
+    def request(url, **kwargs):
+        # Every third request is answered, and its stream breaks
+        calls.append(url)
+        if len(calls) % 3 != 0:
+            raise requests.ConnectionError()
+
+        return BrokenStream()
+
+    fetcher = NOAAFetcher(retry_policy=RetryPolicy(max_attempts=3, base_delay=0.))
+    monkeypatch.setattr(fetcher, '_request', request)
+    url = 'http://localhost/h202004800.0.wav'
+    with pytest.raises(RetryError):
+        fetcher.retry(url=url, func=lambda: list(fetcher.iter_lines(url=url, chunk_size=1024)))
+
+    assert len(calls) == 3
@@ -0,0 +1,64 @@
+# 3rd party imports
+import numpy as np
+import pytest
+
+# Local imports
+from surfcast.data import noaa_forecast_file
+from surfcast.data.noaa_cache import NOAACache
+from surfcast.data.noaa_fetcher import NOAAFetcher
+from surfcast.data.noaa_forecast_file import NOAAForecastFile, parse_hour_block
+
+HEADER = '2020 048 00     /glcfs/bathy/huron2km.dat    WAVES    {}'
+
+
+def test_parse_hour_block():
+    date_time, grid_number, values = parse_hour_block(
+        header=HEADER.format(2), rows=['     1   0.512  270  3.1', '     2   0.634  265  3.3'], attribute_count=3)
+
+    assert date_time == np.datetime64('2020-02-17T00:00:00', 'ns')
+    np.testing.assert_array_equal(grid_number, [1, 2])
+    np.testing.assert_allclose(values, [[0.512, 270, 3.1], [0.634, 265, 3.3]], rtol=1e-6)
+
+
+def test_parse_hour_block_rejects_mismatched_width():
+    # Four rows missing their wave period hold 12 values, a multiple of the 4 columns of 3 rows
+    rows = ['     1   0.512  270', '     2   0.634  265', '     3   0.701  260', '     4   0.755  255']
+
+    with pytest.raises(ValueError):
+        parse_hour_block(header=HEADER.format(4), rows=rows, attribute_count=3)
+
+
+def test_forecast_file_rejects_mismatched_width():
+    text = '\n'.join([HEADER.format(4), '     1   0.512  270', '     2   0.634  265', '     3   0.701  260',
+                      '     4   0.755  255', ''])
+
+    with pytest.raises(ValueError):
+        NOAAForecastFile(url='', filename='h202004800.0.wav', filetype='WAVES', lake='huron', text=text)
+
+
+def test_streamed_file_without_header_is_rejected(tmp_path, monkeypatch):
+    # An error page served in place of the file has no hour header
+    cache = NOAACache(directory=str(tmp_path), offline=True)
+    cache.store(url='http://localhost/h202004800.0.wav', content=b'<html>Service Unavailable</html>\n', etag=None,
+                last_modified=None)
+    monkeypatch.setattr(noaa_forecast_file, 'get_fetcher', lambda: NOAAFetcher(cache=cache))
+
+    with pytest.raises(ValueError, match='no hour header'):
+        NOAAForecastFile(url='http://localhost/', filename='h202004800.0.wav', filetype='WAVES', lake='huron',
+                         stream=True)
+
+
+@pytest.mark.parametrize('filename, filetype, rows, expected', [
+    ('h202004800.0.cur', 'SURFACE CURRENTS', ['     1  0.052  245', '     2  0.031  250', '     3  0.110  131'],
+     {'current_speed': [0.052, 0.031, 0.110], 'current_direction': [245, 250, 131]}),
+    ('h202004800.0.swt', 'SURFACE TEMPS', ['     1   2.31', '     2   2.45', '     3   1.98'],
+     {'surface_temperature': [2.31, 2.45, 1.98]})])
+def test_forecast_file_parses_noaa_layout(filename, filetype, rows, expected):
+    # Currents carry speed and direction, surface temperatures a single column
+    header = '2020 048 00     /glcfs/bathy/huron2km.dat    {}                   3'.format(filetype)
+    noaa_file = NOAAForecastFile(url='', filename=filename, filetype=filetype, lake='huron',
+                                 text='\n'.join([header] + rows + ['']))
+
+    assert list(noaa_file.grid_data.columns) == ['datetime', 'grid_number'] + list(expected)
+    for attribute, values in expected.items():
+        np.testing.assert_allclose(noaa_file.grid_data[attribute].values, values, rtol=1e-6)
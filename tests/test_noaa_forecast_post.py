@@ -0,0 +1,30 @@
+# 3rd party imports
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local imports
+from surfcast.data.noaa_forecast_post import NOAALakePost
+
+
+def _grid_data(attribute, grid_numbers, seed):
+    return pd.DataFrame({'datetime': np.repeat(pd.date_range('2020-02-17', periods=2, freq='60min').values,
+                                               len(grid_numbers)),
+                         'grid_number': np.tile(grid_numbers, 2),
+                         attribute: np.random.RandomState(seed).uniform(0, 4, 2 * len(grid_numbers))})
+
+
+@pytest.mark.parametrize('wind_grid_numbers', [[1, 2, 3], [3, 2, 1]], ids=['stacked', 'merged'])
+def test_merge_grid_data(wind_grid_numbers):
+    waves = _grid_data(attribute='wave_height', grid_numbers=[1, 2, 3], seed=0)
+    winds = _grid_data(attribute='wind_speed', grid_numbers=wind_grid_numbers, seed=1)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        grid_data = NOAALakePost._merge_grid_data(grid_data=[waves, winds])
+
+    assert list(grid_data.columns) == ['datetime', 'grid_number', 'wave_height', 'wind_speed']
+    expected = waves.merge(winds, on=['datetime', 'grid_number'])
+    pd.testing.assert_frame_equal(grid_data.sort_values(by=['datetime', 'grid_number']).reset_index(drop=True),
+                                  expected.sort_values(by=['datetime', 'grid_number']).reset_index(drop=True))
@@ -0,0 +1,69 @@
+# 3rd party imports
+import pytest
+import requests
+
+# Local imports
+from surfcast.data.retry import CircuitBreaker, CircuitOpenError, Retrier, RetryPolicy, RetryError, is_retryable
+
+
+def _http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+
+    return requests.HTTPError(response=response)
+
+
+@pytest.mark.parametrize('exception, retryable', [
+    (requests.ConnectionError(), True),
+    (requests.Timeout(), True),
+    (ConnectionResetError(), True),
+    (TimeoutError(), True),
+    (_http_error(status_code=503), True),
+    (_http_error(status_code=429), True),
+    (_http_error(status_code=404), False),
+    (ValueError('Hour block 1 has 7 values'), False),
+    (KeyError('wave_height'), False)])
+def test_is_retryable(exception, retryable):
+    assert is_retryable(exception=exception) is retryable
+
+
+def test_parse_errors_fail_fast():
+    calls = list()
+
+    def parse():
+        calls.append(1)
+        raise ValueError('Hour block 1 has 7 values')
+
+    retrier = Retrier(policy=RetryPolicy(max_attempts=3, base_delay=0.))
+    with pytest.raises(ValueError):
+        retrier.call(url='http://localhost/file.out1', func=parse)
+    assert len(calls) == 1
+    assert retrier.retry_counts['http://localhost/file.out1'] == 0
+
+
+def test_connection_errors_are_retried():
+    calls = list()
+
+    def download():
+        calls.append(1)
+        raise requests.ConnectionError()
+
+    retrier = Retrier(policy=RetryPolicy(max_attempts=3, base_delay=0.))
+    with pytest.raises(RetryError):
+        retrier.call(url='http://localhost/file.out1', func=download)
+    assert len(calls) == 3
+
+
+def test_circuit_breaker_lets_one_trial_request_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.)
+    breaker.record_failure()
+
+    # Only one caller gets through until the trial request fails or succeeds
+    breaker.before_call(host='localhost')
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(host='localhost')
+    breaker.record_failure()
+    breaker.before_call(host='localhost')
+    breaker.record_success()
+    breaker.before_call(host='localhost')
+    breaker.before_call(host='localhost')
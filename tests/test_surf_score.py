@@ -0,0 +1,27 @@
+# 3rd party imports
+import numpy as np
+import pandas as pd
+
+# Local imports
+from surfcast.forecast.surf_score import SurfScore
+
+
+def _score(wave_direction):
+    # South facing shore taking swell from the east through the west
+    config = pd.DataFrame({'shore_angle': [180], 'swell_window_start': [90], 'swell_window_end': [270]},
+                          index=pd.Index(['Spot'], name='name'))
+    score, _ = SurfScore(config=config).score(
+        wave_height=np.array([[1.5]]), wave_period=np.array([[8.]]), wave_direction=np.array([[wave_direction]]),
+        wind_speed=np.array([[0.]]), wind_direction=np.array([[0.]]))
+
+    return score[0, 0]
+
+
+def test_onshore_swell_uses_noaa_toward_direction():
+    # Swell travelling toward north (NOAA 0) comes from the south, straight onto the shore
+    assert _score(wave_direction=0.) == 10.
+
+
+def test_offshore_swell_scores_nothing():
+    # Swell travelling toward south (NOAA 180) comes from the north, away from the shore
+    assert _score(wave_direction=180.) == 0.
@@ -0,0 +1,88 @@
+# 3rd party imports
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# Local imports
+from conftest import LakePost
+from surfcast import DATA_DIR
+from surfcast.data.noaa_map_file import NOAAMapFile
+from surfcast.forecast.surf_score import SCORE_VARIABLES
+from surfcast.data.surfcast_db import SurfcastDB, datetime_to_epoch_hours
+
+
+def read_grid_data(surfcast_db, post, variables):
+    """Read back the grid data of a lake post."""
+    hours = datetime_to_epoch_hours(values=post.grid_data['datetime'].values)
+    return surfcast_db._get_lake_grid_data(lake=post.lake, db_type='fcast',
+                                           grid_numbers=tuple(sorted(set(post.grid_data['grid_number']))),
+                                           start_hour=int(hours.min()), end_hour=int(hours.max()),
+                                           variables=tuple(variables))
+
+
+def test_partial_posts_keep_each_others_columns(surfcast_db):
+    waves = LakePost(attributes=['wave_height', 'wave_period'], seed=0)
+    ice = LakePost(attributes=['ice_concentration'], seed=1)
+    surfcast_db._push_grid_data(post=waves, db_type='fcast')
+    surfcast_db._push_grid_data(post=ice, db_type='fcast')
+
+    grid_data = read_grid_data(surfcast_db=surfcast_db, post=waves,
+                               variables=['wave_height', 'wave_period', 'ice_concentration'])
+    grid_data = grid_data.sort_values(by=['datetime', 'grid_number']).reset_index(drop=True)
+    for post, attribute in [(waves, 'wave_height'), (waves, 'wave_period'), (ice, 'ice_concentration')]:
+        np.testing.assert_allclose(grid_data[attribute].values, post.grid_data[attribute].values, atol=1e-6)
+
+
+def test_existing_database_gets_spot_grid_points_and_scores(tmp_path):
+    # Database created before spot_grid_points existed, with a map table and surf spots
+    path = str(tmp_path / 'surfcast_db.sqlite3')
+    connection = sqlite3.connect(path)
+    NOAAMapFile(filename='huron2km.map').map_data.to_sql(name='huron2km', con=connection, index=False)
+    pd.read_csv(os.path.join(DATA_DIR, 'surf_spots.csv')).to_sql(name='surf_spots', con=connection, index=False)
+    connection.close()
+
+    surfcast_db = SurfcastDB(path=path)
+    spot_points = pd.read_sql_query("select spot, sequence_number from spot_grid_points where neighbor=0 and "
+                                    "lake='huron'", surfcast_db.connection)
+    assert spot_points.shape[0] > 0
+
+    # Push a post covering the surf spots' grid points
+    post = LakePost(attributes=SCORE_VARIABLES, grid_numbers=sorted(set(spot_points['sequence_number'])))
+    surfcast_db._push_lake_post(post=post, db_type='fcast')
+    scores = pd.read_sql_query('select distinct spot from spot_scores', surfcast_db.connection)
+    assert 0 < scores.shape[0] and set(scores['spot']) <= set(spot_points['spot'])
+    surfcast_db.connection.close()
+
+
+def test_push_without_spot_grid_points_skips_scoring(surfcast_db):
+    surfcast_db.cursor.execute('drop table spot_grid_points')
+    surfcast_db._push_lake_post(post=LakePost(attributes=SCORE_VARIABLES), db_type='fcast')
+    assert surfcast_db.cursor.execute('select count(*) from spot_scores').fetchone()[0] == 0
+
+
+def test_newer_posts_overwrite_older_posts(surfcast_db, monkeypatch):
+    from surfcast.data import noaa_forecast_post
+
+    class ForecastPost(object):
+
+        """NOAAForecastPost stub with a 24 hour huron post seeded by its datetime."""
+
+        def __init__(self, df, datetime, db_type, stream=False):
+            date_time = str(pd.Timestamp(datetime).tz_localize(None))
+            self.lake_posts = {'huron': LakePost(attributes=['wave_height'], datetime=date_time, hours=24,
+                                                 seed=pd.Timestamp(date_time).hour)}
+
+    # Newer post listed first, as NOAADB sorts the files tables
+    monkeypatch.setattr(noaa_forecast_post, 'NOAAForecastPost', ForecastPost)
+    for filename, file_datetime in [('h202004812.0.wav', '2020-02-17 12:00:00+00:00'),
+                                    ('h202004800.0.wav', '2020-02-17 00:00:00+00:00')]:
+        surfcast_db.cursor.execute('insert into fcast_files (filename, lake, file_datetime) values (?, ?, ?)',
+                                   (filename, 'huron', file_datetime))
+    surfcast_db.connection.commit()
+    surfcast_db._update_grid_data_table(db_type='fcast')
+
+    newer = ForecastPost(df=None, datetime='2020-02-17 12:00:00+00:00', db_type='fcast').lake_posts['huron']
+    grid_data = read_grid_data(surfcast_db=surfcast_db, post=newer, variables=['wave_height'])
+    grid_data = grid_data.sort_values(by=['datetime', 'grid_number']).reset_index(drop=True)
+    np.testing.assert_allclose(grid_data['wave_height'].values, newer.grid_data['wave_height'].values, atol=1e-6)